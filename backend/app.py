@@ -4,6 +4,9 @@ import logging
 from config import get_config
 from routes import api
 from database import db_service
+from compression import init_response_compression
+from metrics import init_request_metrics
+from json_provider import BSONJSONProvider
 
 def create_app():
     """创建Flask应用"""
@@ -13,6 +16,8 @@ def create_app():
     # 创建应用
     app = Flask(__name__)
     app.config.from_object(config)
+    # 直接序列化 ObjectId/datetime 等 BSON 类型，安装 orjson 时使用 orjson
+    app.json = BSONJSONProvider(app)
     
     # 配置日志
     logging.basicConfig(
@@ -23,6 +28,12 @@ def create_app():
     # 允许跨域请求
     CORS(app)
     
+    # 请求耗时、并发数和响应大小，先于压缩注册以记录压缩后的大小
+    init_request_metrics(app)
+    
+    # 压缩较大的响应
+    init_response_compression(app)
+    
     # 注册API蓝图
     app.register_blueprint(api)
     
@@ -0,0 +1,99 @@
+"""
+异步（ASGI）服务入口
+
+    hypercorn asgi_app:app
+
+需要额外安装 quart 和 a2wsgi。列表、搜索、单条内容的增删改查和分类这些
+高频接口由 async_routes 在事件循环中处理，等待 MongoDB 时不占用线程，
+一个进程可以同时挂起数千个请求；其余接口（连接、批量、导入导出、管理等）
+交给同步的 Flask 应用，在线程池中运行。两边共享同一个 DatabaseService
+的令牌和缓存，对外的 /api 接口与同步模式完全一致。
+"""
+from a2wsgi import WSGIMiddleware
+from quart import Quart, g, request
+from werkzeug.exceptions import HTTPException
+
+from app import app as flask_app
+from async_database import async_db_service
+from async_routes import api
+from compression import apply_compressed, compress_body
+from config import get_config
+from database import db_service
+from json_provider import BSONJSONProvider
+from metrics import finish_request, start_request
+
+
+class AsgiDispatcher:
+    """按 Flask 的路由表匹配请求：端点在异步应用中有同名实现的由异步应用处理，
+    其余（包括 CORS 预检）交给 Flask"""
+
+    def __init__(self, async_app, wsgi_app, threads: int):
+        self.async_app = async_app
+        self.wsgi_app = WSGIMiddleware(wsgi_app, workers=threads)
+        self._adapter = wsgi_app.url_map.bind('localhost')
+        self._native = set(async_app.view_functions)
+
+    def _is_native(self, scope) -> bool:
+        if scope['method'] == 'OPTIONS':
+            return False
+        try:
+            endpoint, _ = self._adapter.match(scope['path'], method=scope['method'])
+        except HTTPException:
+            return False
+        return endpoint in self._native
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'http' and not self._is_native(scope):
+            await self.wsgi_app(scope, receive, send)
+        else:
+            # lifespan 事件由异步应用处理
+            await self.async_app(scope, receive, send)
+
+
+def create_asgi_app():
+    """创建异步应用"""
+    config = get_config()
+
+    async_app = Quart(__name__)
+    async_app.config.from_object(config)
+    async_app.json = BSONJSONProvider(async_app)
+    async_app.register_blueprint(api)
+
+    @async_app.before_request
+    async def start_request_metrics():
+        g.metrics_state = start_request(request.method, request.url_rule)
+
+    @async_app.after_request
+    async def finalize_response(response):
+        # 与同步模式下 Flask-Cors 的默认配置一致
+        response.headers.setdefault('Access-Control-Allow-Origin', '*')
+
+        if (config.RESPONSE_COMPRESSION and response.status_code == 200
+                and 'Content-Encoding' not in response.headers):
+            data = await response.get_data()
+            if len(data) >= config.RESPONSE_COMPRESSION_MIN_BYTES:
+                compressed = compress_body(data, request.accept_encodings,
+                                           config.RESPONSE_COMPRESSION_LEVEL)
+                if compressed is not None:
+                    apply_compressed(response, *compressed)
+
+        state = g.pop('metrics_state', None)
+        if state is not None:
+            finish_request(state, response.status_code, response.content_length)
+        return response
+
+    @async_app.teardown_request
+    async def abort_request_metrics(exc):
+        state = g.pop('metrics_state', None)
+        if state is not None:
+            finish_request(state, None, None)
+
+    @async_app.after_serving
+    async def close_clients():
+        await async_db_service.close()
+        db_service.close()
+
+    return AsgiDispatcher(async_app, flask_app, config.ASYNC_FALLBACK_THREADS)
+
+
+app = create_asgi_app()
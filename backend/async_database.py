@@ -0,0 +1,206 @@
+import asyncio
+import logging
+import time
+from contextlib import contextmanager
+from typing import Dict, List, Optional, Tuple
+
+from pymongo import AsyncMongoClient
+from pymongo.errors import ConfigurationError, ConnectionFailure
+
+from config import get_config
+from database import ACK_MODES, DatabaseService, db_service, _list_args, _list_key, _object_id, split_mongo_uri
+from liveness import ClientHealth
+from metrics import mongo_metrics
+from mongo_steps import Steps, run_async
+from token_store import MemoryTokenStore
+from write_buffer import QueuedId
+
+logger = logging.getLogger(__name__)
+
+
+class AsyncDatabaseService:
+    """DatabaseService 的异步版本，基于 PyMongo 的 AsyncMongoClient
+
+    与同一进程中的 DatabaseService 共享令牌存储、计数/查询/分类缓存和存储编码，
+    因此两边的令牌互通，任一边的写入都会使另一边的缓存失效。
+    文档的读写流程是 DatabaseService 的 *_steps 生成器，这里只用 run_async 执行；
+    这里只维护自己的 AsyncMongoClient（每个集群一个）。
+    只能在创建它的事件循环中使用。
+    """
+
+    def __init__(self, shared: DatabaseService):
+        config = get_config()
+        self.shared = shared
+        self.heartbeat_frequency_ms = config.MONGO_HEARTBEAT_FREQUENCY_MS
+        self.max_pool_size = config.MONGO_MAX_POOL_SIZE
+        self.max_clients = config.MONGO_MAX_CLIENTS
+        self.idle_timeout = config.MONGO_CLIENT_IDLE_TIMEOUT
+        # cluster_uri -> {'client', 'health', 'last_used'}
+        self.clients: Dict[str, Dict] = {}
+        # connection_key -> (db, collection, cluster_uri)
+        self.connections: Dict[str, Tuple] = {}
+        # SQLite/Redis 令牌存储的每次访问都是阻塞 I/O，放到线程中执行
+        self._store_blocks = not isinstance(shared.connection_tokens, MemoryTokenStore)
+
+    def _create_client(self, cluster_uri: str) -> Dict:
+        logger.info("Establishing new async MongoDB client")
+        health = ClientHealth(self.heartbeat_frequency_ms / 1000.0)
+        client = AsyncMongoClient(
+            cluster_uri,
+            heartbeatFrequencyMS=self.heartbeat_frequency_ms,
+            maxPoolSize=self.max_pool_size,
+            event_listeners=[health, mongo_metrics]
+        )
+        return {'client': client, 'health': health, 'last_used': time.monotonic()}
+
+    async def _evict_idle(self):
+        """关闭长时间未使用的客户端"""
+        now = time.monotonic()
+        for cluster_uri, entry in list(self.clients.items()):
+            if now - entry['last_used'] > self.idle_timeout:
+                del self.clients[cluster_uri]
+                for key, conn in list(self.connections.items()):
+                    if conn[2] == cluster_uri:
+                        del self.connections[key]
+                await entry['client'].close()
+
+    async def _connect(self, token: str, token_info: Dict) -> Tuple:
+        cluster_uri, database = split_mongo_uri(token_info['mongo_uri'])
+        if not database:
+            raise ConfigurationError("No default database name defined or provided.")
+        # 索引由 IndexManager 用同步驱动在后台建立；同步服务为令牌建立连接时会安排建立，
+        # 写后缓冲和后台处理也使用这条同步连接
+        await asyncio.to_thread(self.shared._materialize_token, token, token_info)
+        if cluster_uri not in self.clients:
+            await self._evict_idle()
+            if len(self.clients) >= self.max_clients:
+                raise RuntimeError("MongoDB客户端数量已达上限")
+            self.clients[cluster_uri] = self._create_client(cluster_uri)
+        db = self.clients[cluster_uri]['client'].get_database(database)
+        conn = (db, db.get_collection(token_info['collection_name']), cluster_uri)
+        self.connections[token_info['connection_key']] = conn
+        return conn
+
+    async def get_connection_by_token(self, token: str) -> Optional[Tuple]:
+        """根据令牌获取数据库连接，令牌可能由同步服务或其他 worker 创建"""
+        await self._call_store(self.shared._cleanup_expired_tokens)
+
+        token_info = await self._call_store(self.shared.connection_tokens.get, token)
+        if token_info is None:
+            self.shared._release_local_token(token)
+            return None
+        self.shared._remember_key(token, token_info)
+
+        conn = self.connections.get(token_info['connection_key'])
+        if conn is None:
+            conn = await self._connect(token, token_info)
+        entry = self.clients[conn[2]]
+        entry['last_used'] = time.monotonic()
+
+        # 与同步服务相同：只有缓存的健康状态可疑时才探测
+        health = entry['health']
+        if not health.needs_probe():
+            self.shared.liveness.record_avoided()
+            return conn[0], conn[1]
+
+        try:
+            await entry['client'].admin.command('ping')
+            self.shared.liveness.record_probe(True)
+            health.mark_ok()
+            return conn[0], conn[1]
+        except Exception:
+            self.shared.liveness.record_probe(False)
+            logger.warning(f"令牌 {token} 对应的连接已失效")
+            await self._call_store(self.shared.revoke_connection_token, token)
+            return None
+
+    async def _call_store(self, func, *args):
+        """调用共享的同步令牌存储，不是内存存储时在线程中执行，不阻塞事件循环"""
+        if self._store_blocks:
+            return await asyncio.to_thread(func, *args)
+        return func(*args)
+
+    async def _require_connection(self, token: str) -> Tuple:
+        connection = await self.get_connection_by_token(token)
+        if not connection:
+            raise ValueError("无效的连接令牌")
+        return connection
+
+    @contextmanager
+    def _track_failures(self, token: str):
+        """捕获真实命令的网络错误并标记连接为不健康"""
+        try:
+            yield
+        except ConnectionFailure as e:
+            self.shared.liveness.record_command_failure()
+            conn = self.connections.get(self.shared._collection_key(token))
+            if conn:
+                self.clients[conn[2]]['health'].mark_failed(e)
+            logger.warning(f"令牌 {token} 的数据库命令失败: {e}")
+            raise
+
+    async def close(self):
+        """关闭所有异步客户端"""
+        clients, self.clients = self.clients, {}
+        self.connections.clear()
+        for entry in clients.values():
+            await entry['client'].close()
+
+    async def _run(self, token: str, steps: Steps):
+        """用异步驱动执行 DatabaseService 的 *_steps 流程"""
+        with self._track_failures(token):
+            return await run_async(steps)
+
+    async def create_capture(self, token: str, data: Dict, ack: str = 'durable') -> str:
+        """创建新的捕获内容，写后缓冲与同步服务共用"""
+        if ack not in ACK_MODES:
+            raise ValueError("无效的 ack 参数")
+
+        db, collection = await self._require_connection(token)
+
+        self.shared._prepare_capture(data)
+
+        pending = self.shared._buffer_capture(token, data, ack)
+        if pending is not None:
+            return await asyncio.wrap_future(pending) if ack == 'durable' else QueuedId(data['_id'])
+
+        return await self._run(token, self.shared._create_steps(token, collection, data))
+
+    async def get_list_etag(self, token: str, page: int = 1, limit: int = 20, category: Optional[str] = None, search: Optional[str] = None, cursor: Optional[str] = None, count: str = 'exact', view: str = 'summary', fields: Optional[List[str]] = None, sort: Optional[str] = None, highlight: bool = False) -> str:
+        """列表的弱 ETag，与同步服务的算法相同"""
+        await self._require_connection(token)
+        return self.shared._list_etag(self.shared._collection_key(token),
+                                      _list_key(page, limit, category, search, cursor, count, view, fields, sort, highlight))
+
+    async def get_captures(self, token: str, page: int = 1, limit: int = 20, category: Optional[str] = None, search: Optional[str] = None, cursor: Optional[str] = None, count: str = 'exact', view: str = 'summary', fields: Optional[List[str]] = None, sort: Optional[str] = None, highlight: bool = False) -> Dict:
+        """获取捕获内容列表，参数和返回值与 DatabaseService.get_captures 相同"""
+        sort, highlight = _list_args(count, view, search, cursor, sort, highlight)
+        db, collection = await self._require_connection(token)
+        return await self._run(token, self.shared._list_steps(token, collection, page, limit, category, search, cursor,
+                                                              count, view, fields, sort, highlight))
+
+    async def get_capture(self, token: str, capture_id: str, unless_version: Optional[int] = None, include: Tuple[str, ...] = ()):
+        """获取单个捕获内容，版本未变化时返回 NOT_MODIFIED；外置的正文只读回 include 中的字段"""
+        db, collection = await self._require_connection(token)
+        obj_id = _object_id(capture_id)
+        return await self._run(token, self.shared._get_capture_steps(collection, obj_id, unless_version, include))
+
+    async def update_capture(self, token: str, capture_id: str, data: Dict) -> bool:
+        """更新捕获内容"""
+        db, collection = await self._require_connection(token)
+        obj_id = _object_id(capture_id)
+        return await self._run(token, self.shared._update_steps(token, collection, obj_id, data))
+
+    async def delete_capture(self, token: str, capture_id: str) -> bool:
+        """删除捕获内容"""
+        db, collection = await self._require_connection(token)
+        obj_id = _object_id(capture_id)
+        return await self._run(token, self.shared._delete_steps(token, collection, obj_id))
+
+    async def get_categories(self, token: str) -> Dict[str, int]:
+        """获取所有分类及每个分类的文档数"""
+        db, collection = await self._require_connection(token)
+        return await self._run(token, self.shared._categories_steps(token, collection))
+
+
+async_db_service = AsyncDatabaseService(db_service)
@@ -0,0 +1,234 @@
+"""
+异步模式下原生处理的 API 路由
+
+端点名与 routes.py 中的同名视图一致，asgi_app 据此决定请求由这里处理
+还是交给同步的 Flask 应用。响应格式与同步路由完全相同。
+"""
+import logging
+
+from quart import Blueprint, request, jsonify, make_response
+from bson.objectid import ObjectId
+
+from async_database import async_db_service
+from database import ACK_MODES, NOT_MODIFIED
+from routes import (
+    _get_token_from_header, _get_cursor_arg, _get_count_arg, _get_page_args, _get_projection_args,
+    _capture_etag, _create_result, _duplicate_result, _get_if_none_match_version, _get_include_arg, _get_search_args,
+    _validate_capture
+)
+from dedup import DuplicateCapture
+
+logger = logging.getLogger(__name__)
+
+api = Blueprint('api', __name__, url_prefix='/api')
+
+
+async def _not_modified(etag, weak=False):
+    response = await make_response('', 304)
+    response.set_etag(etag, weak=weak)
+    return response
+
+
+async def _list_response(token, params, extra=None):
+    etag = await async_db_service.get_list_etag(token, **params)
+    if request.if_none_match.contains_weak(etag):
+        return await _not_modified(etag, weak=True)
+
+    result = await async_db_service.get_captures(token, **params)
+    response = jsonify({
+        "status": "success",
+        "data": result,
+        **(extra or {})
+    })
+    response.set_etag(etag, weak=True)
+    return response
+
+
+@api.route('/capture', methods=['POST'])
+async def create_capture():
+    """创建新的捕获内容"""
+    try:
+        token = _get_token_from_header(request)
+        data = await request.get_json(silent=True)
+        if not data:
+            return jsonify({"status": "error", "message": "请求体中没有提供JSON数据"}), 400
+
+        error = _validate_capture(data)
+        if error:
+            return jsonify({"status": "error", "message": error}), 400
+
+        ack = request.args.get('ack', 'durable')
+        if ack not in ACK_MODES:
+            return jsonify({"status": "error", "message": f"ack 参数必须是 {'|'.join(ACK_MODES)} 之一"}), 400
+
+        capture_id = await async_db_service.create_capture(token, data, ack)
+
+        body, status = _create_result(capture_id)
+        return jsonify(body), status
+
+    except DuplicateCapture as e:
+        body, status = _duplicate_result(e)
+        return jsonify(body), status
+    except ValueError as e:
+        return jsonify({"status": "error", "message": str(e)}), 401
+    except Exception as e:
+        logger.exception("创建捕获内容失败")
+        return jsonify({"status": "error", "message": f"创建失败: {str(e)}"}), 500
+
+
+@api.route('/captures', methods=['GET'])
+async def get_captures():
+    """获取捕获内容列表"""
+    try:
+        token = _get_token_from_header(request)
+        category = request.args.get('category')
+        search = request.args.get('search')
+
+        try:
+            page, limit = _get_page_args(request)
+            cursor = _get_cursor_arg(request)
+            count = _get_count_arg(request)
+            view, fields = _get_projection_args(req=request)
+            sort, highlight = _get_search_args(search, cursor, request)
+        except ValueError as e:
+            return jsonify({"status": "error", "message": str(e)}), 400
+
+        params = dict(page=page, limit=limit, category=category, search=search,
+                      cursor=cursor, count=count, view=view, fields=fields,
+                      sort=sort, highlight=highlight)
+        return await _list_response(token, params)
+
+    except ValueError as e:
+        return jsonify({"status": "error", "message": str(e)}), 401
+    except Exception as e:
+        logger.exception("获取捕获列表失败")
+        return jsonify({"status": "error", "message": f"获取失败: {str(e)}"}), 500
+
+
+@api.route('/captures/<capture_id>', methods=['GET'])
+async def get_capture(capture_id):
+    """获取单个捕获内容"""
+    try:
+        token = _get_token_from_header(request)
+        include = _get_include_arg(request)
+        known_version = _get_if_none_match_version(capture_id, include, request)
+        capture = await async_db_service.get_capture(token, capture_id, unless_version=known_version, include=include)
+
+        if capture is NOT_MODIFIED:
+            return await _not_modified(_capture_etag(capture_id, known_version, include))
+        if not capture:
+            return jsonify({"status": "error", "message": "内容不存在"}), 404
+
+        response = jsonify({
+            "status": "success",
+            "data": capture
+        })
+        response.set_etag(_capture_etag(capture_id, capture.get('_version', 0), include))
+        response.last_modified = capture.get('updated_at') or ObjectId(capture_id).generation_time
+        return response
+
+    except ValueError as e:
+        return jsonify({"status": "error", "message": str(e)}), 400
+    except Exception as e:
+        logger.exception("获取捕获内容失败")
+        return jsonify({"status": "error", "message": f"获取失败: {str(e)}"}), 500
+
+
+@api.route('/captures/<capture_id>', methods=['PUT'])
+async def update_capture(capture_id):
+    """更新捕获内容"""
+    try:
+        token = _get_token_from_header(request)
+        data = await request.get_json(silent=True)
+        if not data:
+            return jsonify({"status": "error", "message": "请求体中没有提供JSON数据"}), 400
+
+        success = await async_db_service.update_capture(token, capture_id, data)
+
+        if not success:
+            return jsonify({"status": "error", "message": "内容不存在"}), 404
+
+        return jsonify({
+            "status": "success",
+            "message": "更新成功"
+        }), 200
+
+    except ValueError as e:
+        return jsonify({"status": "error", "message": str(e)}), 400
+    except Exception as e:
+        logger.exception("更新捕获内容失败")
+        return jsonify({"status": "error", "message": f"更新失败: {str(e)}"}), 500
+
+
+@api.route('/captures/<capture_id>', methods=['DELETE'])
+async def delete_capture(capture_id):
+    """删除捕获内容"""
+    try:
+        token = _get_token_from_header(request)
+        success = await async_db_service.delete_capture(token, capture_id)
+
+        if not success:
+            return jsonify({"status": "error", "message": "内容不存在"}), 404
+
+        return jsonify({
+            "status": "success",
+            "message": "删除成功"
+        }), 200
+
+    except ValueError as e:
+        return jsonify({"status": "error", "message": str(e)}), 400
+    except Exception as e:
+        logger.exception("删除捕获内容失败")
+        return jsonify({"status": "error", "message": f"删除失败: {str(e)}"}), 500
+
+
+@api.route('/categories', methods=['GET'])
+async def get_categories():
+    """获取所有分类"""
+    try:
+        token = _get_token_from_header(request)
+        counts = await async_db_service.get_categories(token)
+
+        return jsonify({
+            "status": "success",
+            "data": {
+                "categories": sorted(counts),
+                "counts": counts
+            }
+        }), 200
+
+    except ValueError as e:
+        return jsonify({"status": "error", "message": str(e)}), 401
+    except Exception as e:
+        logger.exception("获取分类列表失败")
+        return jsonify({"status": "error", "message": f"获取失败: {str(e)}"}), 500
+
+
+@api.route('/search', methods=['GET'])
+async def search_captures():
+    """搜索捕获内容"""
+    try:
+        token = _get_token_from_header(request)
+        query = request.args.get('q', '')
+        if not query.strip():
+            return jsonify({"status": "error", "message": "搜索关键词不能为空"}), 400
+
+        try:
+            page, limit = _get_page_args(request)
+            cursor = _get_cursor_arg(request)
+            count = _get_count_arg(request)
+            view, fields = _get_projection_args(req=request)
+            sort, highlight = _get_search_args(query, cursor, request)
+        except ValueError as e:
+            return jsonify({"status": "error", "message": str(e)}), 400
+
+        params = dict(page=page, limit=limit, search=query,
+                      cursor=cursor, count=count, view=view, fields=fields,
+                      sort=sort, highlight=highlight)
+        return await _list_response(token, params, {"query": query})
+
+    except ValueError as e:
+        return jsonify({"status": "error", "message": str(e)}), 401
+    except Exception as e:
+        logger.exception("搜索捕获内容失败")
+        return jsonify({"status": "error", "message": f"搜索失败: {str(e)}"}), 500
@@ -0,0 +1,154 @@
+#!/usr/bin/env python3
+"""
+同步（Flask）与异步（ASGI）服务模式的并发压测
+
+先分别启动两种服务，例如：
+    QUERY_CACHE_MAX_BYTES=0 gunicorn -w 1 --threads 16 -b 127.0.0.1:5000 app:app
+    QUERY_CACHE_MAX_BYTES=0 hypercorn -w 1 -b 127.0.0.1:8000 asgi_app:app
+再运行：
+    python benchmark_async.py --mongo-uri mongodb://.../db --sync http://127.0.0.1:5000 --async http://127.0.0.1:8000
+
+关闭查询缓存才能测到真实的 MongoDB 往返。压测客户端基于 asyncio 和 HTTP/1.1 长连接，
+每个并发一个连接，不会成为瓶颈。
+"""
+
+import argparse
+import asyncio
+import statistics
+import time
+from urllib.parse import urlsplit
+
+import requests
+
+SCENARIOS = {
+    'get': lambda capture_id: f"/api/captures/{capture_id}",
+    'list': lambda capture_id: "/api/captures?limit=20&count=none",
+}
+
+
+def setup(base_url, mongo_uri, collection_name):
+    """建立连接并写入一条用于读取的内容，返回 (令牌, capture_id)"""
+    response = requests.post(f"{base_url}/api/database/connect",
+                             json={"mongo_uri": mongo_uri, "collection_name": collection_name})
+    response.raise_for_status()
+    token = response.json()["data"]["token"]
+    response = requests.post(f"{base_url}/api/capture",
+                             json={"title": "benchmark", "text": "benchmark " * 50, "categories": ["benchmark"]},
+                             headers={"Authorization": f"Bearer {token}"})
+    response.raise_for_status()
+    return token, response.json()["data"]["id"]
+
+
+def teardown(base_url, token, capture_id):
+    headers = {"Authorization": f"Bearer {token}"}
+    requests.delete(f"{base_url}/api/captures/{capture_id}", headers=headers)
+    requests.post(f"{base_url}/api/database/disconnect", json={"token": token})
+
+
+async def _worker(host, port, request_bytes, count, latencies, errors, timeout=30):
+    reader = writer = None
+    try:
+        for _ in range(count):
+            if writer is None:
+                reader, writer = await asyncio.open_connection(host, port)
+            start = time.perf_counter()
+            writer.write(request_bytes)
+            await writer.drain()
+            head = await asyncio.wait_for(reader.readuntil(b"\r\n\r\n"), timeout)
+            lines = head.split(b"\r\n")
+            status = int(lines[0].split(b" ", 2)[1])
+            length = 0
+            keep_alive = lines[0].startswith(b"HTTP/1.1")
+            for line in lines[1:]:
+                name, _, value = line.partition(b":")
+                name = name.strip().lower()
+                if name == b"content-length":
+                    length = int(value)
+                elif name == b"connection" and value.strip().lower() == b"close":
+                    keep_alive = False
+            await asyncio.wait_for(reader.readexactly(length), timeout)
+            latencies.append(time.perf_counter() - start)
+            if status != 200:
+                errors.append(status)
+            if not keep_alive:
+                # 不支持长连接的服务器（如 Flask 开发服务器）每个请求重新连接
+                writer.close()
+                writer = None
+    finally:
+        if writer is not None:
+            writer.close()
+
+
+async def run_load(base_url, path, token, concurrency, total):
+    """以 concurrency 个长连接共发出 total 个请求"""
+    url = urlsplit(base_url)
+    request_bytes = (
+        f"GET {path} HTTP/1.1\r\nHost: {url.netloc}\r\n"
+        f"Authorization: Bearer {token}\r\n\r\n"
+    ).encode()
+    per_worker = max(total // concurrency, 1)
+    latencies, errors = [], []
+    start = time.perf_counter()
+    results = await asyncio.gather(*[
+        _worker(url.hostname, url.port or 80, request_bytes, per_worker, latencies, errors)
+        for _ in range(concurrency)
+    ], return_exceptions=True)
+    elapsed = time.perf_counter() - start
+    failed_connections = sum(1 for result in results if isinstance(result, Exception))
+
+    latencies.sort()
+
+    def percentile(p):
+        return latencies[min(int(len(latencies) * p), len(latencies) - 1)] * 1000 if latencies else None
+
+    return {
+        "requests": len(latencies),
+        "errors": len(errors),
+        "failed_connections": failed_connections,
+        "rps": round(len(latencies) / elapsed, 1),
+        "mean_ms": round(statistics.mean(latencies) * 1000, 2) if latencies else None,
+        "p50_ms": percentile(0.50),
+        "p95_ms": percentile(0.95),
+        "p99_ms": percentile(0.99),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="同步与异步服务模式的并发压测")
+    parser.add_argument("--mongo-uri", required=True)
+    parser.add_argument("--collection", default="benchmark_captures")
+    parser.add_argument("--sync", dest="sync_url", help="同步服务地址，如 http://127.0.0.1:5000")
+    parser.add_argument("--async", dest="async_url", help="异步服务地址，如 http://127.0.0.1:8000")
+    parser.add_argument("--scenario", choices=sorted(SCENARIOS), default="get")
+    parser.add_argument("--concurrency", default="10,100,500", help="逗号分隔的并发数")
+    parser.add_argument("--requests", type=int, default=5000, help="每轮请求总数")
+    args = parser.parse_args()
+
+    targets = [(name, url) for name, url in (("sync", args.sync_url), ("async", args.async_url)) if url]
+    if not targets:
+        parser.error("至少需要 --sync 或 --async 之一")
+
+    print("🚀 开始压测...")
+    print("=" * 50)
+    for name, base_url in targets:
+        token, capture_id = setup(base_url, args.mongo_uri, args.collection)
+        path = SCENARIOS[args.scenario](capture_id)
+        try:
+            # 预热连接池
+            asyncio.run(run_load(base_url, path, token, 4, 100))
+            for concurrency in (int(c) for c in args.concurrency.split(",")):
+                stats = asyncio.run(run_load(base_url, path, token, concurrency, args.requests))
+                if not stats["requests"]:
+                    print(f"{name:5} {args.scenario} c={concurrency:<5} 没有成功的请求")
+                    continue
+                print(f"{name:5} {args.scenario} c={concurrency:<5} "
+                      f"{stats['rps']:>8} req/s  p50 {stats['p50_ms']:.1f}ms  "
+                      f"p99 {stats['p99_ms']:.1f}ms  错误 {stats['errors']}  "
+                      f"连接失败 {stats['failed_connections']}")
+        finally:
+            teardown(base_url, token, capture_id)
+    print("✅ 压测完成！")
+
+
+if __name__ == "__main__":
+    main()
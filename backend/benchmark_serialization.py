@@ -0,0 +1,96 @@
+#!/usr/bin/env python3
+"""
+列表响应序列化耗时对比
+不需要 MongoDB，构造一页较大的捕获内容，比较：
+- legacy: 逐条把 _id 转为字符串后用 Flask 默认 JSON provider 序列化（排序键、转义非ASCII）
+- stdlib: BSONJSONProvider 在未安装 orjson 时的路径
+- orjson: BSONJSONProvider 在安装 orjson 时的路径
+"""
+
+import argparse
+import copy
+import random
+import string
+import time
+from datetime import datetime
+
+from bson.objectid import ObjectId
+from flask import Flask
+from flask.json.provider import DefaultJSONProvider
+
+import json_provider
+
+
+def make_page(size, html_bytes, text_bytes):
+    """构造一页与真实数据形状相同的文档（html/text 为混合中英文内容）"""
+    words = [''.join(random.choices(string.ascii_lowercase, k=random.randint(3, 9))) for _ in range(200)]
+    words += ['内容', '捕获', '网页', '测试']
+    captures = []
+    for i in range(size):
+        text = ' '.join(random.choices(words, k=text_bytes // 6))[:text_bytes]
+        html = ('<p>' + ' '.join(random.choices(words, k=html_bytes // 8)) + '</p>')[:html_bytes]
+        captures.append({
+            '_id': ObjectId(),
+            'title': f'捕获内容 {i}',
+            'url': f'https://example.com/articles/{i}',
+            'categories': ['tech', 'reading'],
+            'timestamp': 1700000000000 + i,
+            'tag': 'P',
+            'text': text,
+            'html': html,
+            'preview': text[:200],
+            '_version': 1,
+            'updated_at': datetime.utcnow(),
+        })
+    return {'status': 'success', 'data': {'captures': captures, 'total': size, 'page': 1, 'limit': size}}
+
+
+def legacy_serialize(provider, page):
+    for capture in page['data']['captures']:
+        capture['_id'] = str(capture['_id'])
+        capture['updated_at'] = capture['updated_at'].isoformat()
+    return provider.dumps(page)
+
+
+def measure(label, func, page, repeat):
+    """返回每页平均耗时（毫秒）和输出大小，每次在新的副本上运行"""
+    copies = [copy.deepcopy(page) for _ in range(repeat)]
+    start = time.perf_counter()
+    for item in copies:
+        output = func(item)
+    elapsed = (time.perf_counter() - start) / repeat * 1000
+    size = len(output.encode('utf-8') if isinstance(output, str) else output)
+    print(f"{label:8} {elapsed:8.2f} ms/页  {size / 1024:8.1f} KB")
+    return elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="列表响应序列化耗时对比")
+    parser.add_argument("--size", type=int, default=100, help="每页文档数")
+    parser.add_argument("--html-bytes", type=int, default=50 * 1024)
+    parser.add_argument("--text-bytes", type=int, default=10 * 1024)
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    app = Flask(__name__)
+    legacy = DefaultJSONProvider(app)
+    page = make_page(args.size, args.html_bytes, args.text_bytes)
+
+    print(f"🚀 每页 {args.size} 条，html {args.html_bytes} 字节，text {args.text_bytes} 字节")
+    print("=" * 50)
+    baseline = measure("legacy", lambda p: legacy_serialize(legacy, p), page, args.repeat)
+
+    orjson = json_provider.orjson
+    json_provider.orjson = None
+    measure("stdlib", json_provider.dumps_bytes, page, args.repeat)
+    json_provider.orjson = orjson
+
+    if orjson is None:
+        print("orjson   未安装，跳过")
+    else:
+        elapsed = measure("orjson", json_provider.dumps_bytes, page, args.repeat)
+        print(f"✅ orjson 比 legacy 快 {baseline / elapsed:.1f} 倍")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,371 @@
+#!/usr/bin/env python3
+"""
+DatabaseService 和 HTTP API 的性能基准
+
+在本机 MongoDB 上按不同集合大小和内容大小生成可复现的数据，分别测量
+connect、create、batch、list（首页、深页、游标深页）、search、categories、get
+的吞吐量和延迟分位数，结果写入 JSON 文件，便于在不同提交之间比较：
+
+    python benchmark_suite.py --mongo-uri mongodb://localhost:27017/capture_benchmark --output before.json
+    python benchmark_suite.py --mongo-uri ... --output after.json --compare before.json
+
+--target service 直接调用 DatabaseService，--target http 通过进程内的 Flask 测试客户端
+走完整的路由、序列化和压缩（不经过网络）。默认关闭查询/计数/分类缓存以测到数据库本身，
+--cache 保留缓存。已按相同参数生成的集合会被复用，--reseed 强制重新生成。
+"""
+
+import argparse
+import json
+import logging
+import os
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+
+PAYLOADS = {
+    # 名称: (text 字节数, html 字节数)
+    'small': (500, 2 * 1024),
+    'large': (5 * 1024, 50 * 1024),
+}
+CATEGORIES = ['tech', 'reading', 'news', 'design', 'science', 'travel', 'food', 'music', 'finance', 'health']
+SEARCH_TERM = 'benchmark'
+SEED_CHUNK = 5000
+
+
+def make_vocabulary(rng):
+    letters = 'abcdefghijklmnopqrstuvwxyz'
+    return [''.join(rng.choice(letters) for _ in range(rng.randint(3, 9))) for _ in range(5000)]
+
+
+def make_capture(rng, vocabulary, index, payload):
+    """生成一条可复现的捕获内容，约 1% 的内容包含 SEARCH_TERM"""
+    text_bytes, html_bytes = PAYLOADS[payload]
+    words = rng.choices(vocabulary, k=text_bytes // 6)
+    if index % 100 == 0:
+        words[0] = SEARCH_TERM
+    text = ' '.join(words)[:text_bytes]
+    return {
+        'title': f"capture {index} {' '.join(words[:4])}",
+        'url': f"https://example.com/{index}",
+        'text': text,
+        'html': ('<p>' + text + '</p>') * max(html_bytes // max(len(text) + 7, 1), 1),
+        'categories': rng.sample(CATEGORIES, rng.randint(1, 3)),
+        'timestamp': 1700000000000 + index,
+    }
+
+
+def summarize(latencies, elapsed, errors):
+    latencies = sorted(latencies)
+
+    def percentile(p):
+        return round(latencies[min(int(len(latencies) * p), len(latencies) - 1)] * 1000, 3)
+
+    return {
+        'n': len(latencies),
+        'errors': errors,
+        'ops_per_sec': round(len(latencies) / elapsed, 1) if elapsed else None,
+        'mean_ms': round(statistics.mean(latencies) * 1000, 3),
+        'p50_ms': percentile(0.50),
+        'p95_ms': percentile(0.95),
+        'p99_ms': percentile(0.99),
+        'max_ms': round(latencies[-1] * 1000, 3),
+    }
+
+
+def measure(operation, iterations, concurrency):
+    """以 concurrency 个线程共执行 iterations 次 operation(i)，返回统计结果"""
+    latencies, errors = [], []
+
+    def worker(indexes):
+        for i in indexes:
+            start = time.perf_counter()
+            try:
+                operation(i)
+            except Exception as e:
+                errors.append(str(e))
+            latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(worker, [range(w, iterations, concurrency) for w in range(concurrency)]))
+    result = summarize(latencies, time.perf_counter() - start, len(errors))
+    if errors:
+        result['first_error'] = errors[0]
+    return result
+
+
+class ServiceTarget:
+    """直接调用 DatabaseService"""
+
+    name = 'service'
+
+    def __init__(self, db_service, mongo_uri, collection_name):
+        self.db = db_service
+        self.mongo_uri = mongo_uri
+        self.collection_name = collection_name
+        self.token, _ = db_service.create_connection_token(mongo_uri, collection_name)
+
+    def connect(self):
+        token, _ = self.db.create_connection_token(self.mongo_uri, self.collection_name)
+        return token
+
+    def disconnect(self, token):
+        self.db.revoke_connection_token(token)
+
+    def create(self, doc):
+        self.db.create_capture(self.token, doc)
+
+    def batch(self, docs):
+        self.db.create_captures(self.token, docs)
+
+    def list(self, **params):
+        self.db.get_captures(self.token, **params)
+
+    def categories(self):
+        self.db.get_categories(self.token)
+
+    def get(self, capture_id):
+        if self.db.get_capture(self.token, capture_id) is None:
+            raise RuntimeError("内容不存在")
+
+    def close(self):
+        self.db.revoke_connection_token(self.token)
+
+
+class HttpTarget:
+    """通过 Flask 测试客户端调用 /api 接口"""
+
+    name = 'http'
+
+    def __init__(self, app, mongo_uri, collection_name):
+        self.client = app.test_client()
+        self.mongo_uri = mongo_uri
+        self.collection_name = collection_name
+        self.token = self.connect()
+        self.headers = {'Authorization': f'Bearer {self.token}', 'Accept-Encoding': 'gzip'}
+
+    def _check(self, response, expected=200):
+        if response.status_code != expected:
+            raise RuntimeError(f"HTTP {response.status_code}")
+        return response
+
+    def connect(self):
+        response = self._check(self.client.post('/api/database/connect', json={
+            'mongo_uri': self.mongo_uri, 'collection_name': self.collection_name}))
+        return response.get_json()['data']['token']
+
+    def disconnect(self, token):
+        self.client.post('/api/database/disconnect', json={'token': token})
+
+    def create(self, doc):
+        self._check(self.client.post('/api/capture', json=doc, headers=self.headers), 201)
+
+    def batch(self, docs):
+        self._check(self.client.post('/api/captures/batch', json=docs, headers=self.headers), 201)
+
+    def list(self, search=None, **params):
+        query = {key: value for key, value in params.items() if value is not None}
+        if search is not None:
+            self._check(self.client.get('/api/search', query_string={'q': search, **query}, headers=self.headers))
+        else:
+            self._check(self.client.get('/api/captures', query_string=query, headers=self.headers))
+
+    def categories(self):
+        self._check(self.client.get('/api/categories', headers=self.headers))
+
+    def get(self, capture_id):
+        self._check(self.client.get(f'/api/captures/{capture_id}', headers=self.headers))
+
+    def close(self):
+        self.disconnect(self.token)
+
+
+def seed(collection, size, payload, seed_value, reseed):
+    """生成数据集，集合中已有相同参数生成的数据时直接复用，返回耗时（秒）"""
+    meta = {'size': size, 'payload': payload, 'seed': seed_value}
+    marker = collection.database[f'{collection.name}_meta'].find_one({'_id': 'dataset'})
+    if not reseed and marker and marker.get('meta') == meta and collection.estimated_document_count() == size:
+        return None
+
+    collection.drop()
+    rng = random.Random(seed_value)
+    vocabulary = make_vocabulary(rng)
+    start = time.perf_counter()
+    for chunk_start in range(0, size, SEED_CHUNK):
+        docs = [make_capture(rng, vocabulary, i, payload)
+                for i in range(chunk_start, min(chunk_start + SEED_CHUNK, size))]
+        for doc in docs:
+            doc.update(preview=doc['text'][:200], _version=1, updated_at=datetime.now(timezone.utc))
+        collection.insert_many(docs, ordered=False)
+        print(f"  已生成 {min(chunk_start + SEED_CHUNK, size)}/{size}", end='\r', flush=True)
+    elapsed = time.perf_counter() - start
+    collection.database[f'{collection.name}_meta'].replace_one(
+        {'_id': 'dataset'}, {'_id': 'dataset', 'meta': meta}, upsert=True)
+    print()
+    return elapsed
+
+
+def wait_for_indexes(db_service, token, timeout=600):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if db_service.get_index_status(token).get('state') != 'building':
+            return
+        time.sleep(0.5)
+    print("⚠️ 等待索引建立超时，search 结果可能不准确")
+
+
+def run_dataset(args, db_service, app, size, payload):
+    from database import encode_cursor
+    collection_name = f"bench_{payload}_{size}"
+    mongo_uri = args.mongo_uri
+    service = ServiceTarget(db_service, mongo_uri, collection_name)
+    collection = db_service.get_connection_by_token(service.token)[1]
+
+    seconds = seed(collection, size, payload, args.seed, args.reseed)
+    results = []
+    if seconds is not None:
+        # 重新生成时删除了集合和索引，需要重新建立
+        conn = db_service.connections[db_service._collection_key(service.token)]
+        db_service.indexes.forget(db_service._index_key(conn))
+        results.append({'target': 'seed', 'size': size, 'payload': payload, 'operation': 'insert_many',
+                        'n': size, 'ops_per_sec': round(size / seconds, 1)})
+    wait_for_indexes(db_service, service.token)
+
+    rng = random.Random(args.seed)
+    vocabulary = make_vocabulary(rng)
+    sample_ids = [str(doc['_id']) for doc in collection.aggregate([{'$sample': {'size': 1000}}, {'$project': {'_id': 1}}])]
+    deep_page = max(size // args.limit // 2, 1)
+    deep_doc = next(collection.find({}, {'_id': 1}).sort('_id', -1).skip(deep_page * args.limit).limit(1), None)
+    deep_cursor = encode_cursor(deep_doc['_id']) if deep_doc else None
+
+    targets = [target for target in ('service', 'http') if args.target in (target, 'both')]
+    for target_name in targets:
+        target = service if target_name == 'service' else HttpTarget(app, mongo_uri, collection_name)
+        tokens = []
+
+        def new_doc(i):
+            doc = make_capture(random.Random(i), vocabulary, size + i, payload)
+            doc['bench_tmp'] = True
+            return doc
+
+        operations = {
+            'connect': lambda i: tokens.append(target.connect()),
+            'create': lambda i: target.create(new_doc(i)),
+            'batch_create': lambda i: target.batch([new_doc(i * args.batch_size + j) for j in range(args.batch_size)]),
+            'list_first': lambda i: target.list(page=1, limit=args.limit),
+            'list_deep': lambda i: target.list(page=deep_page, limit=args.limit),
+            'list_deep_cursor': lambda i: target.list(cursor=deep_cursor, limit=args.limit, count='none'),
+            'search': lambda i: target.list(search=SEARCH_TERM, limit=args.limit),
+            'categories': lambda i: target.categories(),
+            'get': lambda i: target.get(sample_ids[i % len(sample_ids)]),
+        }
+        for name in args.operations:
+            if name == 'list_deep_cursor' and deep_cursor is None:
+                continue
+            iterations = max(args.iterations // 10, 1) if name == 'batch_create' else args.iterations
+            stats = measure(operations[name], iterations, args.concurrency)
+            stats.update(target=target_name, size=size, payload=payload, operation=name)
+            results.append(stats)
+            print(f"  {target_name:7} {name:16} {stats['ops_per_sec']:>9} ops/s  "
+                  f"p50 {stats['p50_ms']:>8.2f}ms  p99 {stats['p99_ms']:>8.2f}ms  错误 {stats['errors']}")
+
+            if name == 'connect':
+                for token in tokens:
+                    target.disconnect(token)
+                tokens.clear()
+            if name in ('create', 'batch_create'):
+                # 写入的测试内容不计入数据集
+                collection.delete_many({'bench_tmp': True})
+
+        if target is not service:
+            target.close()
+    service.close()
+    return results
+
+
+def git_revision():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'],
+                                       stderr=subprocess.DEVNULL, text=True).strip()
+    except Exception:
+        return None
+
+
+def compare(results, baseline_path):
+    """按 (target, size, payload, operation) 与之前的结果比较 p50/p99"""
+    with open(baseline_path, encoding='utf-8') as f:
+        baseline = {(r['target'], r['size'], r['payload'], r['operation']): r for r in json.load(f)['results']}
+    print(f"\n📊 与 {baseline_path} 比较（正数表示变慢）")
+    for result in results:
+        before = baseline.get((result['target'], result['size'], result['payload'], result['operation']))
+        if not before or 'p50_ms' not in result or not before.get('p50_ms'):
+            continue
+        changes = [f"{key} {(result[key] - before[key]) / before[key] * 100:+.1f}%"
+                   for key in ('p50_ms', 'p99_ms') if before.get(key)]
+        print(f"  {result['target']:7} {result['size']:>8} {result['payload']:6} {result['operation']:16} {'  '.join(changes)}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="DatabaseService 和 HTTP API 的性能基准")
+    parser.add_argument("--mongo-uri", default="mongodb://localhost:27017/capture_benchmark")
+    parser.add_argument("--sizes", default="10000,100000,1000000", help="逗号分隔的集合大小")
+    parser.add_argument("--payloads", default="small", help=f"逗号分隔的内容大小：{','.join(PAYLOADS)}")
+    parser.add_argument("--target", choices=("service", "http", "both"), default="both")
+    parser.add_argument("--operations", default="connect,create,batch_create,list_first,list_deep,list_deep_cursor,search,categories,get")
+    parser.add_argument("--iterations", type=int, default=500, help="每项操作的次数（batch_create 为十分之一）")
+    parser.add_argument("--concurrency", type=int, default=1)
+    parser.add_argument("--batch-size", type=int, default=100)
+    parser.add_argument("--limit", type=int, default=20, help="列表每页条数")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--reseed", action="store_true", help="重新生成数据集")
+    parser.add_argument("--cache", action="store_true", help="保留查询/计数/分类缓存")
+    parser.add_argument("--output", default="benchmark_results.json")
+    parser.add_argument("--compare", help="与之前的结果文件比较")
+    args = parser.parse_args()
+    args.operations = [name.strip() for name in args.operations.split(',') if name.strip()]
+
+    if not args.cache:
+        # 配置在导入时读取，必须在导入应用之前设置
+        for name in ('QUERY_CACHE_MAX_BYTES', 'COUNT_CACHE_TTL', 'CATEGORY_CACHE_TTL'):
+            os.environ.setdefault(name, '0')
+    from app import app
+    from database import db_service
+    # 每次连接都会记录 INFO 日志
+    logging.getLogger().setLevel(logging.WARNING)
+
+    print("🚀 开始基准测试...")
+    print("=" * 50)
+    results = []
+    try:
+        for payload in args.payloads.split(','):
+            for size in (int(s) for s in args.sizes.split(',')):
+                print(f"📦 {size} 条，{payload} 内容")
+                results.extend(run_dataset(args, db_service, app, size, payload))
+    finally:
+        db_service.close()
+
+    report = {
+        'meta': {
+            'git_revision': git_revision(),
+            'timestamp': datetime.now(timezone.utc).isoformat(),
+            'python': sys.version.split()[0],
+            'platform': platform.platform(),
+            'args': {key: value for key, value in vars(args).items() if key not in ('output', 'compare')},
+        },
+        'results': results,
+    }
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f"✅ 结果已写入 {args.output}")
+
+    if args.compare:
+        compare(results, args.compare)
+
+
+if __name__ == "__main__":
+    main()
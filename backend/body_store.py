@@ -0,0 +1,131 @@
+"""
+超过阈值的 html/text 外置到 GridFS
+
+捕获 <body> 之类的大元素时文档会接近 MongoDB 16 MB 的上限，所有读到它的查询都会变慢。
+超过 LARGE_BODY_THRESHOLD 字节的字段不写入捕获文档，而是存入该集合的 GridFS 存储桶
+<集合名>_bodies，文档中只在 body_files 里记录文件 _id 和字节数：
+
+    body_files: {'html': {'file_id': ObjectId(...), 'length': 5242880}}
+
+读取单条内容时默认不取回外置的字段，通过 include 参数或 /api/captures/<id>/html 读取。
+"""
+import logging
+from typing import Dict, Iterable, List, Optional
+
+from gridfs.errors import NoFile
+
+from mongo_steps import Bucket, Steps, call
+
+logger = logging.getLogger(__name__)
+
+BODY_FILES = 'body_files'
+BODY_FIELDS = ('html', 'text')
+
+
+def bucket_name(collection) -> str:
+    return f"{collection.name}_bodies"
+
+
+def _bucket(collection) -> Bucket:
+    return Bucket(collection, bucket_name(collection))
+
+
+def field_of(key: str) -> str:
+    """'html' 或更新文档中的 'body_files.html' 对应的字段名"""
+    return key.rsplit('.', 1)[-1]
+
+
+def pending_bodies(container: Optional[Dict]) -> Dict[str, bytes]:
+    """split 之后尚未上传的正文（值为 UTF-8 字节）"""
+    if not container:
+        return {}
+    return {key: value for key, value in container.items() if isinstance(value, bytes)}
+
+
+def file_ids(body_files: Optional[Dict], fields: Iterable[str] = BODY_FIELDS) -> List:
+    """文档中已外置字段的 GridFS 文件 _id"""
+    if not isinstance(body_files, dict):
+        return []
+    return [body_files[field]['file_id'] for field in fields
+            if isinstance(body_files.get(field), dict) and 'file_id' in body_files[field]]
+
+
+class BodyStore:
+    """决定哪些字段外置；上传、读取和删除是同步和异步服务共用的 *_steps 流程"""
+
+    def __init__(self, threshold: int, fields: Iterable[str]):
+        self.threshold = threshold
+        self.fields = tuple(field for field in fields if field in BODY_FIELDS)
+
+    @property
+    def enabled(self) -> bool:
+        return self.threshold > 0 and bool(self.fields)
+
+    def split(self, doc: Dict):
+        """就地把超过阈值的字段移到 doc['body_files']，值为待上传的 UTF-8 字节"""
+        if not self.enabled:
+            return
+        pending = {}
+        for field in self.fields:
+            value = doc.get(field)
+            # UTF-8 每个字符 1-4 字节，字符数不到阈值的四分之一时不必编码
+            if not isinstance(value, str) or len(value) * 4 < self.threshold:
+                continue
+            raw = value.encode('utf-8')
+            if len(raw) >= self.threshold:
+                pending[field] = raw
+                del doc[field]
+        if pending:
+            doc[BODY_FILES] = pending
+
+
+def upload_steps(collection, container: Dict) -> Steps:
+    """上传 container 中待上传的正文，并就地替换为 {'file_id', 'length'}"""
+    pending = pending_bodies(container)
+    if not pending:
+        return
+    bucket = _bucket(collection)
+    uploaded = []
+    try:
+        for key, raw in pending.items():
+            file_id = yield call(bucket, 'upload_from_stream', field_of(key), raw, metadata={'field': field_of(key)})
+            uploaded.append(file_id)
+            container[key] = {'file_id': file_id, 'length': len(raw)}
+    except Exception:
+        yield from delete_steps(collection, uploaded)
+        raise
+
+
+def delete_steps(collection, ids: List) -> Steps:
+    """删除不再被引用的文件，文件已不存在时忽略"""
+    if not ids:
+        return
+    bucket = _bucket(collection)
+    for file_id in ids:
+        try:
+            yield call(bucket, 'delete', file_id)
+        except NoFile:
+            pass
+
+
+def open_steps(collection, ref: Dict) -> Steps:
+    """打开外置的正文，返回可 seek 的 GridOut；文件不存在时返回 None"""
+    try:
+        return (yield call(_bucket(collection), 'open_download_stream', ref['file_id']))
+    except NoFile:
+        logger.warning(f"外置的正文 {ref['file_id']} 不存在")
+        return None
+
+
+def load_steps(collection, capture: Dict, fields: Iterable[str]) -> Steps:
+    """把 fields 中已外置的字段读回 capture"""
+    body_files = capture.get(BODY_FILES) or {}
+    for field in fields:
+        if field in capture or not isinstance(body_files.get(field), dict):
+            continue
+        stream = yield from open_steps(collection, body_files[field])
+        if stream is not None:
+            try:
+                capture[field] = (yield call(stream, 'read')).decode('utf-8')
+            finally:
+                yield call(stream, 'close')
@@ -0,0 +1,210 @@
+import json
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Optional
+
+
+def make_query_key(query: Dict) -> str:
+    """将查询条件规范化为缓存键"""
+    return json.dumps(query, sort_keys=True, default=str, ensure_ascii=False)
+
+
+class CountCache:
+    """按集合和查询条件缓存文档总数的短期缓存
+
+    通过本服务写入时整集合失效，因此命中的计数与本进程内的写入保持一致。
+    与 QueryCache 一样，计数前取得集合的写入代数，写入后代数改变时不缓存计数，
+    避免与写入并发的计数把旧的总数放回缓存。
+    """
+
+    def __init__(self, ttl: int, max_entries_per_collection: int = 256):
+        self.ttl = ttl
+        self.max_entries_per_collection = max_entries_per_collection
+        self._lock = threading.Lock()
+        self._entries: Dict[str, Dict[str, tuple]] = {}
+        self._generations: Dict[str, int] = {}
+
+    @property
+    def enabled(self) -> bool:
+        return self.ttl > 0
+
+    def generation(self, collection_key: str) -> int:
+        return self._generations.get(collection_key, 0)
+
+    def get(self, collection_key: str, query_key: str) -> Optional[int]:
+        if not self.enabled:
+            return None
+        with self._lock:
+            entry = self._entries.get(collection_key, {}).get(query_key)
+            if entry is None:
+                return None
+            count, expires_at = entry
+            if time.monotonic() > expires_at:
+                del self._entries[collection_key][query_key]
+                return None
+            return count
+
+    def set(self, collection_key: str, generation: int, query_key: str, count: int):
+        if not self.enabled:
+            return
+        with self._lock:
+            if generation != self.generation(collection_key):
+                return
+            entries = self._entries.setdefault(collection_key, {})
+            if len(entries) >= self.max_entries_per_collection and query_key not in entries:
+                # 丢弃最早写入的条目
+                entries.pop(next(iter(entries)))
+            entries[query_key] = (count, time.monotonic() + self.ttl)
+
+    def invalidate(self, collection_key: str):
+        """集合被写入后调用"""
+        with self._lock:
+            self._generations[collection_key] = self.generation(collection_key) + 1
+            self._entries.pop(collection_key, None)
+
+
+class CategoryCache:
+    """按集合缓存分类及其文档数，带 TTL 和 LRU 淘汰
+
+    通过本服务的写入会增量更新已缓存的计数，TTL 用于纠正其他途径写入造成的偏差。
+    """
+
+    def __init__(self, ttl: int, max_collections: int = 256):
+        self.ttl = ttl
+        self.max_collections = max_collections
+        self._lock = threading.Lock()
+        self._entries: 'OrderedDict[str, tuple]' = OrderedDict()
+
+    def get(self, collection_key: str) -> Optional[Dict[str, int]]:
+        if self.ttl <= 0:
+            return None
+        with self._lock:
+            entry = self._entries.get(collection_key)
+            if entry is None:
+                return None
+            counts, expires_at = entry
+            if time.monotonic() > expires_at:
+                del self._entries[collection_key]
+                return None
+            self._entries.move_to_end(collection_key)
+            return dict(counts)
+
+    def set(self, collection_key: str, counts: Dict[str, int]):
+        if self.ttl <= 0:
+            return
+        with self._lock:
+            self._entries[collection_key] = (dict(counts), time.monotonic() + self.ttl)
+            self._entries.move_to_end(collection_key)
+            while len(self._entries) > self.max_collections:
+                self._entries.popitem(last=False)
+
+    def apply(self, collection_key: str, delta: Dict[str, int]):
+        """把写入带来的计数变化合并到已缓存的结果中"""
+        with self._lock:
+            entry = self._entries.get(collection_key)
+            if entry is None:
+                return
+            counts = entry[0]
+            for category, change in delta.items():
+                count = counts.get(category, 0) + change
+                if count > 0:
+                    counts[category] = count
+                else:
+                    counts.pop(category, None)
+
+    def invalidate(self, collection_key: str):
+        with self._lock:
+            self._entries.pop(collection_key, None)
+
+
+class QueryCache:
+    """列表/搜索结果的进程内缓存，按字节数限制内存并按 LRU 淘汰
+
+    每个集合有一个写入代数，通过本服务的每次写入都会使其加一并丢弃该集合的缓存。
+    读取时先取得当前代数，只有代数未变时结果才会写入缓存，
+    因此与写入并发的读取不会把旧结果放进缓存。
+    代数只在本进程内维护：其他 worker 或直接写入数据库造成的变化要等 TTL 过期后才可见。
+    缓存的结果由多个请求共享，调用方不能修改。
+    """
+
+    def __init__(self, max_bytes: int, ttl: int):
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._entries: 'OrderedDict[tuple, tuple]' = OrderedDict()
+        self._by_collection: Dict[str, set] = {}
+        self._generations: Dict[str, int] = {}
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_bytes > 0
+
+    def generation(self, collection_key: str) -> int:
+        return self._generations.get(collection_key, 0)
+
+    def get(self, collection_key: str, query_key: str):
+        if not self.enabled:
+            return None
+        with self._lock:
+            key = (collection_key, query_key)
+            entry = self._entries.get(key)
+            if entry is None or time.monotonic() > entry[2]:
+                if entry is not None:
+                    self._drop(key)
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def set(self, collection_key: str, generation: int, query_key: str, value):
+        if not self.enabled:
+            return
+        size = len(json.dumps(value, default=str))
+        # 单个结果不超过总容量的 1/8，避免一次淘汰掉大量条目
+        if size > self.max_bytes // 8:
+            return
+        with self._lock:
+            if generation != self.generation(collection_key):
+                return
+            key = (collection_key, query_key)
+            if key in self._entries:
+                self._drop(key)
+            self._entries[key] = (value, size, time.monotonic() + self.ttl)
+            self._by_collection.setdefault(collection_key, set()).add(key)
+            self.bytes += size
+            while self.bytes > self.max_bytes:
+                self._drop(next(iter(self._entries)))
+                self.evictions += 1
+
+    def bump(self, collection_key: str):
+        """集合被写入后调用"""
+        with self._lock:
+            self._generations[collection_key] = self.generation(collection_key) + 1
+            for key in list(self._by_collection.get(collection_key, ())):
+                self._drop(key)
+
+    def _drop(self, key: tuple):
+        value, size, _ = self._entries.pop(key)
+        self.bytes -= size
+        keys = self._by_collection.get(key[0])
+        if keys is not None:
+            keys.discard(key)
+            if not keys:
+                del self._by_collection[key[0]]
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                'entries': len(self._entries),
+                'bytes': self.bytes,
+                'max_bytes': self.max_bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+            }
@@ -0,0 +1,201 @@
+import logging
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, Dict, Optional
+
+from pymongo import monitoring
+
+logger = logging.getLogger(__name__)
+
+
+class PoolStats(monitoring.ConnectionPoolListener):
+    """单个 MongoClient 连接池的统计"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.open_connections = 0
+        self.checked_out = 0
+        self.checkouts = 0
+        self.checkout_failures = 0
+        self.pool_clears = 0
+
+    def _add(self, name: str, delta: int):
+        with self._lock:
+            setattr(self, name, getattr(self, name) + delta)
+
+    def pool_created(self, event):
+        pass
+
+    def pool_ready(self, event):
+        pass
+
+    def pool_cleared(self, event):
+        self._add('pool_clears', 1)
+
+    def pool_closed(self, event):
+        pass
+
+    def connection_created(self, event):
+        self._add('open_connections', 1)
+
+    def connection_ready(self, event):
+        pass
+
+    def connection_closed(self, event):
+        self._add('open_connections', -1)
+
+    def connection_check_out_started(self, event):
+        pass
+
+    def connection_check_out_failed(self, event):
+        self._add('checkout_failures', 1)
+
+    def connection_checked_out(self, event):
+        with self._lock:
+            self.checkouts += 1
+            self.checked_out += 1
+
+    def connection_checked_in(self, event):
+        self._add('checked_out', -1)
+
+    def to_dict(self) -> Dict:
+        with self._lock:
+            return {
+                'open_connections': self.open_connections,
+                'checked_out': self.checked_out,
+                'checkouts': self.checkouts,
+                'checkout_failures': self.checkout_failures,
+                'pool_clears': self.pool_clears,
+            }
+
+
+class ClientEntry:
+    """注册表中的一个共享客户端"""
+
+    def __init__(self, client, health, pool_stats: PoolStats):
+        self.client = client
+        self.health = health
+        self.pool_stats = pool_stats
+        self.refs = 0
+        self.last_used = time.monotonic()
+
+
+class ClientRegistry:
+    """按集群 URI 共享 MongoClient 的注册表
+
+    同一集群的所有集合共用一个客户端（一个连接池和一组监控线程）。
+    令牌通过 acquire/release 引用计数，没有引用的客户端在空闲超时后或
+    超过 max_clients 时按 LRU 顺序关闭。
+    """
+
+    def __init__(self, factory: Callable[[str], ClientEntry], max_clients: int,
+                 idle_timeout: float, on_evict: Optional[Callable[[str], None]] = None):
+        self.factory = factory
+        self.max_clients = max_clients
+        self.idle_timeout = idle_timeout
+        self.on_evict = on_evict
+        self._lock = threading.RLock()
+        self._entries: 'OrderedDict[str, ClientEntry]' = OrderedDict()
+        self.created = 0
+        self.evicted = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, mongo_uri: str) -> ClientEntry:
+        """获取（必要时创建）客户端，不增加引用计数"""
+        with self._lock:
+            entry = self._entries.get(mongo_uri)
+            if entry is None:
+                self._evict(reserve=1)
+                entry = self.factory(mongo_uri)
+                self._entries[mongo_uri] = entry
+                self.created += 1
+            self._entries.move_to_end(mongo_uri)
+            entry.last_used = time.monotonic()
+            return entry
+
+    def peek(self, mongo_uri: str) -> Optional[ClientEntry]:
+        """只读取已存在的客户端，不创建也不调整 LRU 顺序"""
+        return self._entries.get(mongo_uri)
+
+    def acquire(self, mongo_uri: str) -> ClientEntry:
+        with self._lock:
+            entry = self.get(mongo_uri)
+            entry.refs += 1
+            return entry
+
+    def release(self, mongo_uri: str):
+        with self._lock:
+            entry = self._entries.get(mongo_uri)
+            if entry is None:
+                return
+            entry.refs = max(entry.refs - 1, 0)
+            entry.last_used = time.monotonic()
+
+    def discard(self, mongo_uri: str):
+        """立即关闭客户端（例如确认连接已失效时）"""
+        with self._lock:
+            entry = self._entries.pop(mongo_uri, None)
+        if entry is not None:
+            self._close(mongo_uri, entry)
+
+    def _evict(self, reserve: int = 0):
+        """关闭空闲超时的客户端，并保证为新客户端留出 reserve 个名额"""
+        now = time.monotonic()
+        for mongo_uri, entry in list(self._entries.items()):
+            if entry.refs == 0 and now - entry.last_used > self.idle_timeout:
+                del self._entries[mongo_uri]
+                self._close(mongo_uri, entry)
+
+        # OrderedDict 按最近使用排序，从最久未用的开始淘汰
+        for mongo_uri, entry in list(self._entries.items()):
+            if len(self._entries) + reserve <= self.max_clients:
+                break
+            if entry.refs == 0:
+                del self._entries[mongo_uri]
+                self._close(mongo_uri, entry)
+
+        if len(self._entries) + reserve > self.max_clients:
+            raise RuntimeError(f"数据库客户端数量已达上限 ({self.max_clients})")
+
+    def evict_idle(self):
+        with self._lock:
+            self._evict()
+
+    def _close(self, mongo_uri: str, entry: ClientEntry):
+        self.evicted += 1
+        try:
+            entry.client.close()
+        except Exception as e:
+            logger.error(f"关闭连接失败: {e}")
+        if self.on_evict:
+            self.on_evict(mongo_uri)
+        logger.info("已关闭空闲的MongoDB客户端")
+
+    def close_all(self):
+        with self._lock:
+            entries = list(self._entries.items())
+            self._entries.clear()
+        for mongo_uri, entry in entries:
+            self._close(mongo_uri, entry)
+
+    def stats(self) -> Dict:
+        with self._lock:
+            now = time.monotonic()
+            return {
+                'clients': len(self._entries),
+                'max_clients': self.max_clients,
+                'created': self.created,
+                'evicted': self.evicted,
+                'pools': [
+                    {
+                        'refs': entry.refs,
+                        'idle_seconds': round(now - entry.last_used, 1),
+                        'healthy': entry.health.healthy,
+                        **entry.pool_stats.to_dict(),
+                    }
+                    for entry in self._entries.values()
+                ],
+            }
@@ -0,0 +1,140 @@
+import gzip
+import logging
+import zlib
+from typing import Dict, Iterable, Iterator
+
+from bson.binary import Binary
+from flask import request
+
+try:
+    import zstandard
+except ImportError:  # 可选依赖
+    zstandard = None
+
+try:
+    import brotli
+except ImportError:  # 可选依赖
+    brotli = None
+
+logger = logging.getLogger(__name__)
+
+# 压缩后的字段以自定义子类型的 BSON Binary 存储，读取时据此识别
+ZLIB_SUBTYPE = 0x80
+ZSTD_SUBTYPE = 0x81
+
+
+class StorageCodec:
+    """捕获内容大字段的存储压缩
+
+    写入时把超过阈值的字符串字段压缩为 BSON Binary，读取时解压。
+    未压缩的旧文档原样返回，因此可以随时开启或关闭。
+    """
+
+    def __init__(self, algorithm: str, min_size: int, fields: Iterable[str]):
+        if algorithm == 'zstd' and zstandard is None:
+            logger.warning("未安装 zstandard，存储压缩改用 zlib")
+            algorithm = 'zlib'
+        self.algorithm = algorithm
+        self.min_size = min_size
+        self.fields = tuple(fields)
+
+    @property
+    def enabled(self) -> bool:
+        return self.algorithm in ('zlib', 'zstd')
+
+    def _compress(self, raw: bytes) -> Binary:
+        if self.algorithm == 'zstd':
+            return Binary(zstandard.ZstdCompressor().compress(raw), ZSTD_SUBTYPE)
+        return Binary(zlib.compress(raw), ZLIB_SUBTYPE)
+
+    def encode_document(self, doc: Dict) -> Dict:
+        """就地压缩文档中的大字段"""
+        if not self.enabled:
+            return doc
+        for field in self.fields:
+            value = doc.get(field)
+            if not isinstance(value, str):
+                continue
+            raw = value.encode('utf-8')
+            if len(raw) >= self.min_size:
+                doc[field] = self._compress(raw)
+        return doc
+
+    @staticmethod
+    def decode_value(value):
+        if isinstance(value, Binary):
+            if value.subtype == ZLIB_SUBTYPE:
+                return zlib.decompress(value).decode('utf-8')
+            if value.subtype == ZSTD_SUBTYPE:
+                if zstandard is None:
+                    raise RuntimeError("读取 zstd 压缩的内容需要安装 zstandard")
+                return zstandard.ZstdDecompressor().decompress(value).decode('utf-8')
+        return value
+
+    def decode_document(self, doc: Dict) -> Dict:
+        """就地解压文档中的压缩字段，无论当前是否开启压缩"""
+        for field, value in doc.items():
+            if isinstance(value, Binary):
+                doc[field] = self.decode_value(value)
+        return doc
+
+
+def gzip_stream(chunks: Iterable[bytes], level: int = 6) -> Iterator[bytes]:
+    """对流式响应逐块进行 gzip 压缩，内存占用与总大小无关"""
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+def compress_body(data: bytes, accepted, level: int):
+    """按客户端接受的编码压缩响应体，返回 (压缩后数据, 编码)，不支持时返回 None"""
+    if brotli is not None and accepted['br']:
+        return brotli.compress(data, quality=min(level, 11)), 'br'
+    if accepted['gzip']:
+        return gzip.compress(data, compresslevel=level), 'gzip'
+    return None
+
+
+def apply_compressed(response, body: bytes, encoding: str):
+    """把压缩后的数据写回响应并设置相关头"""
+    response.set_data(body)
+    response.headers['Content-Encoding'] = encoding
+    # 压缩后字节不同，强 ETag 降为弱 ETag（If-None-Match 本就按弱比较）
+    etag, weak = response.get_etag()
+    if etag and not weak:
+        response.set_etag(etag, weak=True)
+    response.vary.add('Accept-Encoding')
+
+
+def should_compress(response) -> bool:
+    """流式、空或已编码的响应不压缩"""
+    return not (response.direct_passthrough or response.is_streamed
+                or response.status_code < 200 or response.status_code in (204, 304)
+                or 'Content-Encoding' in response.headers)
+
+
+def init_response_compression(app):
+    """为较大的响应启用 gzip/brotli 压缩"""
+    if not app.config.get('RESPONSE_COMPRESSION', True):
+        return
+
+    min_size = app.config.get('RESPONSE_COMPRESSION_MIN_BYTES', 1024)
+    level = app.config.get('RESPONSE_COMPRESSION_LEVEL', 6)
+
+    @app.after_request
+    def compress_response(response):
+        if not should_compress(response):
+            return response
+
+        data = response.get_data()
+        if len(data) < min_size:
+            return response
+
+        compressed = compress_body(data, request.accept_encodings, level)
+        if compressed is None:
+            return response
+        apply_compressed(response, *compressed)
+        return response
@@ -1,4 +1,5 @@
 import os
+import tempfile
 from dotenv import load_dotenv
 
 # 加载环境变量
@@ -18,11 +19,91 @@ class Config:
     # MongoDB配置
     MONGO_URI = os.getenv('MONGO_URI')
     COLLECTION_NAME = os.getenv('COLLECTION_NAME', 'captured_content')
+    # 后台心跳间隔（毫秒），用于刷新连接健康状态缓存
+    MONGO_HEARTBEAT_FREQUENCY_MS = int(os.getenv('MONGO_HEARTBEAT_FREQUENCY_MS', '10000'))
+    # 共享客户端：最多客户端数量、无令牌引用后的空闲回收时间（秒）、每个客户端的连接池大小
+    MONGO_MAX_CLIENTS = int(os.getenv('MONGO_MAX_CLIENTS', '50'))
+    MONGO_CLIENT_IDLE_TIMEOUT = int(os.getenv('MONGO_CLIENT_IDLE_TIMEOUT', '600'))
+    MONGO_MAX_POOL_SIZE = int(os.getenv('MONGO_MAX_POOL_SIZE', '100'))
+    
+    # 令牌存储：memory（单进程）、sqlite（同一主机多个worker共享）、redis（跨主机共享）
+    TOKEN_STORE = os.getenv('TOKEN_STORE', 'memory')
+    # SQLite 文件中保存了连接字符串，默认放在当前用户专属的目录中，文件权限为 0600
+    TOKEN_STORE_PATH = os.getenv('TOKEN_STORE_PATH', os.path.join(
+        tempfile.gettempdir(), f"capture-{os.getuid() if hasattr(os, 'getuid') else 'tokens'}", 'tokens.sqlite3'))
+    TOKEN_STORE_URL = os.getenv('TOKEN_STORE_URL', 'redis://localhost:6379/0')
     
     # API配置
     API_PREFIX = '/api'
     DEFAULT_PAGE_SIZE = 20
     MAX_PAGE_SIZE = 100
+    # 批量创建：单次请求最多条数，以及每次 insert_many 的分块大小
+    MAX_BATCH_SIZE = int(os.getenv('MAX_BATCH_SIZE', '5000'))
+    BATCH_CHUNK_SIZE = int(os.getenv('BATCH_CHUNK_SIZE', '500'))
+    # 流式导入：每批最多条数和字节数（超过任一即写入）
+    IMPORT_BATCH_SIZE = int(os.getenv('IMPORT_BATCH_SIZE', '1000'))
+    IMPORT_BATCH_BYTES = int(os.getenv('IMPORT_BATCH_BYTES', str(8 * 1024 * 1024)))
+    # 写后缓冲：单条创建先入队，由后台线程按集合合并写入。队列容量（0 表示关闭）、
+    # 每批最多条数和最长等待时间（毫秒）
+    WRITE_BUFFER_MAX_SIZE = int(os.getenv('WRITE_BUFFER_MAX_SIZE', '0'))
+    WRITE_BUFFER_BATCH_SIZE = int(os.getenv('WRITE_BUFFER_BATCH_SIZE', '500'))
+    WRITE_BUFFER_FLUSH_INTERVAL_MS = int(os.getenv('WRITE_BUFFER_FLUSH_INTERVAL_MS', '20'))
+    # 写入时按内容指纹（url + text + html）去重：off/reject/merge/reference
+    DEDUP_MODE = os.getenv('DEDUP_MODE', 'off')
+    # 写入后的 HTML 处理（清理 html、提取正文和词数）：工作进程数（0 表示关闭）、队列容量、
+    # 失败后的重试次数和首次重试前的等待时间（秒，之后每次加倍）
+    HTML_PROCESSING_WORKERS = int(os.getenv('HTML_PROCESSING_WORKERS', '0'))
+    HTML_PROCESSING_QUEUE_SIZE = int(os.getenv('HTML_PROCESSING_QUEUE_SIZE', '10000'))
+    HTML_PROCESSING_MAX_RETRIES = int(os.getenv('HTML_PROCESSING_MAX_RETRIES', '3'))
+    HTML_PROCESSING_RETRY_DELAY = float(os.getenv('HTML_PROCESSING_RETRY_DELAY', '1'))
+    # 导出时每次从 MongoDB 取回的文档数
+    EXPORT_BATCH_SIZE = int(os.getenv('EXPORT_BATCH_SIZE', '1000'))
+    # 列表摘要中文本预览的最大长度
+    PREVIEW_LENGTH = int(os.getenv('PREVIEW_LENGTH', '200'))
+    # 全文索引的字段权重（字段:权重，逗号分隔），修改后已有的全文索引会在后台重建
+    SEARCH_WEIGHTS = os.getenv('SEARCH_WEIGHTS', 'title:10,text:1')
+    # 搜索结果中正文高亮片段的最大长度（字符）
+    SEARCH_SNIPPET_LENGTH = int(os.getenv('SEARCH_SNIPPET_LENGTH', '200'))
+    # 相关内容/近似重复索引：是否启用、保存目录、单个集合最多条数、
+    # 近似重复的相似度阈值（0-1），以及补齐其他进程写入的间隔（秒）
+    SIMILARITY_INDEX = os.getenv('SIMILARITY_INDEX', 'True').lower() == 'true'
+    SIMILARITY_INDEX_DIR = os.getenv('SIMILARITY_INDEX_DIR', os.path.join(tempfile.gettempdir(), 'capture_similarity'))
+    SIMILARITY_MAX_DOCUMENTS = int(os.getenv('SIMILARITY_MAX_DOCUMENTS', '200000'))
+    SIMILARITY_DUPLICATE_THRESHOLD = float(os.getenv('SIMILARITY_DUPLICATE_THRESHOLD', '0.8'))
+    SIMILARITY_REFRESH_INTERVAL = int(os.getenv('SIMILARITY_REFRESH_INTERVAL', '300'))
+    # 本进程所有集合的索引文档总数上限，以及未查询多久（秒）后移出内存（移出前保存到磁盘）
+    SIMILARITY_MAX_TOTAL_DOCUMENTS = int(os.getenv('SIMILARITY_MAX_TOTAL_DOCUMENTS', '500000'))
+    SIMILARITY_IDLE_TIMEOUT = int(os.getenv('SIMILARITY_IDLE_TIMEOUT', '3600'))
+    # 列表总数缓存时间（秒），0 表示不缓存
+    COUNT_CACHE_TTL = int(os.getenv('COUNT_CACHE_TTL', '30'))
+    
+    # 列表/搜索结果缓存：内存上限（字节，0 表示不缓存）和过期时间（秒）。
+    # 写入只使本进程的缓存失效；使用共享令牌存储时通常有多个 worker，默认缩短过期时间
+    QUERY_CACHE_MAX_BYTES = int(os.getenv('QUERY_CACHE_MAX_BYTES', str(64 * 1024 * 1024)))
+    QUERY_CACHE_TTL = int(os.getenv('QUERY_CACHE_TTL', '60' if TOKEN_STORE == 'memory' else '5'))
+    # 分类缓存：TTL（秒，0 表示不缓存）、最多缓存的集合数，以及是否使用物化计数集合（<集合名>_category_counts）
+    CATEGORY_CACHE_TTL = int(os.getenv('CATEGORY_CACHE_TTL', '300'))
+    CATEGORY_CACHE_SIZE = int(os.getenv('CATEGORY_CACHE_SIZE', '256'))
+    CATEGORY_COUNTS_COLLECTION = os.getenv('CATEGORY_COUNTS_COLLECTION', 'False').lower() == 'true'
+    
+    # 存储压缩：none/zlib/zstd，超过阈值（字节）的字段以压缩形式存储
+    # 注意 text 参与全文索引，压缩后将无法被搜索到，默认只压缩 html
+    STORAGE_COMPRESSION = os.getenv('STORAGE_COMPRESSION', 'none')
+    STORAGE_COMPRESSION_MIN_BYTES = int(os.getenv('STORAGE_COMPRESSION_MIN_BYTES', '1024'))
+    STORAGE_COMPRESSED_FIELDS = os.getenv('STORAGE_COMPRESSED_FIELDS', 'html').split(',')
+    # 大正文外置：超过阈值（字节，0 表示关闭）的字段存入 GridFS（<集合名>_bodies），
+    # 文档中只保留引用。外置的 text 不参与全文搜索和相关内容
+    LARGE_BODY_THRESHOLD = int(os.getenv('LARGE_BODY_THRESHOLD', str(1024 * 1024)))
+    # 默认只外置 html；text 需显式加入，否则大正文会悄悄从搜索和相关内容中消失
+    LARGE_BODY_FIELDS = os.getenv('LARGE_BODY_FIELDS', 'html').split(',')
+
+    # 响应压缩（gzip，安装 brotli 后优先使用 br）
+    RESPONSE_COMPRESSION = os.getenv('RESPONSE_COMPRESSION', 'True').lower() == 'true'
+    RESPONSE_COMPRESSION_MIN_BYTES = int(os.getenv('RESPONSE_COMPRESSION_MIN_BYTES', '1024'))
+    RESPONSE_COMPRESSION_LEVEL = int(os.getenv('RESPONSE_COMPRESSION_LEVEL', '6'))
+    
+    # 异步（ASGI）模式下处理非原生异步接口的线程数
+    ASYNC_FALLBACK_THREADS = int(os.getenv('ASYNC_FALLBACK_THREADS', '16'))
     
     # 日志配置
     LOG_LEVEL = os.getenv('LOG_LEVEL', 'INFO')
@@ -1,145 +1,765 @@
 import os
 import logging
-from pymongo import MongoClient
-from flask import g # Keep g for potential future use or other parts of the app
+from pymongo import MongoClient, DESCENDING, ReturnDocument, UpdateOne
+from pymongo.errors import BulkWriteError, ConfigurationError, ConnectionFailure, WriteError
+from bson.objectid import ObjectId
+from flask import g, has_request_context
+import base64
+import binascii
 import hashlib
+import io
+import secrets
+import threading
 import time
-from typing import Optional, Dict, Tuple
+from collections import Counter
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from urllib.parse import unquote
+from typing import Optional, Dict, Iterator, List, Tuple
+from config import get_config
+from liveness import ClientHealth, LivenessStats
+from client_pool import ClientEntry, ClientRegistry, PoolStats
+from token_registry import TokenRegistry
+from token_store import create_token_store
+from index_manager import IndexManager, index_specs, parse_weights
+from highlight import highlight as highlight_text, search_pattern
+from cache import CategoryCache, CountCache, QueryCache, make_query_key
+from compression import StorageCodec
+from body_store import BODY_FIELDS, BODY_FILES, BodyStore, delete_steps, file_ids, load_steps, open_steps, upload_steps
+from similarity import SimilarityManager, analyze
+from dedup import DEDUP_MODES, DUPLICATE_KEY_ERROR, DedupStats, DuplicateCapture, DuplicateId, content_hash, merge_update
+from write_buffer import QueuedId, WriteBuffer
+from html_processor import HtmlProcessor
+from metrics import mongo_metrics, registry as metrics_registry
+from mongo_steps import Steps, call, fetch, run
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# get_captures 支持的总数计算方式
+COUNT_MODES = ('exact', 'estimated', 'none')
+
+# 列表视图：summary 只返回列表展示所需字段和服务端生成的预览，不含 html/text
+LIST_VIEWS = ('summary', 'full')
+# create_capture 的确认方式：queued 入队即返回，durable 写入 MongoDB 后返回
+ACK_MODES = ('queued', 'durable')
+SUMMARY_FIELDS = ('title', 'url', 'categories', 'timestamp', 'tag', 'preview')
+# 搜索结果的排序方式
+SEARCH_SORTS = ('relevance', 'newest')
+# 生成高亮片段所需的字段
+HIGHLIGHT_FIELDS = ('title', 'text')
+# 只由服务端维护、写入时忽略客户端传入值的字段
+SERVER_FIELDS = ('_version', 'updated_at', 'content_hash', 'content_ref', 'duplicate_count', BODY_FILES,
+                 'processed', 'word_count')
+# 后台 HTML 处理读取的字段
+PROCESSING_FIELDS = ('title', 'html', 'text', 'content_ref', BODY_FILES, '_version', 'processed')
+
+# 集合的去重统计：记录数、带指纹的记录数、合并掉的重复数、引用共享内容的记录数
+DEDUP_STATS_PIPELINE = [
+    {'$group': {
+        '_id': None,
+        'captures': {'$sum': 1},
+        'fingerprinted': {'$sum': {'$cond': [{'$gt': ['$content_hash', None]}, 1, 0]}},
+        'merged': {'$sum': {'$ifNull': ['$duplicate_count', 0]}},
+        'referencing': {'$sum': {'$cond': [{'$gt': ['$content_ref', None]}, 1, 0]}},
+    }},
+]
+
+# 统计每个分类的文档数（同一文档内重复的分类只计一次）
+CATEGORY_COUNT_PIPELINE = [
+    {'$project': {'categories': {'$cond': [
+        {'$isArray': '$categories'}, {'$setUnion': ['$categories', []]}, []
+    ]}}},
+    {'$unwind': '$categories'},
+    # 与 _categories_of 一致只统计字符串分类，否则排序分类名时会因类型混杂而失败
+    {'$match': {'categories': {'$type': 'string'}}},
+    {'$group': {'_id': '$categories', 'count': {'$sum': 1}}},
+]
+# 物化计数集合中标记“已生成”的文档，_id 不是字符串因此不会与分类名冲突
+CATEGORY_COUNTS_MARKER = {'built': True}
+
+def _categories_of(doc: Dict) -> set:
+    categories = doc.get('categories')
+    if not isinstance(categories, list):
+        return set()
+    return {category for category in categories if isinstance(category, str)}
+
+# get_capture 在文档版本未变化时返回的标记
+NOT_MODIFIED = object()
+
+def _version_differs(version: int) -> Dict:
+    """匹配版本号不等于 version 的文档，没有版本号的旧文档视为版本 0"""
+    if version == 0:
+        return {'_version': {'$exists': True, '$ne': 0}}
+    return {'_version': {'$ne': version}}
+
+def _list_query(category: Optional[str], search: Optional[str]) -> Dict:
+    """列表、搜索和导出共用的过滤条件"""
+    query = {}
+    if category:
+        query['categories'] = {'$in': [category]}
+    if search:
+        query['$text'] = {'$search': search}
+    return query
+
+def _resolve_sort(search: Optional[str], cursor: Optional[str], sort: Optional[str]) -> Optional[str]:
+    """列表的排序方式，None 表示保持原有顺序
+
+    搜索时默认按相关度排序；游标分页基于 _id，只能按时间倒序。
+    """
+    if sort is None:
+        return 'relevance' if search and cursor is None else None
+    if sort not in SEARCH_SORTS:
+        raise ValueError("无效的 sort 参数")
+    if sort == 'relevance' and (not search or cursor is not None):
+        raise ValueError("只有页码分页的搜索才能按相关度排序")
+    return sort
+
+def _list_args(count: str, view: str, search: Optional[str], cursor: Optional[str], sort: Optional[str], highlight: bool) -> Tuple[Optional[str], Optional[str]]:
+    """校验列表参数，返回实际的 (sort, 高亮用的搜索词)"""
+    if count not in COUNT_MODES:
+        raise ValueError("无效的 count 参数")
+    if view not in LIST_VIEWS:
+        raise ValueError("无效的 view 参数")
+    return _resolve_sort(search, cursor, sort), search if highlight and search else None
+
+def _object_id(capture_id: str) -> ObjectId:
+    try:
+        return ObjectId(capture_id)
+    except Exception:
+        raise ValueError("无效的 capture_id")
+
+def _list_key(page, limit, category, search, cursor, count, view, fields, sort=None, highlight=None) -> str:
+    """列表查询参数的规范化键"""
+    return make_query_key({
+        'page': page if cursor is None else None, 'limit': limit,
+        'category': category, 'search': search, 'cursor': cursor,
+        'count': count, 'view': view, 'fields': fields,
+        'sort': sort, 'highlight': highlight
+    })
+
+def _collection_dedup_stats(mode: str, totals: Dict, contents: int) -> Dict:
+    """由 DEDUP_STATS_PIPELINE 的结果和共享内容数计算集合的去重比例
+
+    重复 = 合并掉的重复 + 引用已有共享内容的记录；比例相对于收到的全部内容。
+    """
+    captures = totals.get('captures', 0)
+    merged = totals.get('merged', 0)
+    referencing = totals.get('referencing', 0)
+    duplicates = merged + max(referencing - contents, 0)
+    received = captures + merged
+    return {
+        'mode': mode,
+        'captures': captures,
+        'fingerprinted': totals.get('fingerprinted', 0),
+        'merged': merged,
+        'referencing': referencing,
+        'shared_contents': contents,
+        'duplicates': duplicates,
+        'ratio': round(duplicates / received, 4) if received else 0,
+    }
+
+def _write_error(error: Dict) -> WriteError:
+    """bulk write 的单条错误转换为异常"""
+    return WriteError(error.get('errmsg', '写入失败'), error.get('code'), error)
+
+def _wants_html(view: str, fields: Optional[List[str]]) -> bool:
+    return 'html' in fields if fields else view == 'full'
+
+def _wanted_bodies(view: str, fields: Optional[List[str]]) -> Tuple[str, ...]:
+    """列表/导出结果中要返回的正文字段"""
+    if fields:
+        return tuple(field for field in BODY_FIELDS if field in fields)
+    return BODY_FIELDS if view == 'full' else ()
+
+def _has_body(doc: Dict) -> bool:
+    return any(doc.get(field) for field in (*BODY_FIELDS, 'content_ref', BODY_FILES))
+
+def _unsent_files(documents: List[Dict], errors: Dict, duplicates: Dict) -> List:
+    """写入失败或已合并到已有内容的文档上传过的外置正文"""
+    return [file_id for index, doc in enumerate(documents)
+            if index in errors or duplicates.get(index) is not None
+            for file_id in file_ids(doc.get(BODY_FILES))]
+
+def _uploaded_files(update: Dict) -> List:
+    """更新中新上传的外置正文，更新未生效时删除"""
+    return [ref['file_id'] for key, ref in update['$set'].items() if key.startswith(f'{BODY_FILES}.')]
+
+def _merge_similar_fields(before: Dict, data: Dict) -> Dict:
+    """由更新前的文档和部分更新得出相似度索引需要的新内容"""
+    return {'_id': before['_id'], **{
+        field: data[field] if field in data else before.get(field) for field in ('title', 'text')
+    }}
+
+def make_preview(text, length: int) -> str:
+    """生成折叠空白后的纯文本预览"""
+    if not isinstance(text, str):
+        return ''
+    return ' '.join(text.split())[:length]
+
+def split_mongo_uri(mongo_uri: str) -> Tuple[str, Optional[str]]:
+    """拆分连接字符串为集群 URI 和默认数据库名
+
+    集群 URI 去掉了路径中的数据库名，使同一集群的不同数据库/集合可以共用
+    一个客户端。带认证信息且未指定 authSource 时，原本由路径数据库隐含的
+    authSource 会被显式写入，保证认证语义不变（mongodb+srv 的 authSource
+    优先来自 DNS TXT 记录，因此不改写）。不做 DNS 解析。
+    """
+    scheme, _, rest = mongo_uri.partition('://')
+    rest, _, options = rest.partition('?')
+    hosts, _, database = rest.partition('/')
+    database = unquote(database) or None
+
+    params = [p for p in options.replace(';', '&').split('&') if p]
+    if scheme == 'mongodb' and database and '@' in hosts and not any(p.lower().startswith('authsource=') for p in params):
+        params.append(f"authSource={database}")
+
+    cluster_uri = f"{scheme}://{hosts}/"
+    if params:
+        cluster_uri += '?' + '&'.join(sorted(params))
+    return cluster_uri, database
+
+def encode_cursor(obj_id: ObjectId) -> str:
+    """将最后一条记录的 _id 编码为不透明的分页游标"""
+    return base64.urlsafe_b64encode(obj_id.binary).decode().rstrip('=')
+
+def decode_cursor(cursor: str) -> Optional[ObjectId]:
+    """解析分页游标，空字符串表示从第一页开始"""
+    if not cursor:
+        return None
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        return ObjectId(raw)
+    except (binascii.Error, TypeError, ValueError):
+        raise ValueError("无效的分页游标")
+
 class DatabaseService:
     def __init__(self):
         self.connections = {}
-        # 使用内存存储连接令牌，生产环境可考虑 Redis
-        self.connection_tokens: Dict[str, Dict] = {}
-        self.token_expiry = 3600  # 1小时过期
+        self._connections_lock = threading.Lock()
+        self.token_expiry = 3600  # 1小时过期，每次使用后顺延
+        config = get_config()
+        # 令牌存储可在多个 worker/实例间共享（TOKEN_STORE=memory|sqlite|redis）
+        self.connection_tokens = create_token_store(config, self.token_expiry)
+        # 本进程已为哪些令牌建立连接并持有客户端引用
+        self._local_tokens = TokenRegistry(self.token_expiry)
+        # 本进程验证过的令牌对应的集合键（同步和异步服务共用），
+        # 请求内的缓存失效、相似度索引等不必再访问令牌存储
+        self._token_keys = TokenRegistry(self.token_expiry)
+        self._materialize_lock = threading.Lock()
+        self._instance_id = secrets.token_hex(4)
+        self.indexes = IndexManager(index_specs(parse_weights(config.SEARCH_WEIGHTS)))
+        self.heartbeat_frequency_ms = config.MONGO_HEARTBEAT_FREQUENCY_MS
+        self.max_pool_size = config.MONGO_MAX_POOL_SIZE
+        # 按集群共享 MongoClient，而不是每个 URI+集合 一个
+        self.clients = ClientRegistry(
+            self._create_client,
+            max_clients=config.MONGO_MAX_CLIENTS,
+            idle_timeout=config.MONGO_CLIENT_IDLE_TIMEOUT,
+            on_evict=self._on_client_evicted
+        )
+        self.liveness = LivenessStats()
+        self.count_cache = CountCache(config.COUNT_CACHE_TTL)
+        self.query_cache = QueryCache(config.QUERY_CACHE_MAX_BYTES, config.QUERY_CACHE_TTL)
+        self.category_cache = CategoryCache(config.CATEGORY_CACHE_TTL, config.CATEGORY_CACHE_SIZE)
+        self.category_counts_collection = config.CATEGORY_COUNTS_COLLECTION
+        self.batch_chunk_size = config.BATCH_CHUNK_SIZE
+        self.export_batch_size = config.EXPORT_BATCH_SIZE
+        self.preview_length = config.PREVIEW_LENGTH
+        self.snippet_length = config.SEARCH_SNIPPET_LENGTH
+        self.codec = StorageCodec(
+            config.STORAGE_COMPRESSION,
+            config.STORAGE_COMPRESSION_MIN_BYTES,
+            config.STORAGE_COMPRESSED_FIELDS
+        )
+        self.write_buffer = WriteBuffer(
+            self._flush_buffered,
+            max_size=config.WRITE_BUFFER_MAX_SIZE,
+            batch_size=config.WRITE_BUFFER_BATCH_SIZE,
+            flush_interval=config.WRITE_BUFFER_FLUSH_INTERVAL_MS / 1000.0
+        )
+        self.similarity = SimilarityManager(
+            config.SIMILARITY_INDEX_DIR,
+            enabled=config.SIMILARITY_INDEX,
+            max_documents=config.SIMILARITY_MAX_DOCUMENTS,
+            duplicate_threshold=config.SIMILARITY_DUPLICATE_THRESHOLD,
+            refresh_interval=config.SIMILARITY_REFRESH_INTERVAL,
+            decode=StorageCodec.decode_value,
+            max_total_documents=config.SIMILARITY_MAX_TOTAL_DOCUMENTS,
+            idle_timeout=config.SIMILARITY_IDLE_TIMEOUT
+        )
+        self.dedup_mode = config.DEDUP_MODE
+        if self.dedup_mode not in DEDUP_MODES:
+            logger.warning(f"未知的 DEDUP_MODE {self.dedup_mode}，已关闭去重")
+            self.dedup_mode = 'off'
+        self.dedup_stats = DedupStats(self.dedup_mode)
+        self.bodies = BodyStore(config.LARGE_BODY_THRESHOLD, config.LARGE_BODY_FIELDS)
+        self.html_processor = HtmlProcessor(
+            self._load_for_processing,
+            self._store_processed,
+            workers=config.HTML_PROCESSING_WORKERS,
+            queue_size=config.HTML_PROCESSING_QUEUE_SIZE,
+            max_retries=config.HTML_PROCESSING_MAX_RETRIES,
+            retry_delay=config.HTML_PROCESSING_RETRY_DELAY
+        )
+        metrics_registry.add_collector(self._collect_metrics)
 
     def _get_connection_key(self, mongo_uri, collection_name):
         return f"{mongo_uri}_{collection_name}"
 
+    def _create_client(self, cluster_uri: str) -> ClientEntry:
+        """为一个集群创建共享的 MongoClient"""
+        logger.info("Establishing new MongoDB client")
+        health = ClientHealth(self.heartbeat_frequency_ms / 1000.0)
+        pool_stats = PoolStats()
+        client = MongoClient(
+            cluster_uri,
+            heartbeatFrequencyMS=self.heartbeat_frequency_ms,
+            maxPoolSize=self.max_pool_size,
+            event_listeners=[health, pool_stats, mongo_metrics]
+        )
+        return ClientEntry(client, health, pool_stats)
+
+    def _on_client_evicted(self, cluster_uri: str):
+        """客户端被注册表关闭后移除引用它的集合连接"""
+        with self._connections_lock:
+            for connection_key, conn in list(self.connections.items()):
+                if conn['cluster_uri'] == cluster_uri:
+                    del self.connections[connection_key]
+
     def _connect(self, mongo_uri, collection_name):
         connection_key = self._get_connection_key(mongo_uri, collection_name)
+        cluster_uri, database = split_mongo_uri(mongo_uri)
+        entry = self.clients.get(cluster_uri)
         if connection_key not in self.connections:
-            logger.info(f"Establishing new MongoDB connection for {mongo_uri}")
-            client = MongoClient(mongo_uri)
-            db = client.get_database()
+            if not database:
+                raise ConfigurationError("No default database name defined or provided.")
+            db = entry.client.get_database(database)
             collection = db.get_collection(collection_name)
-            
-            # Ensure text index exists for search functionality
-            try:
-                collection.create_index([("title", "text"), ("text", "text")])
-                logger.info(f"Ensured text index exists for collection '{collection_name}'")
-            except Exception as e:
-                logger.error(f"Failed to create text index: {e}")
-
-            self.connections[connection_key] = {
-                'client': client,
-                'db': db,
-                'collection': collection
-            }
-        return self.connections[connection_key]['db'], self.connections[connection_key]['collection']
+
+            with self._connections_lock:
+                self.connections.setdefault(connection_key, {
+                    'cluster_uri': cluster_uri,
+                    'client': entry.client,
+                    'db': db,
+                    'collection': collection,
+                    'health': entry.health
+                })
+        conn = self.connections[connection_key]
+
+        # 索引在后台建立，每个集群上的集合只检查一次
+        self.indexes.ensure(self._index_key(conn), conn['collection'])
+        return conn['db'], conn['collection']
+
+    def _index_key(self, conn: Dict) -> str:
+        return f"{conn['cluster_uri']}{conn['collection'].full_name}"
 
     def _generate_token(self, mongo_uri: str, collection_name: str) -> str:
         """生成连接令牌"""
-        timestamp = str(int(time.time()))
-        content = f"{mongo_uri}_{collection_name}_{timestamp}"
-        return hashlib.sha256(content.encode()).hexdigest()[:16]
+        # 随机生成，避免同一秒内对同一 URI 的连接得到相同（且可预测）的令牌
+        return secrets.token_hex(8)
 
     def _cleanup_expired_tokens(self):
-        """清理过期的连接令牌"""
-        current_time = int(time.time())
-        expired_tokens = [
-            token for token, info in self.connection_tokens.items()
-            if current_time - info['created_at'] > self.token_expiry
-        ]
-        for token in expired_tokens:
-            self._remove_connection_by_token(token)
+        """清理过期的连接令牌，只处理已到期的部分"""
+        for token, _ in self.connection_tokens.pop_expired():
+            self._release_local_token(token)
+        # 本进程长时间未使用的令牌也释放引用，令牌本身仍保留在共享存储中
+        for token, conn_info in self._local_tokens.pop_expired():
+            self.clients.release(conn_info['cluster_uri'])
+        self._token_keys.pop_expired()
+
+    def _release_local_token(self, token: str):
+        """释放本进程为令牌持有的客户端引用，空闲客户端由注册表负责关闭"""
+        self._token_keys.remove(token)
+        conn_info = self._local_tokens.remove(token)
+        if conn_info is not None:
+            self.clients.release(conn_info['cluster_uri'])
+            logger.info(f"已移除过期连接令牌: {token}")
 
-    def _remove_connection_by_token(self, token: str):
+    def _remove_connection_by_token(self, token: str) -> bool:
         """根据令牌移除连接"""
-        if token in self.connection_tokens:
-            conn_info = self.connection_tokens[token]
-            connection_key = conn_info['connection_key']
-
-            # 关闭数据库连接
-            if connection_key in self.connections:
-                try:
-                    self.connections[connection_key]['client'].close()
-                    del self.connections[connection_key]
-                except Exception as e:
-                    logger.error(f"关闭连接失败: {e}")
+        removed = self.connection_tokens.remove(token) is not None
+        self._release_local_token(token)
+        if has_request_context():
+            g.get('resolved_tokens', {}).pop(token, None)
+        return removed
 
-            # 移除令牌
-            del self.connection_tokens[token]
-            logger.info(f"已移除过期连接令牌: {token}")
+    def _materialize_token(self, token: str, token_info: Dict):
+        """按共享存储中的会话信息在本进程重建连接（令牌可能由其他 worker 创建）"""
+        with self._materialize_lock:
+            if self._local_tokens.get(token) is not None:
+                return
+            cluster_uri = token_info['cluster_uri']
+            self.clients.acquire(cluster_uri)
+            try:
+                self._connect(token_info['mongo_uri'], token_info['collection_name'])
+            except Exception:
+                self.clients.release(cluster_uri)
+                raise
+            self._local_tokens.add(token, {'cluster_uri': cluster_uri})
 
     def create_connection_token(self, mongo_uri: str, collection_name: str) -> Tuple[str, Dict]:
         """创建数据库连接令牌"""
         try:
-            # 清理过期令牌
+            # 清理过期令牌和空闲客户端
             self._cleanup_expired_tokens()
+            self.clients.evict_idle()
 
-            # 建立连接
-            db, collection = self._connect(mongo_uri, collection_name)
+            # 建立连接，令牌持有共享客户端的一个引用
+            cluster_uri, _ = split_mongo_uri(mongo_uri)
+            self.clients.acquire(cluster_uri)
+            try:
+                db, collection = self._connect(mongo_uri, collection_name)
+            except Exception:
+                self.clients.release(cluster_uri)
+                raise
 
             # 生成令牌
             token = self._generate_token(mongo_uri, collection_name)
 
             # 存储令牌信息
-            self.connection_tokens[token] = {
+            token_info = {
                 'connection_key': self._get_connection_key(mongo_uri, collection_name),
                 'mongo_uri': mongo_uri,
+                'cluster_uri': cluster_uri,
                 'collection_name': collection_name,
                 'created_at': int(time.time()),
                 'database': db.name,
                 'collection': collection.name
             }
+            self.connection_tokens.add(token, token_info)
+            self._local_tokens.add(token, {'cluster_uri': cluster_uri})
+            self._remember_key(token, token_info)
 
             logger.info(f"创建连接令牌成功: {token}")
-            return token, self.connection_tokens[token]
+            return token, token_info
 
         except Exception as e:
             logger.error(f"创建连接令牌失败: {e}")
             raise
 
     def get_connection_by_token(self, token: str) -> Optional[Tuple]:
-        """根据令牌获取数据库连接"""
-        if token not in self.connection_tokens:
-            return None
+        """根据令牌获取数据库连接
 
-        token_info = self.connection_tokens[token]
-        connection_key = token_info['connection_key']
+        同一请求内（例如列表先计算 ETag 再查询）只访问一次令牌存储，结果保存在 flask.g 中。
+        """
+        if not has_request_context():
+            return self._resolve_connection(token)
+        resolved = g.setdefault('resolved_tokens', {})
+        if token not in resolved:
+            resolved[token] = self._resolve_connection(token)
+        return resolved[token]
+
+    def _resolve_connection(self, token: str) -> Optional[Tuple]:
+        self._cleanup_expired_tokens()
 
-        # 检查令牌是否过期
-        if int(time.time()) - token_info['created_at'] > self.token_expiry:
-            self._remove_connection_by_token(token)
+        # 过期的令牌返回 None，有效令牌的过期时间顺延
+        token_info = self.connection_tokens.get(token)
+        if token_info is None:
+            self._release_local_token(token)
             return None
+        connection_key = token_info['connection_key']
+        self._remember_key(token, token_info)
+
+        if self._local_tokens.get(token) is None:
+            self._materialize_token(token, token_info)
 
         # 获取连接
         if connection_key in self.connections:
             conn_info = self.connections[connection_key]
+            health = conn_info['health']
+
+            # 健康状态由后台心跳维护，只有在状态可疑时才同步探测一次
+            if not health.needs_probe():
+                self.liveness.record_avoided()
+                return conn_info['db'], conn_info['collection']
+
             try:
-                # 测试连接是否有效
                 conn_info['client'].admin.command('ping')
+                self.liveness.record_probe(True)
+                health.mark_ok()
                 return conn_info['db'], conn_info['collection']
             except Exception:
+                self.liveness.record_probe(False)
                 logger.warning(f"令牌 {token} 对应的连接已失效")
                 self._remove_connection_by_token(token)
                 return None
 
         return None
 
+    def _remember_key(self, token: str, token_info: Dict):
+        """记录令牌对应的集合键和连接信息，每次请求只在 get_connection_by_token 中读取一次令牌存储"""
+        if self._token_keys.get(token) is None:
+            self._token_keys.add(token, {name: token_info[name] for name in
+                                         ('connection_key', 'mongo_uri', 'cluster_uri', 'collection_name')})
+
+    def _collection_key(self, token: str) -> Optional[str]:
+        """令牌对应集合的缓存键，本进程未验证过或已撤销的令牌返回 None
+
+        只读内存：令牌对应的集合不会改变，其他 worker 撤销的令牌在下次
+        get_connection_by_token 时才会发现。
+        """
+        info = self._token_keys.get(token)
+        return info['connection_key'] if info else None
+
+    def _on_write(self, token: str):
+        """通过本服务写入集合后使相关缓存失效"""
+        collection_key = self._collection_key(token)
+        if collection_key:
+            self.count_cache.invalidate(collection_key)
+            self.query_cache.bump(collection_key)
+
+    def _tracks_similar(self, token: str) -> bool:
+        """本进程是否在维护该集合的相似度索引"""
+        collection_key = self._collection_key(token)
+        return bool(collection_key) and self.similarity.tracks(collection_key)
+
+    def _unindex_similar(self, token: str, doc_id: str):
+        if self._tracks_similar(token):
+            self.similarity.remove(self._collection_key(token), doc_id)
+
+    def _index_similar(self, token: str, documents: List[Dict]):
+        """把新写入或修改后的文档加入相似度索引（本进程未维护该集合的索引时跳过）"""
+        if documents and self._tracks_similar(token):
+            self.similarity.add(self._collection_key(token), documents)
+
+    @contextmanager
+    def _track_failures(self, token: str):
+        """捕获真实命令的网络错误并标记连接为不健康"""
+        try:
+            yield
+        except ConnectionFailure as e:
+            self.liveness.record_command_failure()
+            conn = self.connections.get(self._collection_key(token))
+            if conn:
+                conn['health'].mark_failed(e)
+            logger.warning(f"令牌 {token} 的数据库命令失败: {e}")
+            raise
+
+    def _run(self, token: str, steps: Steps):
+        """执行 *_steps 流程（与 AsyncDatabaseService 共用），网络错误时标记连接不健康"""
+        with self._track_failures(token):
+            return run(steps)
+
+    def get_liveness_stats(self) -> Dict:
+        """获取连接健康状态统计"""
+        stats = self.liveness.to_dict()
+        pools = self.clients.stats()['pools']
+        stats['clients'] = len(pools)
+        stats['unhealthy_clients'] = sum(1 for pool in pools if not pool['healthy'])
+        return stats
+
+    def get_list_etag(self, token: str, page: int = 1, limit: int = 20, category: Optional[str] = None, search: Optional[str] = None, cursor: Optional[str] = None, count: str = 'exact', view: str = 'summary', fields: Optional[List[str]] = None, sort: Optional[str] = None, highlight: bool = False) -> str:
+        """列表的弱 ETag，由集合写入代数和查询参数得出
+
+        写入代数只在本进程内有效，因此加入进程标识；并按 QUERY_CACHE_TTL
+        分段，使其他进程写入造成的陈旧不超过查询缓存的时间窗口。
+        """
+        connection = self.get_connection_by_token(token)
+        if not connection:
+            raise ValueError("无效的连接令牌")
+
+        return self._list_etag(self._collection_key(token),
+                               _list_key(page, limit, category, search, cursor, count, view, fields, sort, highlight))
+
+    def _list_etag(self, collection_key: str, list_key: str) -> str:
+        generation = self.query_cache.generation(collection_key)
+        bucket = int(time.time() // max(self.query_cache.ttl, 1))
+        digest = hashlib.sha1(f"{collection_key}|{list_key}".encode()).hexdigest()[:16]
+        return f"{self._instance_id}-{generation}-{bucket}-{digest}"
+
+    def get_query_cache_stats(self) -> Dict:
+        """获取列表查询缓存统计"""
+        return self.query_cache.stats()
+
+    def get_write_buffer_stats(self) -> Dict:
+        """获取写后缓冲的队列深度和写入延迟统计"""
+        return self.write_buffer.stats()
+
+    def _collect_metrics(self):
+        """/api/metrics 抓取时读取的连接池、缓存和写入队列状态"""
+        pools = self.get_pool_stats()['pools']
+        cache = self.query_cache.stats()
+        buffer = self.write_buffer.stats()
+        dedup = self.dedup_stats.stats()
+        processing = self.html_processor.stats()
+        return [
+            ('capture_mongodb_clients', 'gauge', '共享的 MongoDB 客户端数', [({}, len(pools))]),
+            ('capture_mongodb_pool_connections', 'gauge', '连接池中的连接数', [
+                ({'state': 'open'}, sum(pool['open_connections'] for pool in pools)),
+                ({'state': 'checked_out'}, sum(pool['checked_out'] for pool in pools)),
+            ]),
+            ('capture_mongodb_unhealthy_clients', 'gauge', '健康检查失败的客户端数',
+             [({}, sum(1 for pool in pools if not pool['healthy']))]),
+            ('capture_query_cache_requests_total', 'counter', '列表查询缓存的命中与未命中',
+             [({'result': 'hit'}, cache['hits']), ({'result': 'miss'}, cache['misses'])]),
+            ('capture_query_cache_bytes', 'gauge', '列表查询缓存占用的内存', [({}, cache['bytes'])]),
+            ('capture_write_buffer_depth', 'gauge', '写后缓冲中等待写入的内容数', [({}, buffer['depth'])]),
+            ('capture_write_buffer_documents_total', 'counter', '写后缓冲处理的内容数', [
+                ({'result': 'written'}, buffer['written']),
+                ({'result': 'failed'}, buffer['failed']),
+                ({'result': 'rejected'}, buffer['rejected']),
+            ]),
+            ('capture_dedup_documents_total', 'counter', '写入时检查内容指纹的文档数及其中的重复', [
+                ({'result': 'unique'}, dedup['checked'] - dedup['duplicates']),
+                ({'result': 'merged'}, dedup['merged']),
+                ({'result': 'rejected'}, dedup['rejected']),
+                ({'result': 'referenced'}, dedup['referenced']),
+            ]),
+            ('capture_html_processing_depth', 'gauge', '等待后台 HTML 处理的内容数', [({}, processing['depth'])]),
+            ('capture_html_processing_in_flight', 'gauge', '正在处理的内容数', [({}, processing['in_flight'])]),
+            ('capture_html_processing_jobs_total', 'counter', '后台 HTML 处理的任务数', [
+                ({'result': 'processed'}, processing['processed']),
+                ({'result': 'skipped'}, processing['skipped']),
+                ({'result': 'failed'}, processing['failed']),
+                ({'result': 'dropped'}, processing['dropped']),
+            ]),
+            ('capture_html_processing_retries_total', 'counter', '后台 HTML 处理的重试次数',
+             [({}, processing['retries'])]),
+            ('capture_html_processing_bytes_total', 'counter', '处理前后的 html 字节数', [
+                ({'stage': 'in'}, processing['bytes_in']),
+                ({'stage': 'out'}, processing['bytes_out']),
+            ]),
+        ]
+
+    def get_html_processing_stats(self) -> Dict:
+        """获取后台 HTML 处理的队列和吞吐量统计"""
+        return self.html_processor.stats()
+
+    def get_dedup_stats(self) -> Dict:
+        """获取本进程写入时的去重统计"""
+        return self.dedup_stats.stats()
+
+    def get_collection_dedup_stats(self, token: str) -> Dict:
+        """统计令牌对应集合的去重情况（需要扫描整个集合）"""
+        connection = self.get_connection_by_token(token)
+        if not connection:
+            raise ValueError("无效的连接令牌")
+
+        db, collection = connection
+        with self._track_failures(token):
+            totals = next(collection.aggregate(DEDUP_STATS_PIPELINE), None) or {}
+            contents = self._contents_collection(collection).count_documents({})
+        return _collection_dedup_stats(self.dedup_mode, totals, contents)
+
+    def get_pool_stats(self) -> Dict:
+        """获取共享客户端及其连接池统计"""
+        return self.clients.stats()
+
+    def get_index_status(self, token: str) -> Dict:
+        """获取令牌对应集合的索引状态"""
+        connection = self.get_connection_by_token(token)
+        if not connection:
+            raise ValueError("无效的连接令牌")
+
+        conn = self.connections[self._collection_key(token)]
+        key = self._index_key(conn)
+        self.indexes.ensure(key, conn['collection'])
+        status = self.indexes.status(key)
+        status['collection'] = conn['collection'].full_name
+        status['similarity'] = self.similarity.status(self._collection_key(token))
+        return status
+
+    def rebuild_text_index(self, token: str) -> Dict:
+        """按 SEARCH_WEIGHTS 在后台重建令牌对应集合的全文索引，返回重建开始后的索引状态
+
+        已有索引正在建立时抛出 RuntimeError。
+        """
+        connection = self.get_connection_by_token(token)
+        if not connection:
+            raise ValueError("无效的连接令牌")
+
+        conn = self.connections[self._collection_key(token)]
+        key = self._index_key(conn)
+        if not self.indexes.rebuild_text_index(key, conn['collection']):
+            raise RuntimeError("索引正在建立，请稍后重试")
+        status = self.indexes.status(key)
+        status['collection'] = conn['collection'].full_name
+        return status
+
+    def close(self):
+        """写完缓冲中的内容后关闭所有数据库客户端"""
+        self.write_buffer.close()
+        self.html_processor.close()
+        self.indexes.shutdown()
+        self.similarity.shutdown()
+        self.clients.close_all()
+        self.connections.clear()
+
     def revoke_connection_token(self, token: str) -> bool:
         """撤销连接令牌"""
-        if token in self.connection_tokens:
-            self._remove_connection_by_token(token)
-            return True
-        return False
+        return self._remove_connection_by_token(token)
+
+    def _prepare_capture(self, data: Dict, partial: bool = False):
+        """写入前补充服务端生成的字段、外置和压缩大字段，partial 用于部分更新
+
+        超过阈值的正文移到 body_files 中等待上传，由 _insert_documents 或 update_capture 上传。
+        """
+        # 版本号、修改时间、去重和外置字段只由服务端维护
+        for field in SERVER_FIELDS:
+            data.pop(field, None)
+        fingerprint = None
+        if not partial:
+            data['_version'] = 1
+            data['updated_at'] = datetime.now(timezone.utc)
+            if self.dedup_mode != 'off':
+                fingerprint = content_hash(data)
+        if not partial or 'text' in data:
+            data['preview'] = make_preview(data.get('text'), self.preview_length)
+        self.bodies.split(data)
+        # reference 模式下相同的 html 共用一份，记录本身不要求唯一；外置的 html 不共用
+        if fingerprint and self.dedup_mode == 'reference':
+            if data.get('html'):
+                data['content_ref'] = fingerprint
+        elif fingerprint:
+            data['content_hash'] = fingerprint
+        self.codec.encode_document(data)
+
+    def _prepare_update(self, data: Dict) -> Dict:
+        """部分更新的更新文档，每次更新都会产生新版本，用于 ETag
+
+        不修改 data；外置的正文以 body_files.<字段> 出现在 $set 中，等待上传。
+        """
+        data = dict(data)
+        # 不允许更新_id
+        data.pop('_id', None)
+        self._prepare_capture(data, partial=True)
+        bodies = data.pop(BODY_FILES, {})
+        update = {
+            '$set': {**data, **{f'{BODY_FILES}.{field}': raw for field, raw in bodies.items()},
+                     'updated_at': datetime.now(timezone.utc)},
+            '$inc': {'_version': 1}
+        }
+        # 修改过内容的文档不再参与写入时去重；单独设置 html 后不再引用共享内容
+        unset = {}
+        if any(field in data or field in bodies for field in ('url', 'text', 'html')):
+            unset['content_hash'] = ''
+        # 新内容需要重新处理；只改 html 时保留 processed，以便重新提取由 html 得到的 text
+        if 'text' in data or 'text' in bodies:
+            unset['processed'] = ''
+        elif 'html' in data or 'html' in bodies:
+            update['$set']['processed.stale'] = True
+        if 'html' in data or 'html' in bodies:
+            unset['content_ref'] = ''
+        # 正文在文档内和外置之间切换时去掉另一处的旧值
+        for field in BODY_FIELDS:
+            if field in bodies:
+                unset[field] = ''
+            elif field in data:
+                unset[f'{BODY_FILES}.{field}'] = ''
+        if unset:
+            update['$unset'] = unset
+        return update
+
+    def create_capture(self, token: str, data: Dict, ack: str = 'durable') -> str:
+        """创建新的捕获内容
+
+        启用写后缓冲时先入队，由后台线程与其他请求合并写入：ack='durable' 等待写入完成，
+        ack='queued' 入队后立即返回预先生成的 _id（QueuedId）。未启用或队列已满时直接写入。
+        """
+        if ack not in ACK_MODES:
+            raise ValueError("无效的 ack 参数")
 
-    def create_capture(self, token: str, data: Dict) -> str:
-        """创建新的捕获内容"""
         connection = self.get_connection_by_token(token)
         if not connection:
             raise ValueError("无效的连接令牌")
@@ -147,38 +767,450 @@ class DatabaseService:
         db, collection = connection
         
         # 可以在这里添加更多的数据验证逻辑
+        self._prepare_capture(data)
         
-        result = collection.insert_one(data)
-        return str(result.inserted_id)
+        pending = self._buffer_capture(token, data, ack)
+        if pending is not None:
+            return pending.result() if ack == 'durable' else QueuedId(data['_id'])
+
+        return self._run(token, self._create_steps(token, collection, data))
+
+    def _create_steps(self, token: str, collection, data: Dict) -> Steps:
+        """直接写入一条已准备好的文档，返回 _id"""
+        errors, duplicates, delta = yield from self._insert_steps(collection, [data])
+        self._on_write(token)
+        yield from self._category_delta_steps(token, collection, delta)
+        if 0 in errors:
+            if 0 in duplicates:
+                raise DuplicateCapture(duplicates[0])
+            raise _write_error(errors[0])
+        if duplicates.get(0) is not None:
+            # merge：返回已有内容的 _id
+            return DuplicateId(duplicates[0])
+        self._index_similar(token, [data])
+        self._process_later(token, [data])
+        return DuplicateId(data['_id']) if 0 in duplicates else str(data['_id'])
+
+    def _insert_documents(self, collection, documents: List[Dict]) -> Tuple[Dict[int, Dict], Dict[int, Optional[str]], Counter]:
+        return run(self._insert_steps(collection, documents))
+
+    def _insert_steps(self, collection, documents: List[Dict]) -> Steps:
+        """无序 insert_many，并按 dedup_mode 处理内容指纹重复的文档
+
+        返回 (errors, duplicates, delta)：
+        - errors: 写入失败的序号及 bulk write 的错误详情；
+        - duplicates: 重复内容的序号及已有内容的 _id（reference 模式下为 None，记录照常写入）。
+          merge 模式下这些文档已合并到已有内容，不在 errors 中；reject 模式下同时在 errors 中；
+        - delta: 写入和合并带来的分类计数变化。
+        """
+        for doc in documents:
+            if doc.get(BODY_FILES):
+                yield from upload_steps(collection, doc[BODY_FILES])
+        shared = (yield from self._store_contents_steps(collection, documents)) if self.dedup_mode == 'reference' else set()
+        errors: Dict[int, Dict] = {}
+        try:
+            yield call(collection, 'insert_many', documents, ordered=False)
+        except BulkWriteError as e:
+            for error in e.details.get('writeErrors', []):
+                errors[error['index']] = error
+
+        duplicates: Dict[int, Optional[str]] = {index: None for index in shared if index not in errors}
+        delta = Counter()
+        for index, doc in enumerate(documents):
+            error = errors.get(index)
+            if error is None:
+                delta.update(_categories_of(doc))
+                continue
+            if error.get('code') != DUPLICATE_KEY_ERROR or not doc.get('content_hash'):
+                continue
+            if self.dedup_mode == 'merge':
+                existing = yield call(
+                    collection, 'find_one_and_update',
+                    {'content_hash': doc['content_hash']}, merge_update(doc, datetime.now(timezone.utc)),
+                    projection={'categories': 1},
+                    return_document=ReturnDocument.BEFORE
+                )
+            else:
+                existing = yield call(collection, 'find_one', {'content_hash': doc['content_hash']}, projection={'_id': 1})
+            if existing is None:
+                # 已有内容刚被删除，按写入失败处理
+                continue
+            duplicates[index] = str(existing['_id'])
+            if self.dedup_mode == 'merge':
+                del errors[index]
+                delta.update(_categories_of(doc) - _categories_of(existing))
+
+        # 写入失败的记录不再引用共享内容，写入失败或已合并的记录的外置正文不再需要
+        yield from self._release_contents_steps(collection, [documents[index]['content_ref'] for index in errors
+                                                             if documents[index].get('content_ref')])
+        yield from delete_steps(collection, _unsent_files(documents, errors, duplicates))
+        checked = sum(1 for doc in documents if doc.get('content_hash') or doc.get('content_ref'))
+        self.dedup_stats.record(checked, len(duplicates))
+        return errors, duplicates, delta
 
-    def get_captures(self, token: str, page: int = 1, limit: int = 20, category: Optional[str] = None, search: Optional[str] = None) -> Dict:
-        """获取捕获内容列表"""
+    def _contents_collection(self, collection):
+        """reference 模式下按指纹保存 html 的集合"""
+        return collection.database.get_collection(f"{collection.name}_contents")
+
+    def _store_contents_steps(self, collection, documents: List[Dict]) -> Steps:
+        """把带 content_ref 的文档的 html 移到内容集合，返回引用已有内容的文档序号"""
+        indexes = [index for index, doc in enumerate(documents) if doc.get('content_ref')]
+        if not indexes:
+            return set()
+        result = yield call(self._contents_collection(collection), 'bulk_write', [
+            UpdateOne({'_id': documents[index]['content_ref']},
+                      {'$setOnInsert': {'html': documents[index].pop('html')}, '$inc': {'refs': 1}},
+                      upsert=True)
+            for index in indexes
+        ], ordered=False)
+        return {index for op, index in enumerate(indexes) if op not in result.upserted_ids}
+
+    def _release_contents_steps(self, collection, refs: List[str]) -> Steps:
+        """减少共享内容的引用数，删除不再被引用的内容"""
+        if not refs:
+            return
+        contents = self._contents_collection(collection)
+        yield call(contents, 'bulk_write', [UpdateOne({'_id': ref}, {'$inc': {'refs': -1}}) for ref in refs], ordered=False)
+        yield call(contents, 'delete_many', {'_id': {'$in': refs}, 'refs': {'$lte': 0}})
+
+    def _attach_contents(self, collection, captures: List[Dict], fields: Optional[List[str]] = None):
+        run(self._attach_contents_steps(collection, captures, fields))
+
+    def _attach_contents_steps(self, collection, captures: List[Dict], fields: Optional[List[str]] = None) -> Steps:
+        """为引用共享内容的文档填入 html；fields 未包含 content_ref 时从结果中去掉"""
+        refs = {capture['content_ref'] for capture in captures
+                if capture.get('content_ref') and 'html' not in capture}
+        if refs:
+            found = yield fetch(self._contents_collection(collection), 'find', {'_id': {'$in': list(refs)}})
+            contents = {doc['_id']: doc.get('html') for doc in found}
+            for capture in captures:
+                if capture.get('content_ref') in contents and 'html' not in capture:
+                    capture['html'] = self.codec.decode_value(contents[capture['content_ref']])
+        if fields and 'content_ref' not in fields:
+            for capture in captures:
+                capture.pop('content_ref', None)
+
+    def _buffer_capture(self, token: str, data: Dict, ack: str = 'durable'):
+        """把已准备好的文档放入写后缓冲，返回 Future；未启用或队列已满时返回 None
+
+        写入目标（集合和集群）在入队时确定，并为每条文档持有一个客户端引用，
+        入队后令牌断开或过期不影响写入。
+        """
+        if not self.write_buffer.enabled:
+            return None
+        target = self._token_keys.get(token, touch=False)
+        if target is None:
+            return None
+        target = dict(target, token=token)
+        data['_id'] = ObjectId()
+        self.clients.acquire(target['cluster_uri'])
+        pending = self.write_buffer.submit(target['connection_key'], target, data, wait=ack == 'durable')
+        if pending is None:
+            self.clients.release(target['cluster_uri'])
+        return pending
+
+    def _flush_buffered(self, targets: List[Dict], documents: List[Dict]) -> Dict[int, Exception]:
+        """写后缓冲的批量写入，在缓冲的后台线程中调用
+
+        同一批文档属于同一集合，按入队时记录的目标写入，不再校验令牌。
+        返回写入失败的文档序号及对应异常。
+        """
+        target = targets[0]
+        token = target['token']
+        try:
+            # 令牌可能已过期，缓存键等按入队时的目标记录
+            self._remember_key(token, target)
+            db, collection = self._connect(target['mongo_uri'], target['collection_name'])
+            with self._track_failures(token):
+                errors, duplicates, delta = self._insert_documents(collection, documents)
+        finally:
+            for item in targets:
+                self.clients.release(item['cluster_uri'])
+        self._on_write(token)
+        self._apply_category_delta(token, collection, delta)
+
+        failures: Dict[int, Exception] = {}
+        written = []
+        for index, doc in enumerate(documents):
+            if index in errors:
+                failures[index] = DuplicateCapture(duplicates[index]) if index in duplicates else _write_error(errors[index])
+            elif duplicates.get(index) is not None:
+                # merge：等待写入的请求得到已有内容的 _id
+                doc['_id'] = DuplicateId(duplicates[index])
+            else:
+                written.append(doc)
+        self._index_similar(token, written)
+        self._process_later(token, written)
+        return failures
+
+    def create_captures(self, token: str, items: List[Dict]) -> List[Dict]:
+        """批量创建捕获内容
+
+        使用无序 insert_many 分块写入，单条失败不影响同块其他文档。
+        返回与输入顺序一致的结果列表，每项包含 id 或 error。
+        """
         connection = self.get_connection_by_token(token)
         if not connection:
             raise ValueError("无效的连接令牌")
         
         db, collection = connection
+
+        for item in items:
+            self._prepare_capture(item)
+
+        results: List[Dict] = []
+        delta = Counter()
+        written = []
+        for start in range(0, len(items), self.batch_chunk_size):
+            chunk = items[start:start + self.batch_chunk_size]
+            with self._track_failures(token):
+                # insert_many 会为每个文档就地生成 _id
+                errors, duplicates, chunk_delta = self._insert_documents(collection, chunk)
+            delta.update(chunk_delta)
+            for offset, doc in enumerate(chunk):
+                if offset in errors:
+                    if offset in duplicates:
+                        results.append({"error": "内容已存在", "duplicate_of": duplicates[offset]})
+                    else:
+                        results.append({"error": errors[offset].get('errmsg', '写入失败')})
+                elif duplicates.get(offset) is not None:
+                    results.append({"id": duplicates[offset], "duplicate": True})
+                else:
+                    results.append({"id": str(doc['_id']), **({"duplicate": True} if offset in duplicates else {})})
+                    written.append(doc)
+
+        if items:
+            self._on_write(token)
+            self._apply_category_delta(token, collection, delta)
+            self._index_similar(token, written)
+            self._process_later(token, written)
+        return results
+
+    def _process_later(self, token: str, documents: List[Dict]):
+        """把写入的内容交给后台 HTML 处理，不等待"""
+        if not self.html_processor.enabled:
+            return
+        for doc in documents:
+            if _has_body(doc):
+                self.html_processor.submit(token, str(doc['_id']))
+
+    def _load_for_processing(self, job) -> Optional[Dict]:
+        """读取待处理的内容（含共享和外置的正文），已处理、已删除或令牌失效时返回 None"""
+        token, capture_id = job
+        connection = self.get_connection_by_token(token)
+        if not connection:
+            return None
+
+        db, collection = connection
+        with self._track_failures(token):
+            capture = collection.find_one({'_id': ObjectId(capture_id)}, projection=dict.fromkeys(PROCESSING_FIELDS, 1))
+            processed = capture.get('processed') if capture else None
+            if capture is None or (processed and not processed.get('stale')):
+                return None
+            fields = BODY_FIELDS
+            if processed and processed.get('text_extracted'):
+                # text 是上次从旧 html 提取的，按新 html 重新提取
+                capture.pop('text', None)
+                fields = ('html',)
+            self.codec.decode_document(capture)
+            self._attach_contents(collection, [capture])
+            run(load_steps(collection, capture, fields))
+        return capture
+
+    def _store_processed(self, job, capture: Dict, result: Dict) -> bool:
+        """写回处理结果；读取之后内容被修改过时不写入，返回 False
+
+        与 update_capture 一样会外置大正文并产生新版本，但保留写入时的内容指纹：
+        处理结果来自同一份内容。引用共享内容的 html 不改写。
+        """
+        token, capture_id = job
+        connection = self.get_connection_by_token(token)
+        if not connection:
+            return False
+
+        db, collection = connection
+        data = {'text': result['text']}
+        if 'html' in result and not capture.get('content_ref'):
+            data['html'] = result['html']
+        update = self._prepare_update(data)
+        update['$set']['word_count'] = result['word_count']
+        update['$set'].pop('processed.stale', None)
+        update['$set']['processed'] = {
+            'processed_at': datetime.now(timezone.utc),
+            'text_extracted': result['text_extracted'],
+            'html_bytes_before': result.get('bytes_in', 0),
+            'html_bytes_after': result.get('bytes_out', 0),
+            'data_uris_removed': result.get('data_uris', 0),
+        }
+        for field in ('content_hash', 'content_ref', 'processed'):
+            update['$unset'].pop(field, None)
+        if not update['$unset']:
+            del update['$unset']
+
+        with self._track_failures(token):
+            run(upload_steps(collection, update['$set']))
+            before = collection.find_one_and_update(
+                {'_id': capture['_id'], '_version': capture.get('_version')}, update,
+                projection={BODY_FILES: 1},
+                return_document=ReturnDocument.BEFORE
+            )
+            if before is None:
+                run(delete_steps(collection, _uploaded_files(update)))
+                return False
+            run(delete_steps(collection, file_ids(before.get(BODY_FILES), [f for f in BODY_FIELDS if f in data])))
+        self._on_write(token)
+        if self._tracks_similar(token):
+            self._index_similar(token, [{'_id': capture['_id'], 'title': capture.get('title'), 'text': data['text']}])
+        return True
+
+    def get_captures(self, token: str, page: int = 1, limit: int = 20, category: Optional[str] = None, search: Optional[str] = None, cursor: Optional[str] = None, count: str = 'exact', view: str = 'summary', fields: Optional[List[str]] = None, sort: Optional[str] = None, highlight: bool = False) -> Dict:
+        """获取捕获内容列表
+
+        传入 cursor 时使用基于 _id 的游标分页（按 _id 倒序），每页代价恒定；
+        否则沿用旧的页码分页。
+
+        count 控制总数的计算方式：
+        - exact: 精确总数；只返回摘要字段时与当前页在同一次 $facet 聚合中返回，
+          否则另用 count_documents 计算
+        - estimated: 无过滤条件时使用 estimated_document_count，否则同 exact
+        - none: 不计算总数，total 为 None
+        命中计数缓存时只执行一次 find。
+
+        view 为 summary 时只返回 SUMMARY_FIELDS，full 返回完整文档；
+        fields 指定时优先于 view。
+
+        搜索时 sort 默认为 relevance，按 textScore 排序并返回 score；
+        highlight 为 True 时每条结果附带 highlights（标题和正文的高亮片段）。
+        """
+        sort, highlight = _list_args(count, view, search, cursor, sort, highlight)
+
+        connection = self.get_connection_by_token(token)
+        if not connection:
+            raise ValueError("无效的连接令牌")
+
+        db, collection = connection
+        return self._run(token, self._list_steps(token, collection, page, limit, category, search, cursor,
+                                                 count, view, fields, sort, highlight))
+
+    def _list_steps(self, token: str, collection, page: int, limit: int, category: Optional[str], search: Optional[str], cursor: Optional[str], count: str, view: str, fields: Optional[List[str]], sort: Optional[str], highlight: Optional[str]) -> Steps:
+        """列表查询，参数已由 _list_args 校验"""
+        query = _list_query(category, search)
+
+        # 相同查询在集合没有写入时直接返回缓存结果
+        collection_key = self._collection_key(token)
+        result_key = _list_key(page, limit, category, search, cursor, count, view, fields, sort, highlight)
+        generation = self.query_cache.generation(collection_key)
+        cached = self.query_cache.get(collection_key, result_key)
+        if cached is not None:
+            return cached
+
+        page_pipeline, facet_pipeline = self._list_pipelines(query, page, limit, cursor, view, fields, sort, highlight)
+        query_key = make_query_key(query)
+        total_count = None
+
+        if count != 'none':
+            count_generation = self.count_cache.generation(collection_key)
+            total_count = self.count_cache.get(collection_key, query_key)
+
+        if count == 'estimated' and not query and total_count is None:
+            total_count = yield call(collection, 'estimated_document_count')
+            self.count_cache.set(collection_key, count_generation, query_key, total_count)
+
+        if count == 'none' or total_count is not None:
+            captures = yield fetch(collection, 'aggregate', page_pipeline)
+        elif facet_pipeline is not None:
+            # 当前页与总数在一次往返中完成
+            result = (yield fetch(collection, 'aggregate', facet_pipeline))[0]
+            captures = result['captures']
+            total_count = result['total'][0]['n'] if result['total'] else 0
+            self.count_cache.set(collection_key, count_generation, query_key, total_count)
+        else:
+            captures = yield fetch(collection, 'aggregate', page_pipeline)
+            total_count = yield call(collection, 'count_documents', query)
+            self.count_cache.set(collection_key, count_generation, query_key, total_count)
+
+        if _wants_html(view, fields):
+            yield from self._attach_contents_steps(collection, captures, fields)
+
+        result = self._list_result(captures, total_count, page, limit, cursor, view, fields, highlight)
+        self.query_cache.set(collection_key, generation, result_key, result)
+        return result
+
+    def _list_pipelines(self, query: Dict, page: int, limit: int, cursor: Optional[str], view: str, fields: Optional[List[str]], sort: Optional[str] = None, highlight: Optional[str] = None) -> Tuple[list, Optional[list]]:
+        """列表查询的聚合管道，返回 (只取当前页, 当前页与总数)
+
+        $match 和按 _id 的排序位于最前以便使用索引；排序与 $skip/$limit 相邻，
+        按相关度排序时可以合并为只保留前 N 条的排序。游标模式多取一条用于判断是否还有下一页。
+        第二项只在返回摘要字段时提供：$project 位于 $facet 之前，$facet 的输出只含摘要；
+        返回 html/text 时为 None，整页正文放进一个文档可能超过 16MB 的上限，总数另行计算。
+        """
+        window = []
+        after = decode_cursor(cursor) if cursor is not None else None
+        if cursor is not None:
+            window.append({'$limit': limit + 1})
+        else:
+            # 计算要跳过的文档数
+            skip = (page - 1) * limit
+            if skip:
+                window.append({'$skip': skip})
+            window.append({'$limit': limit})
+
+        projection = self._list_projection(view, fields, HIGHLIGHT_FIELDS if highlight else ())
+        shape = [{'$project': projection}] if projection else []
+        if sort == 'relevance':
+            # 相关度相同时新的在前，保证分页稳定
+            order = [{'$sort': {'score': {'$meta': 'textScore'}, '_id': DESCENDING}}]
+            if projection:
+                projection['score'] = {'$meta': 'textScore'}
+            else:
+                shape = [{'$addFields': {'score': {'$meta': 'textScore'}}}]
+        elif cursor is not None or sort == 'newest':
+            order = [{'$sort': {'_id': DESCENDING}}]
+        else:
+            order = []
+
+        page_query = dict(query, _id={'$lt': after}) if after is not None else query
+        page_pipeline = [{'$match': page_query}, *order, *window, *shape]
+
+        if not projection or any(field in projection for field in BODY_FIELDS):
+            return page_pipeline, None
+        if sort == 'relevance':
+            # 投影后再排序，$facet 中按已投影的 score 只保留前 N 条
+            prefix, captures = [{'$match': query}, *shape], [{'$sort': {'score': DESCENDING, '_id': DESCENDING}}, *window]
+        else:
+            prefix, captures = [{'$match': query}, *order, *shape], window
+            if after is not None:
+                # 总数不受游标位置影响
+                captures = [{'$match': {'_id': {'$lt': after}}}, *captures]
+        facet_pipeline = prefix + [{
+            '$facet': {
+                'captures': captures,
+                'total': [{'$count': 'n'}]
+            }
+        }]
+        return page_pipeline, facet_pipeline
+
+    def _list_result(self, captures: List[Dict], total_count: Optional[int], page: int, limit: int, cursor: Optional[str], view: str = 'summary', fields: Optional[List[str]] = None, highlight: Optional[str] = None) -> Dict:
+        """把一页文档整理为列表响应，highlight 为要高亮的搜索串"""
+        next_cursor = None
+        if cursor is not None:
+            if len(captures) > limit:
+                captures = captures[:limit]
+                next_cursor = encode_cursor(captures[-1]['_id'])
         
-        query = {}
-        if category:
-            query['categories'] = {'$in': [category]}
-        if search:
-            query['$text'] = {'$search': search}
-        
-        # 计算要跳过的文档数
-        skip = (page - 1) * limit
-        
-        # 查询数据
-        cursor = collection.find(query).skip(skip).limit(limit)
-        captures = list(cursor)
-        
-        # 获取总数
-        total_count = collection.count_documents(query)
-        
-        # 转换ObjectId为字符串
         for capture in captures:
-            capture['_id'] = str(capture['_id'])
-            
+            self.codec.decode_document(capture)
+
+        if highlight:
+            self._add_highlights(captures, highlight, view, fields)
+
+        if cursor is not None:
+            return {
+                "captures": captures,
+                "total": total_count,
+                "limit": limit,
+                "next_cursor": next_cursor
+            }
         return {
             "captures": captures,
             "total": total_count,
@@ -186,72 +1218,375 @@ class DatabaseService:
             "limit": limit
         }
 
-    def get_capture(self, token: str, capture_id: str) -> Optional[Dict]:
-        """获取单个捕获内容"""
-        from bson.objectid import ObjectId
+    def export_captures(self, token: str, category: Optional[str] = None, search: Optional[str] = None, view: str = 'full', fields: Optional[List[str]] = None) -> Iterator[Dict]:
+        """导出所有匹配的捕获内容，返回逐条产出文档的迭代器
+
+        只使用一个游标，按 export_batch_size 批量取回，内存占用与集合大小无关。
+        令牌校验和第一批查询在调用时完成，错误能在开始输出前抛出。
+        """
+        if view not in LIST_VIEWS:
+            raise ValueError("无效的 view 参数")
+
         connection = self.get_connection_by_token(token)
         if not connection:
             raise ValueError("无效的连接令牌")
-        
+
         db, collection = connection
+
+        pipeline = [{'$match': _list_query(category, search)}]
+        if not search:
+            # 与列表相同的顺序，可以使用 _id 或分类索引，不需要内存排序
+            pipeline.append({'$sort': {'_id': DESCENDING}})
+        projection = self._list_projection(view, fields)
+        if projection:
+            pipeline.append({'$project': projection})
+
+        with self._track_failures(token):
+            cursor = collection.aggregate(pipeline, batchSize=self.export_batch_size)
+        return self._iter_export(token, cursor, collection, view, fields)
+
+    def _iter_export(self, token: str, cursor, collection, view: str, fields: Optional[List[str]]) -> Iterator[Dict]:
+        """逐条产出导出的文档
+
+        需要 html 时按批填入共享的 html；外置的正文逐条读回，
+        导出的文件因此与外置无关，可以直接导入其他实例。
+        """
+        html = _wants_html(view, fields)
+        bodies = _wanted_bodies(view, fields)
+        with cursor, self._track_failures(token):
+            batch = []
+            for capture in cursor:
+                self.codec.decode_document(capture)
+                batch.append(capture)
+                if len(batch) >= self.export_batch_size or not html:
+                    yield from self._export_batch(collection, batch, html, bodies, fields)
+                    batch = []
+            if batch:
+                yield from self._export_batch(collection, batch, html, bodies, fields)
+
+    def _export_batch(self, collection, batch: List[Dict], html: bool, bodies: Tuple[str, ...], fields: Optional[List[str]]) -> Iterator[Dict]:
+        if html:
+            self._attach_contents(collection, batch, fields)
+        for capture in batch:
+            if capture.get(BODY_FILES):
+                # 一次只读回一条的正文，内存占用与批大小无关
+                run(load_steps(collection, capture, bodies))
+                capture.pop(BODY_FILES)
+            yield capture
+
+    def _add_highlights(self, captures: List[Dict], search: str, view: str, fields: Optional[List[str]]):
+        """为每条结果生成高亮片段，并去掉只为生成片段而取回的字段"""
+        pattern = search_pattern(search)
+        returned = self._returned_fields(view, fields)
+        for capture in captures:
+            highlights = {}
+            title = highlight_text(capture.get('title'), pattern, self.snippet_length, whole=True)
+            if title:
+                highlights['title'] = title
+            text = highlight_text(capture.get('text'), pattern, self.snippet_length)
+            if text:
+                highlights['text'] = text
+            capture['highlights'] = highlights
+            if returned is not None:
+                for name in HIGHLIGHT_FIELDS:
+                    if name not in returned:
+                        capture.pop(name, None)
+
+    def _returned_fields(self, view: str, fields: Optional[List[str]]) -> Optional[Tuple[str, ...]]:
+        """响应中返回的字段，None 表示完整文档"""
+        if fields:
+            return tuple(fields)
+        if view == 'summary':
+            return SUMMARY_FIELDS
+        return None
+
+    def _list_projection(self, view: str, fields: Optional[List[str]], extra: Tuple[str, ...] = ()) -> Optional[Dict]:
+        """将 view/fields 映射为 $project，返回 None 表示完整文档；extra 为额外取回的字段"""
+        names = self._returned_fields(view, fields)
+        if names is None:
+            return None
+
+        projection = {name: 1 for name in (*names, *extra)}
+        if 'html' in projection:
+            # 引用共享内容的文档需要 content_ref 才能取回 html
+            projection['content_ref'] = 1
+        if any(field in projection for field in BODY_FIELDS):
+            # 外置的正文不返回，只返回引用和字节数
+            projection[BODY_FILES] = 1
+        if 'preview' in projection:
+            # 兼容没有 preview 字段的旧文档
+            projection['preview'] = {'$ifNull': [
+                '$preview',
+                {'$substrCP': [{'$ifNull': ['$text', '']}, 0, self.preview_length]}
+            ]}
+        return projection
+
+    def get_capture(self, token: str, capture_id: str, unless_version: Optional[int] = None, include: Tuple[str, ...] = ()):
+        """获取单个捕获内容
+
+        传入 unless_version 时，若文档当前版本与之相同则返回 NOT_MODIFIED，
+        此时不会读取文档内容。
+        外置到 GridFS 的正文只在 include 中列出时读回，否则只返回 body_files 中的引用。
+        """
+        connection = self.get_connection_by_token(token)
+        if not connection:
+            raise ValueError("无效的连接令牌")
         
-        try:
-            obj_id = ObjectId(capture_id)
-        except Exception:
-            raise ValueError("无效的 capture_id")
-            
-        capture = collection.find_one({"_id": obj_id})
+        db, collection = connection
+        obj_id = _object_id(capture_id)
+        return self._run(token, self._get_capture_steps(collection, obj_id, unless_version, include))
+
+    def _get_capture_steps(self, collection, obj_id: ObjectId, unless_version: Optional[int], include: Tuple[str, ...]) -> Steps:
+        query = {"_id": obj_id}
+        if unless_version is not None:
+            query.update(_version_differs(unless_version))
+
+        capture = yield call(collection, 'find_one', query)
+        if capture is None and unless_version is not None:
+            # 区分“未修改”和“不存在”，只取 _id
+            if (yield call(collection, 'find_one', {"_id": obj_id}, projection={"_id": 1})) is not None:
+                return NOT_MODIFIED
         if capture:
-            capture['_id'] = str(capture['_id'])
+            self.codec.decode_document(capture)
+            yield from self._attach_contents_steps(collection, [capture])
+            yield from load_steps(collection, capture, include)
         return capture
 
+    def open_body(self, token: str, capture_id: str, field: str = 'html'):
+        """打开单个内容的正文，用于流式返回和 Range 请求
+
+        返回 (capture, stream, length)：capture 只含 _version 和 updated_at，
+        stream 为可 seek 的文件对象，没有该字段时为 None。内容不存在时返回 None。
+        """
+        if field not in BODY_FIELDS:
+            raise ValueError("无效的字段")
+
+        connection = self.get_connection_by_token(token)
+        if not connection:
+            raise ValueError("无效的连接令牌")
+
+        db, collection = connection
+
+        obj_id = _object_id(capture_id)
+
+        projection = {field: 1, 'content_ref': 1, BODY_FILES: 1, '_version': 1, 'updated_at': 1}
+        with self._track_failures(token):
+            capture = collection.find_one({'_id': obj_id}, projection=projection)
+            if capture is None:
+                return None
+            ref = (capture.pop(BODY_FILES, None) or {}).get(field)
+            if isinstance(ref, dict):
+                stream = run(open_steps(collection, ref))
+                return capture, stream, ref['length'] if stream is not None else 0
+            self.codec.decode_document(capture)
+            if field == 'html':
+                self._attach_contents(collection, [capture])
+        value = capture.pop(field, None)
+        if not isinstance(value, str):
+            return capture, None, 0
+        raw = value.encode('utf-8')
+        return capture, io.BytesIO(raw), len(raw)
+
     def update_capture(self, token: str, capture_id: str, data: Dict) -> bool:
         """更新捕获内容"""
-        from bson.objectid import ObjectId
         connection = self.get_connection_by_token(token)
         if not connection:
             raise ValueError("无效的连接令牌")
         
         db, collection = connection
-        
-        try:
-            obj_id = ObjectId(capture_id)
-        except Exception:
-            raise ValueError("无效的 capture_id")
-            
-        # 不允许更新_id
-        if '_id' in data:
-            del data['_id']
-            
-        result = collection.update_one({'_id': obj_id}, {'$set': data})
-        return result.modified_count > 0
+        obj_id = _object_id(capture_id)
+        return self._run(token, self._update_steps(token, collection, obj_id, data))
+
+    def _update_steps(self, token: str, collection, obj_id: ObjectId, data: Dict) -> Steps:
+        update = self._prepare_update(data)
+        # 标题或正文变化时需要完整的新内容来更新相似度索引
+        reindex = ('title' in data or 'text' in data) and self._tracks_similar(token)
+        bodies = [field for field in BODY_FIELDS if field in data]
+
+        if 'categories' not in data and not bodies and not reindex:
+            result = yield call(collection, 'update_one', {'_id': obj_id}, update)
+            self._on_write(token)
+            return result.matched_count > 0
+
+        # 分类变化时需要旧值来更新计数，在同一次往返中取回更新前的文档；
+        # 设置 html 时需要旧的 content_ref 来释放共享内容，设置正文时需要旧的外置文件来删除
+        projection = {'categories': 1, 'content_ref': 1, BODY_FILES: 1}
+        if reindex:
+            projection.update(title=1, text=1)
+        yield from upload_steps(collection, update['$set'])
+        before = yield call(
+            collection, 'find_one_and_update',
+            {'_id': obj_id}, update,
+            projection=projection,
+            return_document=ReturnDocument.BEFORE
+        )
+        if before is None:
+            yield from delete_steps(collection, _uploaded_files(update))
+        else:
+            if 'html' in data and before.get('content_ref'):
+                yield from self._release_contents_steps(collection, [before['content_ref']])
+            yield from delete_steps(collection, file_ids(before.get(BODY_FILES), bodies))
+        self._on_write(token)
+        if before is None:
+            return False
+        if reindex:
+            self._index_similar(token, [_merge_similar_fields(before, data)])
+        if bodies:
+            self._process_later(token, [{'_id': obj_id, **data}])
+        if 'categories' in data:
+            delta = Counter(_categories_of(data))
+            delta.subtract(_categories_of(before))
+            yield from self._category_delta_steps(token, collection, delta)
+        return True
 
     def delete_capture(self, token: str, capture_id: str) -> bool:
         """删除捕获内容"""
-        from bson.objectid import ObjectId
         connection = self.get_connection_by_token(token)
         if not connection:
             raise ValueError("无效的连接令牌")
         
         db, collection = connection
-        
+        obj_id = _object_id(capture_id)
+        return self._run(token, self._delete_steps(token, collection, obj_id))
+
+    def _delete_steps(self, token: str, collection, obj_id: ObjectId) -> Steps:
+        deleted = yield call(collection, 'find_one_and_delete', {'_id': obj_id},
+                             projection={'categories': 1, 'content_ref': 1, BODY_FILES: 1})
+        if deleted is not None:
+            if deleted.get('content_ref'):
+                yield from self._release_contents_steps(collection, [deleted['content_ref']])
+            yield from delete_steps(collection, file_ids(deleted.get(BODY_FILES)))
+        self._on_write(token)
+        if deleted is None:
+            return False
+        delta = Counter()
+        delta.subtract(_categories_of(deleted))
+        yield from self._category_delta_steps(token, collection, delta)
+        self._unindex_similar(token, str(obj_id))
+        return True
+
+    def get_related(self, token: str, capture_id: str, limit: int = 10) -> Optional[Dict]:
+        """获取相关内容和近似重复的内容，内容不存在时返回 None
+
+        相似度索引未启用、正在建立或建立失败时抛出 SimilarityUnavailable。
+        """
+        connection = self.get_connection_by_token(token)
+        if not connection:
+            raise ValueError("无效的连接令牌")
+
+        db, collection = connection
+
         try:
             obj_id = ObjectId(capture_id)
         except Exception:
             raise ValueError("无效的 capture_id")
-            
-        result = collection.delete_one({'_id': obj_id})
-        return result.deleted_count > 0
+        capture_id = str(obj_id)
+
+        index = self.similarity.ensure(self._collection_key(token), collection)
+        entry = index.get(capture_id)
+        with self._track_failures(token):
+            if entry is None:
+                # 刚写入、尚未加入索引的内容直接计算
+                doc = collection.find_one({'_id': obj_id}, projection={'title': 1, 'text': 1})
+                if doc is None:
+                    return None
+                self.codec.decode_document(doc)
+                entry = analyze(doc.get('title'), doc.get('text'))
+            terms, signature = entry
+            related = index.related(terms, limit, exclude=capture_id)
+            duplicates = index.duplicates(signature, self.similarity.duplicate_threshold, limit, exclude=capture_id)
+            summaries = self._similar_summaries(token, collection, [capture_id] + [doc_id for doc_id, _ in related + duplicates])
+        if capture_id not in summaries:
+            return None
+        return {
+            "related": [{**summaries[doc_id], "score": score} for doc_id, score in related if doc_id in summaries],
+            "duplicates": [{**summaries[doc_id], "similarity": similarity}
+                           for doc_id, similarity in duplicates if doc_id in summaries],
+        }
 
-    def get_categories(self, token: str) -> list:
-        """获取所有分类"""
+    def find_duplicates(self, token: str, data: Dict, limit: int = 10) -> List[Dict]:
+        """查找与给定标题/正文近似重复的已有内容，用于保存前检查"""
         connection = self.get_connection_by_token(token)
         if not connection:
             raise ValueError("无效的连接令牌")
-        
+
         db, collection = connection
+
+        index = self.similarity.ensure(self._collection_key(token), collection)
+        terms, signature = analyze(data.get('title'), data.get('text'))
+        duplicates = index.duplicates(signature, self.similarity.duplicate_threshold, limit)
+        with self._track_failures(token):
+            summaries = self._similar_summaries(token, collection, [doc_id for doc_id, _ in duplicates])
+        return [{**summaries[doc_id], "similarity": similarity}
+                for doc_id, similarity in duplicates if doc_id in summaries]
+
+    def _similar_summaries(self, token: str, collection, ids: List[str]) -> Dict[str, Dict]:
+        """一次取回相似度结果的摘要；已在其他地方删除的内容同时从索引中移除"""
+        ids = list(dict.fromkeys(ids))
+        if not ids:
+            return {}
+        pipeline = [
+            {'$match': {'_id': {'$in': [ObjectId(doc_id) for doc_id in ids]}}},
+            {'$project': self._list_projection('summary', None)},
+        ]
+        summaries = {str(doc['_id']): self.codec.decode_document(doc) for doc in collection.aggregate(pipeline)}
+        for doc_id in ids:
+            if doc_id not in summaries:
+                self._unindex_similar(token, doc_id)
+        return summaries
+
+    def get_categories(self, token: str) -> Dict[str, int]:
+        """获取所有分类及每个分类的文档数"""
+        connection = self.get_connection_by_token(token)
+        if not connection:
+            raise ValueError("无效的连接令牌")
         
-        return collection.distinct('categories')
+        db, collection = connection
+        return self._run(token, self._categories_steps(token, collection))
+
+    def _categories_steps(self, token: str, collection) -> Steps:
+        collection_key = self._collection_key(token)
+        counts = self.category_cache.get(collection_key)
+        if counts is not None:
+            return counts
+
+        if self.category_counts_collection:
+            counts = yield from self._read_category_counts_steps(collection)
+        else:
+            counts = {doc['_id']: doc['count'] for doc in (yield fetch(collection, 'aggregate', CATEGORY_COUNT_PIPELINE))}
+        self.category_cache.set(collection_key, counts)
+        return counts
+
+    def _counts_collection(self, collection):
+        """物化的分类计数集合"""
+        return collection.database.get_collection(f"{collection.name}_category_counts")
+
+    def _read_category_counts_steps(self, collection) -> Steps:
+        """从物化集合读取分类计数，首次使用时由聚合结果生成"""
+        counts_collection = self._counts_collection(collection)
+        if (yield call(counts_collection, 'find_one', {'_id': CATEGORY_COUNTS_MARKER})) is None:
+            yield fetch(collection, 'aggregate', CATEGORY_COUNT_PIPELINE + [{'$out': counts_collection.name}])
+            yield call(counts_collection, 'insert_one', {'_id': CATEGORY_COUNTS_MARKER})
+            logger.info(f"已生成分类计数集合 {counts_collection.full_name}")
+        found = yield fetch(counts_collection, 'find', {'_id': {'$type': 'string'}, 'count': {'$gt': 0}})
+        return {doc['_id']: doc['count'] for doc in found}
+
+    def _apply_category_delta(self, token: str, collection, delta: Counter):
+        self._run(token, self._category_delta_steps(token, collection, delta))
+
+    def _category_delta_steps(self, token: str, collection, delta: Counter) -> Steps:
+        """把写入带来的分类计数变化同步到缓存和物化集合"""
+        delta = {category: change for category, change in delta.items() if change}
+        if not delta:
+            return
+        collection_key = self._collection_key(token)
+        if collection_key:
+            self.category_cache.apply(collection_key, delta)
+        if self.category_counts_collection:
+            yield call(self._counts_collection(collection), 'bulk_write', [
+                UpdateOne({'_id': category}, {'$inc': {'count': change}}, upsert=True)
+                for category, change in delta.items()
+            ], ordered=False)
 
 db_service = DatabaseService()
 
@@ -263,11 +1598,7 @@ def get_db_collection(mongo_uri, collection_name):
     return db, collection
 
 def close_db_connection(mongo_uri, collection_name):
+    # 客户端由注册表按集群共享和回收，这里只移除集合连接
     connection_key = db_service._get_connection_key(mongo_uri, collection_name)
-    if connection_key in db_service.connections:
-        try:
-            db_service.connections[connection_key]['client'].close()
-            del db_service.connections[connection_key]
-            logger.info(f"Closed MongoDB connection for {mongo_uri}")
-        except Exception as e:
-            logger.error(f"Error closing MongoDB connection: {e}")
\ No newline at end of file
+    if db_service.connections.pop(connection_key, None) is not None:
+        logger.info(f"Closed MongoDB connection for collection '{collection_name}'")
@@ -0,0 +1,89 @@
+"""
+写入时按内容指纹去重
+
+指纹是 url、规范化空白后的 text 和 html 的 SHA-256，存放在 content_hash 字段，
+由部分唯一索引保证同一集合中不重复。发现重复时按 DEDUP_MODE 处理：
+- reject: 拒绝写入，返回已有内容的 _id；
+- merge: 合并到已有内容（分类取并集，timestamp 取较新的），duplicate_count 加一；
+- reference: 照常创建记录，html 只在 <集合名>_contents 中保存一份，记录通过 content_ref 引用。
+"""
+import hashlib
+import threading
+from datetime import datetime
+from typing import Dict, Optional
+
+DEDUP_MODES = ('off', 'reject', 'merge', 'reference')
+DUPLICATE_KEY_ERROR = 11000
+
+
+class DuplicateCapture(Exception):
+    """reject 模式下内容已存在"""
+
+    def __init__(self, existing_id: str):
+        super().__init__("内容已存在")
+        self.existing_id = existing_id
+
+
+class DuplicateId(str):
+    """重复内容的 _id：merge 模式下是已有内容的 _id，reference 模式下是新记录的 _id"""
+
+
+def content_hash(doc: Dict) -> Optional[str]:
+    """内容指纹；text 和 html 都为空时返回 None（不参与去重）"""
+    url, text, html = doc.get('url'), doc.get('text'), doc.get('html')
+    text = ' '.join(text.split()) if isinstance(text, str) else ''
+    html = html if isinstance(html, str) else ''
+    if not text and not html:
+        return None
+    url = url.strip() if isinstance(url, str) else ''
+    return hashlib.sha256('\0'.join((url, text, html)).encode('utf-8')).hexdigest()
+
+
+def merge_update(doc: Dict, now: datetime) -> Dict:
+    """把重复的文档合并到已有文档的更新：分类取并集，timestamp 取较新的"""
+    update = {
+        '$set': {'updated_at': now},
+        '$inc': {'_version': 1, 'duplicate_count': 1},
+    }
+    categories = doc.get('categories')
+    if isinstance(categories, list) and categories:
+        update['$addToSet'] = {'categories': {'$each': categories}}
+    if doc.get('timestamp') is not None:
+        update['$max'] = {'timestamp': doc['timestamp']}
+    return update
+
+
+class DedupStats:
+    """本进程写入时的去重统计"""
+
+    def __init__(self, mode: str):
+        self.mode = mode
+        self._lock = threading.Lock()
+        self._checked = 0
+        self._merged = 0
+        self._rejected = 0
+        self._referenced = 0
+
+    def record(self, checked: int, duplicates: int):
+        """checked 为带指纹的文档数，duplicates 为其中重复的数量（按当前模式处理）"""
+        with self._lock:
+            self._checked += checked
+            if self.mode == 'merge':
+                self._merged += duplicates
+            elif self.mode == 'reject':
+                self._rejected += duplicates
+            elif self.mode == 'reference':
+                self._referenced += duplicates
+
+    def stats(self) -> Dict:
+        with self._lock:
+            duplicates = self._merged + self._rejected + self._referenced
+            return {
+                'mode': self.mode,
+                'checked': self._checked,
+                'duplicates': duplicates,
+                'merged': self._merged,
+                'rejected': self._rejected,
+                'referenced': self._referenced,
+                'ratio': round(duplicates / self._checked, 4) if self._checked else 0,
+            }
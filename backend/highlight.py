@@ -0,0 +1,92 @@
+import html
+import re
+from typing import List, Optional
+
+# $text 搜索串中的短语（"..."）和单词，- 开头的是排除词
+_SEARCH_TOKEN = re.compile(r'(-?)"([^"]+)"|(-?)(\S+)')
+# 粗略的英文词干：MongoDB 会对词做词干化，高亮时按词干前缀匹配
+_SUFFIXES = ('ing', 'ed', 'es', 's')
+
+MARK_OPEN = '<mark>'
+MARK_CLOSE = '</mark>'
+ELLIPSIS = '…'
+
+
+def _stem(word: str) -> str:
+    for suffix in _SUFFIXES:
+        if len(word) - len(suffix) >= 3 and word.endswith(suffix):
+            word = word[:-len(suffix)]
+            # running -> run
+            if suffix in ('ing', 'ed') and word[-1] == word[-2] and word[-1] not in 'lsz':
+                word = word[:-1]
+            return word
+    return word
+
+
+def search_pattern(search: str) -> Optional['re.Pattern']:
+    """把 $text 搜索串转换为用于高亮的正则，没有可高亮的词时返回 None
+
+    ASCII 单词按词首和词干前缀匹配（近似 MongoDB 的词干化），
+    其他文字（如中文）和短语按子串匹配，均不区分大小写。
+    """
+    parts = []
+    for negated_phrase, phrase, negated_word, word in _SEARCH_TOKEN.findall(search):
+        if phrase and not negated_phrase:
+            parts.append(r'\s+'.join(re.escape(w) for w in phrase.split()))
+        elif word and not negated_word:
+            word = word.strip('"')
+            if not word:
+                continue
+            if word.isascii() and word.isalnum():
+                parts.append(r'\b' + re.escape(_stem(word.lower())) + r'\w*')
+            else:
+                parts.append(re.escape(word))
+    if not parts:
+        return None
+    # 长的优先，避免短词截断较长的匹配
+    parts.sort(key=len, reverse=True)
+    return re.compile('|'.join(parts), re.IGNORECASE)
+
+
+def _mark(text: str, pattern: 're.Pattern') -> str:
+    """转义文本并用 <mark> 包裹匹配部分"""
+    pieces: List[str] = []
+    last = 0
+    for match in pattern.finditer(text):
+        if match.start() == match.end():
+            continue
+        pieces.append(html.escape(text[last:match.start()]))
+        pieces.append(MARK_OPEN + html.escape(match.group()) + MARK_CLOSE)
+        last = match.end()
+    pieces.append(html.escape(text[last:]))
+    return ''.join(pieces)
+
+
+def highlight(text, pattern: Optional['re.Pattern'], length: int, whole: bool = False) -> Optional[str]:
+    """返回包含第一个匹配的、不超过 length 个字符（不含标记）的高亮片段
+
+    文本中没有匹配时返回 None；whole=True 时不截取（用于标题）。
+    返回值已做 HTML 转义，可以直接插入页面。
+    """
+    if pattern is None or not isinstance(text, str):
+        return None
+    text = ' '.join(text.split())
+    match = pattern.search(text)
+    if match is None:
+        return None
+    if whole or len(text) <= length:
+        return _mark(text, pattern)
+
+    # 匹配位于片段前三分之一处，尽量在空白处截断
+    start = max(match.start() - length // 3, 0)
+    if start:
+        space = text.find(' ', start, match.start())
+        if space != -1:
+            start = space + 1
+    end = min(start + length, len(text))
+    if end < len(text):
+        space = text.rfind(' ', max(match.end(), start + length // 2), end)
+        if space != -1:
+            end = space
+    snippet = _mark(text[start:end], pattern)
+    return (ELLIPSIS if start else '') + snippet + (ELLIPSIS if end < len(text) else '')
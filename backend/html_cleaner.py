@@ -0,0 +1,170 @@
+"""
+捕获内容的 HTML 清理和正文提取
+
+只依赖标准库，在 html_processor 的工作进程中运行：
+- 去掉 script/style 等不可见或可执行的元素、注释、事件处理和 style 属性、data-* 等跟踪属性；
+- 去掉内嵌的 data: URI（base64 图片等）和 javascript: 链接；
+- 合并空白（pre/textarea 内除外）；
+- 规范化正文空白并统计词数（中日文按字计数）。
+"""
+import html
+import re
+import time
+from html.parser import HTMLParser
+from typing import Dict, List, Optional, Tuple
+
+# 连同内容一起去掉的元素
+DROP_ELEMENTS = frozenset(('script', 'style', 'noscript', 'template', 'iframe', 'object', 'embed',
+                           'applet', 'link', 'meta', 'base'))
+VOID_ELEMENTS = frozenset(('area', 'base', 'br', 'col', 'embed', 'hr', 'img', 'input', 'link', 'meta',
+                           'param', 'source', 'track', 'wbr'))
+# 保留原有空白的元素
+PREFORMATTED = frozenset(('pre', 'textarea'))
+# 提取正文时前后换行的元素
+BLOCK_ELEMENTS = frozenset(('address', 'article', 'aside', 'blockquote', 'br', 'dd', 'div', 'dl', 'dt',
+                            'figcaption', 'figure', 'footer', 'h1', 'h2', 'h3', 'h4', 'h5', 'h6',
+                            'header', 'hr', 'li', 'main', 'nav', 'ol', 'p', 'pre', 'section', 'table',
+                            'tr', 'ul'))
+# 值为 URL 的属性
+URL_ATTRIBUTES = frozenset(('href', 'src', 'srcset', 'poster', 'action', 'formaction', 'background', 'xlink:href'))
+# 跟踪和脚本用的属性，on* 和 data-* 另外处理
+DROP_ATTRIBUTES = frozenset(('style', 'ping', 'nonce', 'integrity', 'jsaction', 'jscontroller', 'jsname', 'jsmodel'))
+
+_WHITESPACE = re.compile(r'\s+')
+_INVISIBLE = re.compile('[\u200b\u200c\u200d\u2060\ufeff]')
+_BLANK_LINES = re.compile(r'\n{3,}')
+# 中日文每个字算一个词，其他文字按连续的字母数字计
+_CJK = '\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff'
+_WORD = re.compile(f'[{_CJK}]|[^\\W{_CJK}]+')
+
+
+def _drop_attribute(name: str, value: Optional[str]) -> Tuple[bool, bool]:
+    """返回 (是否去掉, 是否为 data: URI)"""
+    if name.startswith('on') or name.startswith('data-') or name in DROP_ATTRIBUTES:
+        return True, False
+    if name in URL_ATTRIBUTES and value:
+        lowered = value.strip().lower()
+        if lowered.startswith('javascript:'):
+            return True, False
+        if lowered.startswith('data:') or (name == 'srcset' and 'data:' in lowered):
+            return True, True
+    return False, False
+
+
+class _Cleaner(HTMLParser):
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.out: List[str] = []
+        self.text: List[str] = []
+        self.data_uris = 0
+        # 正在去掉的元素及其同名嵌套层数
+        self._skip: Optional[str] = None
+        self._skip_depth = 0
+        self._preformatted = 0
+
+    def _start(self, tag: str, attrs, closed: bool):
+        if self._skip is not None:
+            if tag == self._skip and not closed:
+                self._skip_depth += 1
+            return
+        if tag in DROP_ELEMENTS:
+            if tag not in VOID_ELEMENTS and not closed:
+                self._skip, self._skip_depth = tag, 1
+            return
+        parts = [tag]
+        for name, value in attrs:
+            drop, data_uri = _drop_attribute(name, value)
+            self.data_uris += data_uri
+            if drop:
+                continue
+            parts.append(name if value is None else f'{name}="{html.escape(value, quote=True)}"')
+        self.out.append('<' + ' '.join(parts) + ('/>' if closed and tag not in VOID_ELEMENTS else '>'))
+        if tag in PREFORMATTED and not closed:
+            self._preformatted += 1
+        if tag in BLOCK_ELEMENTS:
+            self.text.append('\n')
+
+    def handle_starttag(self, tag, attrs):
+        self._start(tag, attrs, False)
+
+    def handle_startendtag(self, tag, attrs):
+        self._start(tag, attrs, True)
+
+    def handle_endtag(self, tag):
+        if self._skip is not None:
+            if tag == self._skip:
+                self._skip_depth -= 1
+                if not self._skip_depth:
+                    self._skip = None
+            return
+        if tag in DROP_ELEMENTS or tag in VOID_ELEMENTS:
+            return
+        self.out.append(f'</{tag}>')
+        if tag in PREFORMATTED and self._preformatted:
+            self._preformatted -= 1
+        if tag in BLOCK_ELEMENTS:
+            self.text.append('\n')
+
+    def handle_data(self, data):
+        if self._skip is not None:
+            return
+        self.text.append(data)
+        if not self._preformatted:
+            data = _WHITESPACE.sub(' ', data)
+        self.out.append(html.escape(data, quote=False))
+
+    def handle_decl(self, decl):
+        if self._skip is None:
+            self.out.append(f'<!{decl}>')
+
+    # 注释、处理指令和无法识别的声明都去掉
+    def handle_comment(self, data):
+        pass
+
+    def handle_pi(self, data):
+        pass
+
+    def unknown_decl(self, data):
+        pass
+
+
+def clean_html(source: str) -> Tuple[str, str, int]:
+    """清理并压缩 HTML，返回 (html, 提取的正文, 去掉的 data: URI 数)"""
+    cleaner = _Cleaner()
+    cleaner.feed(source)
+    cleaner.close()
+    return ''.join(cleaner.out).strip(), normalize_text(''.join(cleaner.text)), cleaner.data_uris
+
+
+def normalize_text(text: str) -> str:
+    """每行内合并空白，去掉零宽字符，连续空行最多保留一行"""
+    text = _INVISIBLE.sub('', text.replace('\r\n', '\n').replace('\r', '\n'))
+    lines = (' '.join(line.split()) for line in text.split('\n'))
+    return _BLANK_LINES.sub('\n\n', '\n'.join(lines)).strip()
+
+
+def count_words(text: str) -> int:
+    return sum(1 for _ in _WORD.finditer(text))
+
+
+def process_capture(source_html: Optional[str], text: Optional[str]) -> Dict:
+    """工作进程中执行的处理
+
+    返回清理后的 html（没有 html 时不含该键）、规范化的 text（text 为空时从 html 提取，
+    text_extracted 为 True）、词数和统计信息。
+    """
+    start = time.perf_counter()
+    result: Dict = {}
+    extracted = ''
+    if isinstance(source_html, str) and source_html:
+        cleaned, extracted, data_uris = clean_html(source_html)
+        result['html'] = cleaned
+        result['bytes_in'] = len(source_html.encode('utf-8'))
+        result['bytes_out'] = len(cleaned.encode('utf-8'))
+        result['data_uris'] = data_uris
+    result['text_extracted'] = not (isinstance(text, str) and text.strip())
+    text = extracted if result['text_extracted'] else normalize_text(text)
+    result['text'] = text
+    result['word_count'] = count_words(text)
+    result['seconds'] = time.perf_counter() - start
+    return result
@@ -0,0 +1,221 @@
+import atexit
+import logging
+import multiprocessing
+import queue
+import threading
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Callable, Dict, Optional, Tuple
+
+from html_cleaner import process_capture
+from metrics import html_processing_duration
+
+logger = logging.getLogger(__name__)
+
+# 吞吐量按最近多少秒内完成的数量计算
+THROUGHPUT_WINDOW = 60.0
+
+Job = Tuple[str, str]
+
+
+class HtmlProcessor:
+    """写入后的 HTML 处理：清理和压缩 html、提取正文和词数，在有界的进程池中执行
+
+    submit() 只把 (token, capture_id) 放入有界队列，不等待处理，请求耗时与内容大小无关。
+    workers 个后台线程各自取出任务：load(job) 读取内容，返回 None 表示不需要处理；
+    html_cleaner.process_capture 在工作进程中执行；store(job, capture, result) 写回结果，
+    返回 False 表示内容在处理期间被修改，此时丢弃结果并立即重新读取处理。
+    失败时按 retry_delay 指数退避重试，与修改冲突合计最多 max_retries 次。
+    队列已满或关闭时丢弃任务，内容保持原样。
+    """
+
+    def __init__(self, load: Callable[[Job], Optional[Dict]], store: Callable[[Job, Dict, Dict], bool],
+                 workers: int, queue_size: int, max_retries: int, retry_delay: float):
+        self._load = load
+        self._store = store
+        self.workers = workers
+        self.queue_size = queue_size
+        self.max_retries = max_retries
+        self.retry_delay = retry_delay
+        self._queue: 'queue.Queue[Optional[Tuple[Job, float]]]' = queue.Queue(max(queue_size, 1))
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._threads = []
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self._in_flight = 0
+        self._submitted = 0
+        self._processed = 0
+        self._skipped = 0
+        self._failed = 0
+        self._dropped = 0
+        self._retries = 0
+        self._bytes_in = 0
+        self._bytes_out = 0
+        self._data_uris = 0
+        self._process_seconds = 0.0
+        self._max_process_seconds = 0.0
+        self._wait_seconds = 0.0
+        self._completed = deque()
+
+    @property
+    def enabled(self) -> bool:
+        return self.workers > 0 and not self._stop.is_set()
+
+    def submit(self, token: str, capture_id: str) -> bool:
+        """把内容加入处理队列，队列已满或未启用时返回 False"""
+        if not self.enabled:
+            return False
+        with self._lock:
+            if not self._threads:
+                self._start()
+            try:
+                self._queue.put_nowait(((token, capture_id), time.monotonic()))
+            except queue.Full:
+                self._dropped += 1
+                return False
+            self._submitted += 1
+            return True
+
+    def _start(self):
+        for index in range(self.workers):
+            thread = threading.Thread(target=self._run, name=f'html-processor-{index}', daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        atexit.register(self.close)
+
+    def _get_pool(self) -> ProcessPoolExecutor:
+        with self._lock:
+            if self._stop.is_set():
+                raise RuntimeError("HTML 处理已停止")
+            if self._pool is None:
+                # spawn 而不是 fork：父进程中有 MongoDB 客户端的后台线程
+                self._pool = ProcessPoolExecutor(self.workers, mp_context=multiprocessing.get_context('spawn'))
+            return self._pool
+
+    def _reset_pool(self, pool: ProcessPoolExecutor):
+        """工作进程异常退出后进程池不可再用，换一个新的"""
+        with self._lock:
+            if self._pool is pool:
+                self._pool = None
+        pool.shutdown(wait=False, cancel_futures=True)
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            if item is None or self._stop.is_set():
+                return
+            job, queued_at = item
+            with self._lock:
+                self._in_flight += 1
+                self._wait_seconds += time.monotonic() - queued_at
+            try:
+                self._handle(job)
+            finally:
+                with self._lock:
+                    self._in_flight -= 1
+
+    def _handle(self, job: Job):
+        error = None
+        for attempt in range(self.max_retries + 1):
+            error = None
+            try:
+                capture = self._load(job)
+                if capture is None:
+                    self._record('skipped')
+                    return
+                pool = self._get_pool()
+                try:
+                    result = pool.submit(process_capture, capture.get('html'), capture.get('text')).result()
+                except BrokenProcessPool:
+                    self._reset_pool(pool)
+                    raise
+                html_processing_duration.observe(result['seconds'])
+                if self._store(job, capture, result):
+                    self._record('processed', result)
+                    return
+            except Exception as e:
+                error = e
+            if attempt == self.max_retries:
+                break
+            with self._lock:
+                self._retries += 1
+            # 修改冲突立即重试；关闭时不再等待
+            if error is not None and self._stop.wait(self.retry_delay * 2 ** attempt):
+                break
+        if error is None:
+            logger.warning(f"内容 {job[1]} 处理期间反复被修改，已放弃")
+            self._record('skipped')
+        else:
+            logger.error(f"处理内容 {job[1]} 失败: {error}")
+            self._record('failed')
+
+    def _record(self, outcome: str, result: Optional[Dict] = None):
+        now = time.monotonic()
+        with self._lock:
+            if outcome == 'processed':
+                self._processed += 1
+                self._bytes_in += result.get('bytes_in', 0)
+                self._bytes_out += result.get('bytes_out', 0)
+                self._data_uris += result.get('data_uris', 0)
+                self._process_seconds += result['seconds']
+                self._max_process_seconds = max(self._max_process_seconds, result['seconds'])
+                self._completed.append(now)
+            elif outcome == 'skipped':
+                self._skipped += 1
+            else:
+                self._failed += 1
+
+    def close(self, timeout: Optional[float] = None):
+        """停止接收新任务，丢弃队列中尚未开始的任务，等待正在处理的完成"""
+        with self._lock:
+            if self._stop.is_set():
+                return
+            self._stop.set()
+            threads, pool = self._threads, self._pool
+        dropped = 0
+        while True:
+            try:
+                if self._queue.get_nowait() is not None:
+                    dropped += 1
+            except queue.Empty:
+                break
+        for _ in threads:
+            self._queue.put(None)
+        for thread in threads:
+            thread.join(timeout)
+        if pool is not None:
+            pool.shutdown(wait=True, cancel_futures=True)
+        with self._lock:
+            self._dropped += dropped
+        if threads:
+            logger.info(f"HTML 处理已停止（丢弃队列中的 {dropped} 条）")
+
+    def stats(self) -> Dict:
+        with self._lock:
+            now = time.monotonic()
+            while self._completed and now - self._completed[0] > THROUGHPUT_WINDOW:
+                self._completed.popleft()
+            started = self._processed + self._skipped + self._failed + self._in_flight
+            return {
+                'enabled': self.workers > 0,
+                'closed': self._stop.is_set(),
+                'workers': self.workers,
+                'depth': self._queue.qsize(),
+                'capacity': self.queue_size,
+                'in_flight': self._in_flight,
+                'submitted': self._submitted,
+                'processed': self._processed,
+                'skipped': self._skipped,
+                'failed': self._failed,
+                'dropped': self._dropped,
+                'retries': self._retries,
+                'per_second': round(len(self._completed) / THROUGHPUT_WINDOW, 2),
+                'avg_process_ms': round(self._process_seconds / self._processed * 1000, 2) if self._processed else 0,
+                'max_process_ms': round(self._max_process_seconds * 1000, 2),
+                'avg_wait_ms': round(self._wait_seconds / started * 1000, 2) if started else 0,
+                'bytes_in': self._bytes_in,
+                'bytes_out': self._bytes_out,
+                'data_uris_removed': self._data_uris,
+            }
@@ -0,0 +1,183 @@
+import logging
+import secrets
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# 每个任务最多保留的错误明细
+MAX_REPORTED_ERRORS = 100
+
+
+class CountingReader:
+    """包装请求体流，统计已读取的字节数"""
+
+    def __init__(self, stream):
+        self.stream = stream
+        self.bytes_read = 0
+
+    def read(self, size: int = -1) -> bytes:
+        data = self.stream.read(size)
+        self.bytes_read += len(data)
+        return data
+
+
+class ImportJob:
+    """一次导入的进度
+
+    offset 是已确认处理完的记录数（写入成功或被拒绝），失败后带上
+    offset 重新提交同一个文件即可从该处继续。
+    """
+
+    def __init__(self, job_id: str, owner: str, offset: int = 0):
+        self.id = job_id
+        self.owner = owner
+        self.start_offset = offset
+        self.offset = offset
+        self.inserted = 0
+        self.failed = 0
+        self.duplicates = 0
+        self.errors: List[Dict] = []
+        self.state = 'running'
+        self.message: Optional[str] = None
+        self.reader: Optional[CountingReader] = None
+        self.started_at = time.time()
+        self.finished_at: Optional[float] = None
+        self._lock = threading.Lock()
+
+    def _record_errors(self, errors: List[Tuple[int, str]]):
+        self.failed += len(errors)
+        room = MAX_REPORTED_ERRORS - len(self.errors)
+        self.errors.extend({"index": index, "error": error} for index, error in errors[:room])
+
+    def commit(self, end: int, inserted: int, errors: List[Tuple[int, str]], duplicates: int = 0):
+        """一批记录处理完毕，offset 前移到 end；duplicates 为其中内容重复的记录数"""
+        with self._lock:
+            self.offset = end
+            self.inserted += inserted
+            self.duplicates += duplicates
+            self._record_errors(errors)
+
+    def finish(self, state: str, message: Optional[str] = None):
+        with self._lock:
+            self.state = state
+            self.message = message
+            self.finished_at = time.time()
+
+    def to_dict(self) -> Dict:
+        with self._lock:
+            elapsed = (self.finished_at or time.time()) - self.started_at
+            processed = self.offset - self.start_offset
+            bytes_read = self.reader.bytes_read if self.reader else 0
+            return {
+                "job_id": self.id,
+                "state": self.state,
+                "message": self.message,
+                "offset": self.offset,
+                "processed": processed,
+                "inserted": self.inserted,
+                "failed": self.failed,
+                "duplicates": self.duplicates,
+                "errors": list(self.errors),
+                "bytes_read": bytes_read,
+                "elapsed": round(elapsed, 3),
+                "records_per_second": round(processed / elapsed, 1) if elapsed > 0 else None,
+                "bytes_per_second": round(bytes_read / elapsed) if elapsed > 0 else None,
+            }
+
+
+class ImportRegistry:
+    """保留最近的导入任务以便查询进度，只在本进程内可见"""
+
+    def __init__(self, max_jobs: int = 100):
+        self.max_jobs = max_jobs
+        self._lock = threading.Lock()
+        self._jobs: 'OrderedDict[str, ImportJob]' = OrderedDict()
+
+    def start(self, owner: str, job_id: Optional[str] = None, offset: int = 0) -> ImportJob:
+        job = ImportJob(job_id or secrets.token_hex(8), owner, offset)
+        with self._lock:
+            current = self._jobs.get(job.id)
+            if current is not None and current.state == 'running':
+                raise ValueError("同名导入任务正在进行")
+            self._jobs[job.id] = job
+            self._jobs.move_to_end(job.id)
+            while len(self._jobs) > self.max_jobs:
+                self._jobs.popitem(last=False)
+        return job
+
+    def get(self, job_id: str, owner: str) -> Optional[ImportJob]:
+        with self._lock:
+            job = self._jobs.get(job_id)
+        if job is None or job.owner != owner:
+            return None
+        return job
+
+
+def _batches(records: Iterable[Tuple[Optional[Dict], Optional[str]]], start: int,
+             validate: Callable, batch_size: int, batch_bytes: int):
+    """把记录流切成批次，产出 (结束位置, [(序号, 记录)], [(序号, 错误)])
+
+    批次按条数和估算字节数（记录的字符串长度之和）双重限制。
+    """
+    index = start
+    valid, errors, size = [], [], 0
+    for record, error in records:
+        if error is None:
+            error = validate(record)
+        if error is None:
+            valid.append((index, record))
+            size += len(str(record))
+        else:
+            errors.append((index, error))
+        index += 1
+        if len(valid) >= batch_size or size >= batch_bytes:
+            yield index, valid, errors
+            valid, errors, size = [], [], 0
+    if valid or errors:
+        yield index, valid, errors
+
+
+def run_import(job: ImportJob, records, validate: Callable, insert: Callable[[List[Dict]], List[Dict]],
+               batch_size: int, batch_bytes: int):
+    """按批写入记录，并更新 job 的进度
+
+    解析下一批与写入上一批并行，但同时最多只有一批在写入：写入跟不上时
+    不再读取请求体，由 TCP 流控把压力传回客户端，内存占用不超过两批。
+    写入失败时停止，job.offset 停在最后一个写入成功的批次之后。
+    """
+    def write(end, valid, errors):
+        results = insert([record for _, record in valid]) if valid else []
+        inserted = duplicates = 0
+        for (index, _), result in zip(valid, results):
+            if result.get('duplicate') or 'duplicate_of' in result:
+                duplicates += 1
+            if 'error' in result:
+                errors.append((index, result['error']))
+            else:
+                inserted += 1
+        errors.sort()
+        job.commit(end, inserted, errors, duplicates)
+
+    with ThreadPoolExecutor(max_workers=1, thread_name_prefix='import-writer') as writer:
+        pending = None
+        try:
+            for batch in _batches(records, job.offset, validate, batch_size, batch_bytes):
+                if pending is not None:
+                    pending.result()
+                pending = writer.submit(write, *batch)
+            if pending is not None:
+                pending.result()
+        except Exception as e:
+            if pending is not None and not pending.done():
+                # 等待正在写入的批次结束，保证 offset 准确
+                try:
+                    pending.result()
+                except Exception:
+                    pass
+            job.finish('failed', str(e))
+            raise
+    job.finish('completed')
@@ -0,0 +1,223 @@
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional
+
+from pymongo import ASCENDING, DESCENDING, TEXT
+from pymongo.errors import OperationFailure
+
+logger = logging.getLogger(__name__)
+
+# drop_index 时索引已不存在
+INDEX_NOT_FOUND = 27
+
+# 全文索引默认的字段权重：标题命中比正文更相关
+DEFAULT_TEXT_WEIGHTS = {'title': 10, 'text': 1}
+
+# 按查询负载声明的索引，options 会传给 create_index
+INDEX_SPECS: List[Dict] = [
+    # 全文搜索
+    {'name': 'title_text_text', 'keys': [('title', TEXT), ('text', TEXT)],
+     'options': {'weights': DEFAULT_TEXT_WEIGHTS}},
+    # 按分类筛选 + 游标分页
+    {'name': 'categories_1__id_-1', 'keys': [('categories', ASCENDING), ('_id', DESCENDING)]},
+    # 按时间排序
+    {'name': 'timestamp_-1', 'keys': [('timestamp', DESCENDING)]},
+    # 按 url 查找
+    {'name': 'url_1', 'keys': [('url', ASCENDING)]},
+    # 写入时去重的内容指纹，只约束带指纹的文档
+    {'name': 'content_hash_1', 'keys': [('content_hash', ASCENDING)],
+     'options': {'unique': True, 'partialFilterExpression': {'content_hash': {'$exists': True}}}},
+]
+
+
+def parse_weights(value: str) -> Dict[str, int]:
+    """解析 "title:10,text:1" 形式的全文索引权重"""
+    weights = {}
+    for item in value.split(','):
+        field, _, weight = item.partition(':')
+        if field.strip():
+            weights[field.strip()] = int(weight or 1)
+    return weights
+
+
+def index_specs(text_weights: Optional[Dict[str, int]] = None) -> List[Dict]:
+    """INDEX_SPECS，全文索引使用给定的字段权重"""
+    if not text_weights:
+        return INDEX_SPECS
+    specs = []
+    for spec in INDEX_SPECS:
+        if _is_text(spec):
+            spec = {**spec, 'keys': [(field, TEXT) for field in text_weights],
+                    'options': {**spec.get('options', {}), 'weights': dict(text_weights)}}
+        specs.append(spec)
+    return specs
+
+
+def _is_text(spec: Dict) -> bool:
+    return any(direction == TEXT for _, direction in spec['keys'])
+
+
+def _text_index(existing: List[Dict]) -> Optional[Dict]:
+    # 每个集合只能有一个全文索引
+    return next((index for index in existing if '_fts' in index['key']), None)
+
+
+def _text_weights(index: Dict) -> Dict[str, int]:
+    return dict(index.get('weights', {}))
+
+
+def _index_exists(spec: Dict, existing: List[Dict]) -> bool:
+    """按键定义判断索引是否已存在（同名但定义不同的不算）"""
+    if _is_text(spec):
+        index = _text_index(existing)
+        if index is None:
+            return False
+        weights = spec.get('options', {}).get('weights')
+        return not weights or _text_weights(index) == weights
+    keys = [(field, direction) for field, direction in spec['keys']]
+    return any(list(index['key'].items()) == keys for index in existing)
+
+
+class IndexManager:
+    """在后台为集合建立所需的索引
+
+    每个集群上的集合只检查一次，结果缓存在内存中；建立过程在后台线程中进行，
+    不阻塞 /database/connect。失败的集合在 retry_interval 秒后再次尝试。
+    已有的全文索引字段或权重与配置不同时只报告为 mismatch，不会自动删除，
+    由 rebuild_text_index 显式重建。
+    """
+
+    def __init__(self, specs: List[Dict] = INDEX_SPECS, max_workers: int = 2, retry_interval: int = 60):
+        self.specs = specs
+        self.retry_interval = retry_interval
+        self._lock = threading.Lock()
+        self._status: Dict[str, Dict] = {}
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='index-builder')
+
+    def ensure(self, key: str, collection):
+        """确保集合的索引已安排建立，已知或正在建立时立即返回"""
+        with self._lock:
+            status = self._status.get(key)
+            if status is not None:
+                retry = (status['state'] == 'failed'
+                         and time.time() - status['updated_at'] > self.retry_interval)
+                if not retry:
+                    return
+            self._status[key] = {
+                'state': 'building',
+                'indexes': {spec['name']: 'pending' for spec in self.specs},
+                'updated_at': time.time(),
+            }
+        self._executor.submit(self._build, key, collection)
+
+    def _build(self, key: str, collection):
+        indexes = {}
+        failed = False
+        mismatch = None
+        try:
+            existing = list(collection.list_indexes())
+        except Exception as e:
+            logger.error(f"读取索引失败 {collection.full_name}: {e}")
+            existing = None
+            failed = True
+
+        for spec in self.specs:
+            if existing is None:
+                indexes[spec['name']] = 'unknown'
+                continue
+            if _index_exists(spec, existing):
+                indexes[spec['name']] = 'exists'
+                continue
+            if _is_text(spec) and _text_index(existing) is not None:
+                # 删除重建期间搜索不可用，多个 worker 同时重建还会互相冲突，只报告差异
+                old = _text_index(existing)
+                indexes[spec['name']] = 'mismatch'
+                mismatch = {'index': old['name'], 'weights': _text_weights(old),
+                            'expected': spec.get('options', {}).get('weights')}
+                logger.warning(f"{collection.full_name} 的全文索引 {old['name']} 与配置的权重不同，"
+                               f"需要通过 /api/admin/indexes/rebuild 重建")
+                continue
+            failed |= not self._create(collection, spec, indexes)
+
+        with self._lock:
+            self._status[key] = {
+                'state': 'failed' if failed else 'ready',
+                'indexes': indexes,
+                'updated_at': time.time(),
+            }
+            if mismatch is not None:
+                self._status[key]['text_index_mismatch'] = mismatch
+
+    def _create(self, collection, spec: Dict, indexes: Dict) -> bool:
+        try:
+            collection.create_index(spec['keys'], name=spec['name'], **spec.get('options', {}))
+        except Exception as e:
+            indexes[spec['name']] = f"failed: {e}"
+            logger.error(f"建立索引 {spec['name']} 失败: {e}")
+            return False
+        indexes[spec['name']] = 'created'
+        logger.info(f"已为 {collection.full_name} 建立索引 {spec['name']}")
+        return True
+
+    def rebuild_text_index(self, key: str, collection) -> bool:
+        """按配置的权重删除并重建全文索引，重建期间搜索不可用；正在建立时返回 False"""
+        with self._lock:
+            status = self._status.get(key)
+            if status is not None and status['state'] == 'building':
+                return False
+            indexes = dict(status['indexes']) if status else {}
+            indexes.update({spec['name']: 'pending' for spec in self.specs if _is_text(spec)})
+            self._status[key] = {'state': 'building', 'indexes': indexes, 'updated_at': time.time()}
+        self._executor.submit(self._rebuild_text, key, collection, indexes)
+        return True
+
+    def _rebuild_text(self, key: str, collection, indexes: Dict):
+        failed = False
+        for spec in self.specs:
+            if not _is_text(spec):
+                continue
+            try:
+                existing = list(collection.list_indexes())
+                if _index_exists(spec, existing):
+                    # 其他进程已经按相同的权重重建
+                    indexes[spec['name']] = 'exists'
+                    continue
+                old = _text_index(existing)
+                if old is not None:
+                    logger.warning(f"正在重建 {collection.full_name} 的全文索引 {old['name']}")
+                    try:
+                        collection.drop_index(old['name'])
+                    except OperationFailure as e:
+                        if e.code != INDEX_NOT_FOUND:
+                            raise
+            except Exception as e:
+                indexes[spec['name']] = f"failed: {e}"
+                failed = True
+                logger.error(f"重建索引 {spec['name']} 失败: {e}")
+                continue
+            if self._create(collection, spec, indexes):
+                indexes[spec['name']] = 'rebuilt'
+            else:
+                failed = True
+
+        with self._lock:
+            self._status[key] = {
+                'state': 'failed' if failed else 'ready',
+                'indexes': indexes,
+                'updated_at': time.time(),
+            }
+
+    def status(self, key: str) -> Optional[Dict]:
+        with self._lock:
+            status = self._status.get(key)
+            return dict(status) if status else None
+
+    def forget(self, key: str):
+        """下次 ensure 时重新检查"""
+        with self._lock:
+            self._status.pop(key, None)
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
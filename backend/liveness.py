@@ -0,0 +1,106 @@
+import logging
+import threading
+import time
+from typing import Dict, Optional
+
+from pymongo import monitoring
+
+logger = logging.getLogger(__name__)
+
+
+class ClientHealth(monitoring.ServerHeartbeatListener, monitoring.TopologyListener):
+    """单个 MongoClient 的缓存健康状态
+
+    由 pymongo 后台监控线程的心跳/拓扑事件刷新，请求路径上只读取缓存，
+    不再为每个请求发送同步 ping。
+    """
+
+    def __init__(self, heartbeat_frequency: float):
+        self.heartbeat_frequency = heartbeat_frequency
+        self.healthy = True
+        self.last_heartbeat: Optional[float] = None
+        self.last_error: Optional[str] = None
+
+    # --- ServerHeartbeatListener ---
+    def started(self, event):
+        pass
+
+    def succeeded(self, event):
+        self.mark_ok()
+
+    def failed(self, event):
+        self.last_heartbeat = time.monotonic()
+        self.last_error = str(event.reply)
+        logger.debug(f"MongoDB心跳失败 {event.connection_id}: {event.reply}")
+
+    # --- TopologyListener ---
+    def opened(self, event):
+        pass
+
+    def description_changed(self, event):
+        description = event.new_description
+        # 只要还有可读的服务器就认为客户端可用
+        self.healthy = description.has_readable_server()
+
+    def closed(self, event):
+        self.healthy = False
+
+    def mark_ok(self):
+        self.last_heartbeat = time.monotonic()
+        self.healthy = True
+        self.last_error = None
+
+    def mark_failed(self, error: Exception):
+        """真实命令出现网络类错误时调用"""
+        self.healthy = False
+        self.last_error = str(error)
+
+    def is_stale(self) -> bool:
+        """心跳长时间未到达时缓存状态不再可信"""
+        if self.last_heartbeat is None:
+            return False
+        return time.monotonic() - self.last_heartbeat > self.heartbeat_frequency * 3
+
+    def needs_probe(self) -> bool:
+        return not self.healthy or self.is_stale()
+
+    def to_dict(self) -> Dict:
+        return {
+            'healthy': self.healthy,
+            'stale': self.is_stale(),
+            'last_error': self.last_error,
+        }
+
+
+class LivenessStats:
+    """统计被跳过的 ping 次数"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.pings_avoided = 0
+        self.probes = 0
+        self.probe_failures = 0
+        self.command_failures = 0
+
+    def record_avoided(self):
+        with self._lock:
+            self.pings_avoided += 1
+
+    def record_probe(self, ok: bool):
+        with self._lock:
+            self.probes += 1
+            if not ok:
+                self.probe_failures += 1
+
+    def record_command_failure(self):
+        with self._lock:
+            self.command_failures += 1
+
+    def to_dict(self) -> Dict:
+        with self._lock:
+            return {
+                'pings_avoided': self.pings_avoided,
+                'probes': self.probes,
+                'probe_failures': self.probe_failures,
+                'command_failures': self.command_failures,
+            }
@@ -0,0 +1,264 @@
+"""
+进程内的请求和 MongoDB 命令指标，以 Prometheus 文本格式从 /api/metrics 导出
+
+不依赖 prometheus_client：每次记录只有一次二分查找和一次加锁的计数，
+分位数（p50/p95/p99）由 Prometheus 根据直方图计算。
+多 worker 部署时每个进程各自计数。
+"""
+import threading
+import time
+from bisect import bisect_left
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+from pymongo import monitoring
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+MONGO_LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 5.0)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304, 16777216)
+
+
+def _escape(value) -> str:
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(names: Iterable[str], values: Iterable) -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def _format_value(value) -> str:
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    kind = ''
+
+    def __init__(self, name: str, documentation: str, labelnames: Tuple[str, ...] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        self._lock = threading.Lock()
+        self._values: Dict[Tuple, object] = {}
+
+    def _header(self) -> List[str]:
+        return [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} {self.kind}']
+
+
+class Counter(_Metric):
+    kind = 'counter'
+
+    def inc(self, amount: float = 1, *labels):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def render(self) -> List[str]:
+        with self._lock:
+            values = list(self._values.items())
+        return self._header() + [
+            f'{self.name}{_format_labels(self.labelnames, labels)} {_format_value(value)}'
+            for labels, value in values
+        ]
+
+
+class Gauge(Counter):
+    kind = 'gauge'
+
+    def dec(self, amount: float = 1, *labels):
+        self.inc(-amount, *labels)
+
+
+class Histogram(_Metric):
+    kind = 'histogram'
+
+    def __init__(self, name: str, documentation: str, labelnames: Tuple[str, ...] = (),
+                 buckets: Tuple[float, ...] = LATENCY_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value: float, *labels):
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            entry = self._values.get(labels)
+            if entry is None:
+                # [各桶计数（非累计）..., +Inf 桶, 总和]
+                entry = self._values[labels] = [0] * (len(self.buckets) + 1) + [0.0]
+            entry[index] += 1
+            entry[-1] += value
+
+    def render(self) -> List[str]:
+        with self._lock:
+            values = [(labels, list(entry)) for labels, entry in self._values.items()]
+        lines = self._header()
+        names = self.labelnames + ('le',)
+        for labels, entry in values:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float('inf'),), entry):
+                cumulative += count
+                lines.append(f'{self.name}_bucket{_format_labels(names, labels + (_format_value(bound),))} {cumulative}')
+            label_text = _format_labels(self.labelnames, labels)
+            lines.append(f'{self.name}_sum{label_text} {_format_value(entry[-1])}')
+            lines.append(f'{self.name}_count{label_text} {cumulative}')
+        return lines
+
+
+# 抓取时才计算的指标：返回 [(名称, 类型, 说明, [(标签字典, 值), ...]), ...]
+Collector = Callable[[], Iterable[Tuple[str, str, str, List[Tuple[Dict, float]]]]]
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._metrics: List[_Metric] = []
+        self._collectors: List[Collector] = []
+
+    def counter(self, name: str, documentation: str, labelnames: Tuple[str, ...] = ()) -> Counter:
+        return self._register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name: str, documentation: str, labelnames: Tuple[str, ...] = ()) -> Gauge:
+        return self._register(Gauge(name, documentation, labelnames))
+
+    def histogram(self, name: str, documentation: str, labelnames: Tuple[str, ...] = (),
+                  buckets: Tuple[float, ...] = LATENCY_BUCKETS) -> Histogram:
+        return self._register(Histogram(name, documentation, labelnames, buckets))
+
+    def _register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def add_collector(self, collector: Collector):
+        self._collectors.append(collector)
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        for collector in self._collectors:
+            for name, kind, documentation, samples in collector():
+                lines.append(f'# HELP {name} {documentation}')
+                lines.append(f'# TYPE {name} {kind}')
+                for labels, value in samples:
+                    lines.append(f'{name}{_format_labels(labels.keys(), labels.values())} {_format_value(value)}')
+        return '\n'.join(lines) + '\n'
+
+
+registry = MetricsRegistry()
+
+http_requests = registry.counter(
+    'capture_http_requests_total', 'HTTP 请求数', ('method', 'endpoint', 'status'))
+http_request_duration = registry.histogram(
+    'capture_http_request_duration_seconds', 'HTTP 请求处理耗时（流式响应只计到开始发送）',
+    ('method', 'endpoint'), LATENCY_BUCKETS)
+http_response_size = registry.histogram(
+    'capture_http_response_size_bytes', 'HTTP 响应体大小（压缩后，不含流式响应）',
+    ('method', 'endpoint'), SIZE_BUCKETS)
+http_requests_in_flight = registry.gauge(
+    'capture_http_requests_in_flight', '正在处理的 HTTP 请求数', ('method', 'endpoint'))
+mongo_command_duration = registry.histogram(
+    'capture_mongodb_command_duration_seconds', 'MongoDB 命令耗时', ('command',), MONGO_LATENCY_BUCKETS)
+mongo_command_failures = registry.counter(
+    'capture_mongodb_command_failures_total', '失败的 MongoDB 命令数', ('command',))
+mongo_pool_checkout_wait = registry.histogram(
+    'capture_mongodb_pool_checkout_wait_seconds', '从连接池取得连接的等待时间', (), MONGO_LATENCY_BUCKETS)
+mongo_pool_checkout_failures = registry.counter(
+    'capture_mongodb_pool_checkout_failures_total', '从连接池取连接失败的次数', ('reason',))
+html_processing_duration = registry.histogram(
+    'capture_html_processing_duration_seconds', '工作进程中处理一条内容的耗时', (), LATENCY_BUCKETS)
+
+
+class MongoMetrics(monitoring.CommandListener, monitoring.ConnectionPoolListener):
+    """记录命令耗时和连接池等待时间，同步和异步客户端共用一个实例"""
+
+    # --- CommandListener ---
+    def started(self, event):
+        pass
+
+    def succeeded(self, event):
+        mongo_command_duration.observe(event.duration_micros / 1e6, event.command_name)
+
+    def failed(self, event):
+        mongo_command_duration.observe(event.duration_micros / 1e6, event.command_name)
+        mongo_command_failures.inc(1, event.command_name)
+
+    # --- ConnectionPoolListener ---
+    def connection_checked_out(self, event):
+        mongo_pool_checkout_wait.observe(event.duration)
+
+    def connection_check_out_failed(self, event):
+        mongo_pool_checkout_failures.inc(1, event.reason)
+
+    def pool_created(self, event):
+        pass
+
+    def pool_ready(self, event):
+        pass
+
+    def pool_cleared(self, event):
+        pass
+
+    def pool_closed(self, event):
+        pass
+
+    def connection_created(self, event):
+        pass
+
+    def connection_ready(self, event):
+        pass
+
+    def connection_closed(self, event):
+        pass
+
+    def connection_check_out_started(self, event):
+        pass
+
+    def connection_checked_in(self, event):
+        pass
+
+
+mongo_metrics = MongoMetrics()
+
+
+def start_request(method: str, url_rule) -> Tuple[float, Tuple[str, str]]:
+    """请求开始时调用，返回交给 finish_request 的状态"""
+    labels = (method, url_rule.rule if url_rule is not None else 'unmatched')
+    http_requests_in_flight.inc(1, *labels)
+    return time.perf_counter(), labels
+
+
+def finish_request(state: Tuple[float, Tuple[str, str]], status: Optional[int], size: Optional[int]):
+    """请求结束时调用；status 为 None 表示未产生响应（处理中抛出异常）"""
+    start, labels = state
+    http_requests_in_flight.dec(1, *labels)
+    http_request_duration.observe(time.perf_counter() - start, *labels)
+    http_requests.inc(1, *labels, status if status is not None else 500)
+    if size is not None:
+        http_response_size.observe(size, *labels)
+
+
+def init_request_metrics(app):
+    """为 Flask 应用记录请求耗时、并发数和响应大小
+
+    需要在 init_response_compression 之前调用，才能记录压缩后的大小。
+    """
+    from flask import g, request
+
+    @app.before_request
+    def start_request_metrics():
+        g.metrics_state = start_request(request.method, request.url_rule)
+
+    @app.after_request
+    def record_request_metrics(response):
+        state = g.pop('metrics_state', None)
+        if state is not None:
+            size = None if response.is_streamed else response.content_length
+            finish_request(state, response.status_code, size)
+        return response
+
+    @app.teardown_request
+    def abort_request_metrics(exc):
+        # 未经过 after_request（未处理的异常）时也要减少并发计数
+        state = g.pop('metrics_state', None)
+        if state is not None:
+            finish_request(state, None, None)
@@ -0,0 +1,93 @@
+"""
+同步和异步服务共用的数据库操作流程
+
+写入、读取、更新、删除等流程写成生成器，只描述要执行的驱动调用（Call），不直接做 I/O：
+
+    def load_steps(collection, capture_id):
+        capture = yield call(collection, 'find_one', {'_id': capture_id})
+        ...
+        return capture
+
+run() 用同步的 MongoClient/GridFSBucket 执行，run_async() 用 AsyncMongoClient/AsyncGridFSBucket 执行，
+两种驱动的方法名和参数相同，因此流程只需写一份。调用抛出的异常（例如 BulkWriteError、NoFile）
+会抛回生成器，由流程自行处理。流程之间用 yield from 组合。
+"""
+import inspect
+from typing import Any, Generator
+
+from gridfs import AsyncGridFSBucket, GridFSBucket
+
+Steps = Generator['Call', Any, Any]
+
+
+class Bucket:
+    """集合对应的 GridFS 存储桶，执行时按驱动创建"""
+    __slots__ = ('collection', 'name')
+
+    def __init__(self, collection, name: str):
+        self.collection = collection
+        self.name = name
+
+
+class Call:
+    """一次驱动调用：target.method(*args, **kwargs)，to_list 为 True 时把返回的游标读成列表"""
+    __slots__ = ('target', 'method', 'args', 'kwargs', 'to_list')
+
+    def __init__(self, target, method: str, args: tuple, kwargs: dict, to_list: bool = False):
+        self.target = target
+        self.method = method
+        self.args = args
+        self.kwargs = kwargs
+        self.to_list = to_list
+
+
+def call(target, method: str, *args, **kwargs) -> Call:
+    return Call(target, method, args, kwargs)
+
+
+def fetch(target, method: str, *args, **kwargs) -> Call:
+    """返回游标的调用（find、aggregate），结果为文档列表"""
+    return Call(target, method, args, kwargs, to_list=True)
+
+
+def run(steps: Steps):
+    """用同步驱动执行流程，返回流程的返回值"""
+    send, error = None, None
+    while True:
+        try:
+            step = steps.throw(error) if error is not None else steps.send(send)
+        except StopIteration as stop:
+            return stop.value
+        send, error = None, None
+        target = step.target
+        if isinstance(target, Bucket):
+            target = GridFSBucket(target.collection.database, bucket_name=target.name)
+        try:
+            send = getattr(target, step.method)(*step.args, **step.kwargs)
+            if step.to_list:
+                send = list(send)
+        except Exception as e:
+            error = e
+
+
+async def run_async(steps: Steps):
+    """用异步驱动执行流程，返回流程的返回值"""
+    send, error = None, None
+    while True:
+        try:
+            step = steps.throw(error) if error is not None else steps.send(send)
+        except StopIteration as stop:
+            return stop.value
+        send, error = None, None
+        target = step.target
+        if isinstance(target, Bucket):
+            target = AsyncGridFSBucket(target.collection.database, bucket_name=target.name)
+        try:
+            send = getattr(target, step.method)(*step.args, **step.kwargs)
+            # AsyncCollection.find 直接返回游标，aggregate 等返回协程
+            if inspect.isawaitable(send):
+                send = await send
+            if step.to_list:
+                send = await send.to_list()
+        except Exception as e:
+            error = e
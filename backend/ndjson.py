@@ -0,0 +1,125 @@
+import codecs
+import json
+from typing import Dict, Iterable, Iterator, Optional, Tuple
+
+from json_provider import dumps_bytes
+
+
+def encode_lines(documents: Iterable[Dict], chunk_size: int = 64 * 1024) -> Iterator[bytes]:
+    """把文档编码为 NDJSON，按 chunk_size 字节合并输出，避免每行一次写入"""
+    buffer = []
+    size = 0
+    for document in documents:
+        line = dumps_bytes(document) + b'\n'
+        buffer.append(line)
+        size += len(line)
+        if size >= chunk_size:
+            yield b''.join(buffer)
+            buffer = []
+            size = 0
+    if buffer:
+        yield b''.join(buffer)
+
+
+def iter_lines(stream, skip: int = 0, chunk_size: int = 1024 * 1024,
+               max_record_bytes: int = 16 * 1024 * 1024) -> Iterator[Tuple[Optional[Dict], Optional[str]]]:
+    """逐行解析 NDJSON 流，产出 (记录, 错误)；前 skip 条记录只计数不解析
+
+    空行不算记录。单行超过 max_record_bytes 时记为错误并丢弃该行剩余部分。
+    """
+    index = 0
+    buffer = b''
+    oversized = False
+    while True:
+        chunk = stream.read(chunk_size)
+        if chunk:
+            buffer += chunk
+        lines = buffer.split(b'\n')
+        buffer = lines.pop() if chunk else b''
+        for line in lines:
+            if oversized:
+                # 超长行的剩余部分
+                oversized = False
+                continue
+            if not line.strip():
+                continue
+            index += 1
+            if index <= skip:
+                continue
+            try:
+                yield json.loads(line), None
+            except ValueError:
+                yield None, "JSON格式无效"
+        if not chunk:
+            return
+        if len(buffer) > max_record_bytes:
+            buffer = b''
+            if not oversized:
+                oversized = True
+                index += 1
+                if index > skip:
+                    yield None, "单条记录过大"
+
+
+def iter_array(stream, skip: int = 0, chunk_size: int = 1024 * 1024,
+               max_record_bytes: int = 16 * 1024 * 1024) -> Iterator[Tuple[Optional[Dict], Optional[str]]]:
+    """增量解析顶层 JSON 数组，产出 (记录, None)，不把整个请求体读入内存
+
+    数组本身格式错误时无法继续定位后续记录，抛出 ValueError。
+    """
+    decoder = json.JSONDecoder()
+    reader = codecs.getincrementaldecoder('utf-8')()
+    buffer = ''
+    pos = 0
+    eof = False
+    started = False
+    expect_value = True
+    index = 0
+
+    def fill():
+        nonlocal buffer, pos, eof
+        chunk = stream.read(chunk_size)
+        eof = not chunk
+        buffer = buffer[pos:] + reader.decode(chunk, final=eof)
+        pos = 0
+
+    while True:
+        while pos < len(buffer) and buffer[pos] in ' \t\r\n':
+            pos += 1
+        if pos >= len(buffer):
+            if eof:
+                raise ValueError("JSON数组不完整")
+            fill()
+            continue
+
+        char = buffer[pos]
+        if not started:
+            if char != '[':
+                raise ValueError("请求体必须是JSON数组")
+            started = True
+            pos += 1
+            continue
+        if char == ']':
+            if expect_value and index > 0:
+                raise ValueError(f"第 {index} 条记录后JSON格式无效")
+            return
+        if not expect_value:
+            if char != ',':
+                raise ValueError(f"第 {index} 条记录后JSON格式无效")
+            expect_value = True
+            pos += 1
+            continue
+
+        try:
+            value, end = decoder.raw_decode(buffer, pos)
+        except json.JSONDecodeError:
+            if not eof and len(buffer) - pos <= max_record_bytes:
+                # 记录可能被截断在块边界，读入更多数据后重试
+                fill()
+                continue
+            raise ValueError(f"第 {index + 1} 条记录JSON格式无效")
+        pos = end
+        expect_value = False
+        index += 1
+        if index > skip:
+            yield value, None
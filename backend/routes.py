@@ -1,15 +1,33 @@
-from flask import Blueprint, request, jsonify
-from database import db_service
+from flask import Blueprint, Response, request, jsonify, current_app, make_response, stream_with_context
+from werkzeug.exceptions import RequestedRangeNotSatisfiable
+from werkzeug.wsgi import wrap_file
+from database import db_service, decode_cursor, ACK_MODES, COUNT_MODES, LIST_VIEWS, NOT_MODIFIED, SEARCH_SORTS
+from bson.objectid import ObjectId
+from compression import gzip_stream
+from importer import CountingReader, ImportRegistry, run_import
+from similarity import SimilarityUnavailable
+from body_store import BODY_FIELDS
+from dedup import DuplicateCapture, DuplicateId
+from write_buffer import QueuedId
+import metrics
+import ndjson
+import json
 import logging
+import re
 
 logger = logging.getLogger(__name__)
 
 # 创建API蓝图
 api = Blueprint('api', __name__, url_prefix='/api')
 
-def _get_token_from_header():
+# 本进程内的导入任务进度
+import_jobs = ImportRegistry()
+
+_JOB_ID = re.compile(r'^[A-Za-z0-9_-]{1,64}$')
+
+def _get_token_from_header(req=request):
     """从请求头中提取Bearer令牌"""
-    auth_header = request.headers.get('Authorization')
+    auth_header = req.headers.get('Authorization')
     if not auth_header:
         raise ValueError("缺少授权头")
     
@@ -24,6 +42,157 @@ def _get_token_from_header():
         
     return parts[1]
 
+def _get_cursor_arg(req=request):
+    """读取游标分页参数（cursor 或 after），未提供时返回 None 表示页码分页"""
+    cursor = req.args.get('cursor', req.args.get('after'))
+    if cursor is not None:
+        decode_cursor(cursor)  # 提前校验，格式错误时抛出 ValueError
+    return cursor
+
+def _get_page_args(req=request):
+    """读取分页参数：page 从 1 开始，limit 至少为 1，超过 100 时按 100 处理"""
+    try:
+        page = int(req.args.get('page', 1))
+        limit = int(req.args.get('limit', 20))
+    except ValueError:
+        raise ValueError("page 和 limit 必须是整数")
+    if page < 1:
+        raise ValueError("page 必须大于 0")
+    if limit < 1:
+        raise ValueError("limit 必须大于 0")
+    return page, min(limit, 100)
+
+def _get_count_arg(req=request):
+    """读取总数计算方式参数（exact|estimated|none）"""
+    count = req.args.get('count', 'exact')
+    if count not in COUNT_MODES:
+        raise ValueError(f"count 参数必须是 {'|'.join(COUNT_MODES)} 之一")
+    return count
+
+_FIELD_NAME = re.compile(r'^[A-Za-z_][A-Za-z0-9_]*$')
+
+def _get_projection_args(default_view='summary', req=request):
+    """读取列表投影参数：view=summary|full 或 fields=a,b,c"""
+    view = req.args.get('view', default_view)
+    if view not in LIST_VIEWS:
+        raise ValueError(f"view 参数必须是 {'|'.join(LIST_VIEWS)} 之一")
+    fields = None
+    if req.args.get('fields'):
+        fields = [f.strip() for f in req.args['fields'].split(',') if f.strip()]
+        if not all(_FIELD_NAME.match(f) for f in fields):
+            raise ValueError("fields 参数包含无效的字段名")
+    return view, fields
+
+def _get_include_arg(req=request):
+    """读取 include=html,text：单条内容中要读回的外置正文"""
+    include = tuple(f.strip() for f in req.args.get('include', '').split(',') if f.strip())
+    if not all(f in BODY_FIELDS for f in include):
+        raise ValueError(f"include 参数只支持 {','.join(BODY_FIELDS)}")
+    return include
+
+def _get_search_args(search, cursor, req=request):
+    """读取搜索排序和高亮参数：sort=relevance|newest，highlight=true|false
+
+    搜索时默认按相关度排序（游标分页按时间倒序）并返回高亮片段。
+    """
+    sort = req.args.get('sort')
+    if sort is not None:
+        if sort not in SEARCH_SORTS:
+            raise ValueError(f"sort 参数必须是 {'|'.join(SEARCH_SORTS)} 之一")
+        if sort == 'relevance' and not search:
+            raise ValueError("sort=relevance 只能用于搜索")
+        if sort == 'relevance' and cursor is not None:
+            raise ValueError("游标分页不支持 sort=relevance")
+    highlight = bool(search) and req.args.get('highlight', 'true').lower() != 'false'
+    return sort, highlight
+
+def _capture_etag(capture_id, version, include=()):
+    """单条内容的 ETag：<capture_id>-<_version>，读回了外置正文时加上排序后的 include，如 <capture_id>-3-html+text"""
+    if include:
+        return f"{capture_id}-{version}-{'+'.join(sorted(set(include)))}"
+    return f"{capture_id}-{version}"
+
+def _get_if_none_match_version(capture_id, include=(), req=request):
+    """从 If-None-Match 中取出该文档在相同 include 下的版本号，没有匹配的 ETag 时返回 None"""
+    prefix = f"{capture_id}-"
+    for etag in req.if_none_match.as_set(include_weak=True):
+        version = etag[len(prefix):].split('-', 1)[0]
+        if etag.startswith(prefix) and version.isdigit() and etag == _capture_etag(capture_id, int(version), include):
+            return int(version)
+    return None
+
+def _not_modified(etag, weak=False):
+    """304 响应，只带 ETag"""
+    response = make_response('', 304)
+    response.set_etag(etag, weak=weak)
+    return response
+
+def _list_response(token, params, extra=None):
+    """列表/搜索响应：If-None-Match 命中时不查询直接返回 304，否则附带弱 ETag"""
+    etag = db_service.get_list_etag(token, **params)
+    if request.if_none_match.contains_weak(etag):
+        return _not_modified(etag, weak=True)
+
+    result = db_service.get_captures(token, **params)
+    response = jsonify({
+        "status": "success",
+        "data": result,
+        **(extra or {})
+    })
+    response.set_etag(etag, weak=True)
+    return response
+
+def _validate_capture(data):
+    """校验单条捕获内容，返回错误信息或 None"""
+    if not isinstance(data, dict):
+        return "捕获内容必须是JSON对象"
+    title = data.get('title')
+    if not isinstance(title, str) or not title.strip():
+        return "标题不能为空"
+    return None
+
+def _create_result(capture_id):
+    """单条创建的响应体和状态码
+
+    已进入写后缓冲（QueuedId）时返回 202，队列已满等原因改为直接写入时按写入结果返回；
+    内容重复且已合并到已有内容时返回 200，data.id 为已有内容的 _id；其他情况返回 201。
+    """
+    if isinstance(capture_id, QueuedId):
+        return {"status": "success", "message": "内容已进入写入队列", "data": {"id": capture_id}}, 202
+    if not isinstance(capture_id, DuplicateId):
+        return {"status": "success", "message": "内容捕获成功", "data": {"id": capture_id}}, 201
+    if db_service.dedup_mode == 'merge':
+        return {"status": "success", "message": "内容已存在，已合并到已有内容",
+                "data": {"id": capture_id, "duplicate": True}}, 200
+    return {"status": "success", "message": "内容捕获成功", "data": {"id": capture_id, "duplicate": True}}, 201
+
+def _duplicate_result(e):
+    """reject 模式下重复内容的 409 响应体"""
+    return {"status": "error", "message": str(e), "data": {"id": e.existing_id}}, 409
+
+def _parse_batch_body():
+    """解析批量请求体，支持 JSON 数组、{"captures": [...]} 和 NDJSON
+
+    返回 (items, errors)，errors 以请求中的序号为键记录无法解析的行。
+    """
+    if request.mimetype in ('application/x-ndjson', 'application/jsonl'):
+        items, errors = [], {}
+        lines = [line for line in request.get_data(as_text=True).splitlines() if line.strip()]
+        for index, line in enumerate(lines):
+            try:
+                items.append(json.loads(line))
+            except ValueError:
+                items.append(None)
+                errors[index] = "JSON格式无效"
+        return items, errors
+
+    data = request.get_json(silent=True)
+    if isinstance(data, dict):
+        data = data.get('captures')
+    if not isinstance(data, list):
+        raise ValueError("请求体必须是捕获内容数组")
+    return data, {}
+
 @api.route('/database/connect', methods=['POST'])
 def connect_database():
     """建立数据库连接并返回令牌"""
@@ -99,42 +268,102 @@ def create_capture():
         if not data:
             return jsonify({"status": "error", "message": "请求体中没有提供JSON数据"}), 400
         
-        if not data.get('title', '').strip():
-            return jsonify({"status": "error", "message": "标题不能为空"}), 400
+        error = _validate_capture(data)
+        if error:
+            return jsonify({"status": "error", "message": error}), 400
         
-        capture_id = db_service.create_capture(token, data)
+        ack = request.args.get('ack', 'durable')
+        if ack not in ACK_MODES:
+            return jsonify({"status": "error", "message": f"ack 参数必须是 {'|'.join(ACK_MODES)} 之一"}), 400
         
-        return jsonify({
-            "status": "success",
-            "message": "内容捕获成功",
-            "data": {"id": capture_id}
-        }), 201
+        capture_id = db_service.create_capture(token, data, ack)
+        
+        body, status = _create_result(capture_id)
+        return jsonify(body), status
         
+    except DuplicateCapture as e:
+        body, status = _duplicate_result(e)
+        return jsonify(body), status
     except ValueError as e:
         return jsonify({"status": "error", "message": str(e)}), 401
     except Exception as e:
         logger.exception("创建捕获内容失败")
         return jsonify({"status": "error", "message": f"创建失败: {str(e)}"}), 500
 
+@api.route('/captures/batch', methods=['POST'])
+def create_captures_batch():
+    """批量创建捕获内容"""
+    try:
+        token = _get_token_from_header()
+        try:
+            items, errors = _parse_batch_body()
+        except ValueError as e:
+            return jsonify({"status": "error", "message": str(e)}), 400
+
+        if not items:
+            return jsonify({"status": "error", "message": "请求体中没有捕获内容"}), 400
+
+        max_batch_size = current_app.config['MAX_BATCH_SIZE']
+        if len(items) > max_batch_size:
+            return jsonify({"status": "error", "message": f"单次最多提交 {max_batch_size} 条"}), 413
+
+        # 逐条校验，只把合法的内容交给数据库
+        valid_indexes = []
+        for index, item in enumerate(items):
+            if index in errors:
+                continue
+            error = _validate_capture(item)
+            if error:
+                errors[index] = error
+            else:
+                valid_indexes.append(index)
+
+        results = [{"index": index, "error": errors[index]} for index in errors]
+        if valid_indexes:
+            inserted = db_service.create_captures(token, [items[i] for i in valid_indexes])
+            for index, result in zip(valid_indexes, inserted):
+                results.append({"index": index, **result})
+        results.sort(key=lambda r: r['index'])
+
+        inserted_count = sum(1 for r in results if 'id' in r)
+        return jsonify({
+            "status": "success" if inserted_count else "error",
+            "message": f"成功 {inserted_count} 条，失败 {len(results) - inserted_count} 条",
+            "data": {
+                "inserted": inserted_count,
+                "failed": len(results) - inserted_count,
+                "duplicates": sum(1 for r in results if r.get('duplicate') or 'duplicate_of' in r),
+                "results": results
+            }
+        }), 201 if inserted_count else 400
+
+    except ValueError as e:
+        return jsonify({"status": "error", "message": str(e)}), 401
+    except Exception as e:
+        logger.exception("批量创建捕获内容失败")
+        return jsonify({"status": "error", "message": f"创建失败: {str(e)}"}), 500
+
 @api.route('/captures', methods=['GET'])
 def get_captures():
     """获取捕获内容列表"""
     try:
         token = _get_token_from_header()
-        page = int(request.args.get('page', 1))
-        limit = int(request.args.get('limit', 20))
         category = request.args.get('category')
         search = request.args.get('search')
-        
-        limit = min(limit, 100)
-        
-        result = db_service.get_captures(token, page=page, limit=limit, 
-                                       category=category, search=search)
-        
-        return jsonify({
-            "status": "success",
-            "data": result
-        }), 200
+
+        try:
+            page, limit = _get_page_args()
+            cursor = _get_cursor_arg()
+            count = _get_count_arg()
+            view, fields = _get_projection_args()
+            sort, highlight = _get_search_args(search, cursor)
+        except ValueError as e:
+            return jsonify({"status": "error", "message": str(e)}), 400
+        
+        params = dict(page=page, limit=limit, category=category, search=search,
+                      cursor=cursor, count=count, view=view, fields=fields,
+                      sort=sort, highlight=highlight)
+        return _list_response(token, params)
         
     except ValueError as e:
         return jsonify({"status": "error", "message": str(e)}), 401
@@ -142,20 +371,140 @@ def get_captures():
         logger.exception("获取捕获列表失败")
         return jsonify({"status": "error", "message": f"获取失败: {str(e)}"}), 500
 
+@api.route('/captures/export', methods=['GET'])
+def export_captures():
+    """以 NDJSON 流式导出所有匹配的捕获内容"""
+    try:
+        token = _get_token_from_header()
+        category = request.args.get('category')
+        search = request.args.get('search')
+
+        try:
+            view, fields = _get_projection_args(default_view='full')
+            compress = request.args.get('compress')
+            if compress not in (None, 'gzip'):
+                raise ValueError("compress 参数只支持 gzip")
+        except ValueError as e:
+            return jsonify({"status": "error", "message": str(e)}), 400
+
+        documents = db_service.export_captures(token, category=category, search=search,
+                                               view=view, fields=fields)
+
+    except ValueError as e:
+        return jsonify({"status": "error", "message": str(e)}), 401
+    except Exception as e:
+        logger.exception("导出捕获内容失败")
+        return jsonify({"status": "error", "message": f"导出失败: {str(e)}"}), 500
+
+    def generate():
+        try:
+            yield from ndjson.encode_lines(documents)
+        except Exception:
+            # 响应头已发出，只能中断连接：encode_lines 只输出完整的行，吞掉异常的话
+            # 响应（和 gzip 尾部）会正常结束，客户端无法区分失败与完整的导出
+            logger.exception("导出过程中出错")
+            raise
+
+    body = generate()
+    filename = 'captures.ndjson'
+    if compress == 'gzip':
+        body = gzip_stream(body, current_app.config.get('RESPONSE_COMPRESSION_LEVEL', 6))
+        filename += '.gz'
+    response = Response(stream_with_context(body),
+                        mimetype='application/gzip' if compress else 'application/x-ndjson')
+    response.headers['Content-Disposition'] = f'attachment; filename="{filename}"'
+    return response
+
+@api.route('/captures/import', methods=['POST'])
+def import_captures():
+    """流式导入大量捕获内容（NDJSON 或 JSON 数组），可从 offset 处继续"""
+    try:
+        token = _get_token_from_header()
+        if not db_service.get_connection_by_token(token):
+            raise ValueError("无效的连接令牌")
+    except ValueError as e:
+        return jsonify({"status": "error", "message": str(e)}), 401
+
+    try:
+        offset = int(request.args.get('offset', 0))
+        if offset < 0:
+            raise ValueError
+    except ValueError:
+        return jsonify({"status": "error", "message": "offset 必须是非负整数"}), 400
+    job_id = request.args.get('job_id')
+    if job_id is not None and not _JOB_ID.match(job_id):
+        return jsonify({"status": "error", "message": "job_id 只能包含字母、数字、-和_"}), 400
+
+    if request.mimetype in ('application/x-ndjson', 'application/jsonl'):
+        parse = ndjson.iter_lines
+    elif request.mimetype == 'application/json':
+        parse = ndjson.iter_array
+    else:
+        return jsonify({"status": "error", "message": "请求体必须是NDJSON或JSON数组"}), 415
+
+    try:
+        job = import_jobs.start(token, job_id, offset)
+    except ValueError as e:
+        return jsonify({"status": "error", "message": str(e)}), 409
+
+    job.reader = CountingReader(request.stream)
+    try:
+        run_import(job, parse(job.reader, skip=offset), _validate_capture,
+                   lambda items: db_service.create_captures(token, items),
+                   current_app.config.get('IMPORT_BATCH_SIZE', 1000),
+                   current_app.config.get('IMPORT_BATCH_BYTES', 8 * 1024 * 1024))
+    except ValueError as e:
+        return jsonify({"status": "error", "message": str(e), "data": job.to_dict()}), 400
+    except Exception as e:
+        logger.exception("导入捕获内容失败")
+        return jsonify({
+            "status": "error",
+            "message": f"导入失败: {str(e)}，可从 offset {job.offset} 继续",
+            "data": job.to_dict()
+        }), 500
+
+    result = job.to_dict()
+    return jsonify({
+        "status": "success",
+        "message": f"成功 {result['inserted']} 条，失败 {result['failed']} 条",
+        "data": result
+    }), 200
+
+@api.route('/captures/import/<job_id>', methods=['GET'])
+def get_import_status(job_id):
+    """查询导入任务进度"""
+    try:
+        token = _get_token_from_header()
+    except ValueError as e:
+        return jsonify({"status": "error", "message": str(e)}), 401
+
+    job = import_jobs.get(job_id, token)
+    if job is None:
+        return jsonify({"status": "error", "message": "导入任务不存在"}), 404
+    return jsonify({"status": "success", "data": job.to_dict()}), 200
+
 @api.route('/captures/<capture_id>', methods=['GET'])
 def get_capture(capture_id):
     """获取单个捕获内容"""
     try:
         token = _get_token_from_header()
-        capture = db_service.get_capture(token, capture_id)
+        include = _get_include_arg()
+        known_version = _get_if_none_match_version(capture_id, include)
+        capture = db_service.get_capture(token, capture_id, unless_version=known_version, include=include)
         
+        if capture is NOT_MODIFIED:
+            return _not_modified(_capture_etag(capture_id, known_version, include))
         if not capture:
             return jsonify({"status": "error", "message": "内容不存在"}), 404
         
-        return jsonify({
+        response = jsonify({
             "status": "success",
             "data": capture
-        }), 200
+        })
+        # 没有版本号的旧文档按版本 0 处理
+        response.set_etag(_capture_etag(capture_id, capture.get('_version', 0), include))
+        response.last_modified = capture.get('updated_at') or ObjectId(capture_id).generation_time
+        return response
         
     except ValueError as e:
         return jsonify({"status": "error", "message": str(e)}), 400
@@ -163,6 +512,37 @@ def get_capture(capture_id):
         logger.exception("获取捕获内容失败")
         return jsonify({"status": "error", "message": f"获取失败: {str(e)}"}), 500
 
+@api.route('/captures/<capture_id>/html', methods=['GET'])
+def get_capture_html(capture_id):
+    """以 text/html 返回内容的 html，支持 Range 和条件请求，外置到 GridFS 的正文按需分块读取"""
+    try:
+        token = _get_token_from_header()
+        body = db_service.open_body(token, capture_id, 'html')
+
+        if body is None:
+            return jsonify({"status": "error", "message": "内容不存在"}), 404
+        capture, stream, length = body
+        if stream is None:
+            return jsonify({"status": "error", "message": "内容没有 html"}), 404
+
+        response = Response(wrap_file(request.environ, stream), mimetype='text/html', direct_passthrough=True)
+        response.content_length = length
+        response.set_etag(_capture_etag(capture_id, capture.get('_version', 0)))
+        response.last_modified = capture.get('updated_at') or ObjectId(capture_id).generation_time
+        try:
+            return response.make_conditional(request, accept_ranges=True, complete_length=length)
+        except RequestedRangeNotSatisfiable:
+            response.close()
+            error = jsonify({"status": "error", "message": "请求的范围无效"})
+            error.headers['Content-Range'] = f"bytes */{length}"
+            return error, 416
+
+    except ValueError as e:
+        return jsonify({"status": "error", "message": str(e)}), 400
+    except Exception as e:
+        logger.exception("获取捕获内容的 html 失败")
+        return jsonify({"status": "error", "message": f"获取失败: {str(e)}"}), 500
+
 @api.route('/captures/<capture_id>', methods=['PUT'])
 def update_capture(capture_id):
     """更新捕获内容"""
@@ -209,16 +589,79 @@ def delete_capture(capture_id):
         logger.exception("删除捕获内容失败")
         return jsonify({"status": "error", "message": f"删除失败: {str(e)}"}), 500
 
+def _similarity_unavailable(e):
+    """相似度索引不可用时的 503 响应，附带索引状态"""
+    return jsonify({"status": "error", "message": str(e), "data": e.status}), 503
+
+@api.route('/captures/<capture_id>/related', methods=['GET'])
+def get_related_captures(capture_id):
+    """获取相关内容和近似重复的内容"""
+    try:
+        token = _get_token_from_header()
+        limit = min(int(request.args.get('limit', 10)), 100)
+        if limit < 1:
+            return jsonify({"status": "error", "message": "limit 必须大于 0"}), 400
+
+        result = db_service.get_related(token, capture_id, limit)
+
+        if result is None:
+            return jsonify({"status": "error", "message": "内容不存在"}), 404
+
+        return jsonify({
+            "status": "success",
+            "data": result
+        }), 200
+
+    except SimilarityUnavailable as e:
+        return _similarity_unavailable(e)
+    except ValueError as e:
+        return jsonify({"status": "error", "message": str(e)}), 400
+    except Exception as e:
+        logger.exception("获取相关内容失败")
+        return jsonify({"status": "error", "message": f"获取失败: {str(e)}"}), 500
+
+@api.route('/captures/duplicates', methods=['POST'])
+def find_duplicate_captures():
+    """检查标题/正文是否与已有内容近似重复"""
+    try:
+        token = _get_token_from_header()
+        data = request.get_json(silent=True)
+        if not isinstance(data, dict) or not (data.get('title') or data.get('text')):
+            return jsonify({"status": "error", "message": "请提供 title 或 text"}), 400
+        limit = min(int(request.args.get('limit', 10)), 100)
+        if limit < 1:
+            return jsonify({"status": "error", "message": "limit 必须大于 0"}), 400
+
+        duplicates = db_service.find_duplicates(token, data, limit)
+
+        return jsonify({
+            "status": "success",
+            "data": {
+                "duplicates": duplicates
+            }
+        }), 200
+
+    except SimilarityUnavailable as e:
+        return _similarity_unavailable(e)
+    except ValueError as e:
+        return jsonify({"status": "error", "message": str(e)}), 401
+    except Exception as e:
+        logger.exception("检查近似重复失败")
+        return jsonify({"status": "error", "message": f"检查失败: {str(e)}"}), 500
+
 @api.route('/categories', methods=['GET'])
 def get_categories():
     """获取所有分类"""
     try:
         token = _get_token_from_header()
-        categories = db_service.get_categories(token)
+        counts = db_service.get_categories(token)
         
         return jsonify({
             "status": "success",
-            "data": {"categories": categories}
+            "data": {
+                "categories": sorted(counts),
+                "counts": counts
+            }
         }), 200
         
     except ValueError as e:
@@ -236,27 +679,100 @@ def search_captures():
         if not query.strip():
             return jsonify({"status": "error", "message": "搜索关键词不能为空"}), 400
         
-        page = int(request.args.get('page', 1))
-        limit = int(request.args.get('limit', 20))
+        try:
+            page, limit = _get_page_args()
+            cursor = _get_cursor_arg()
+            count = _get_count_arg()
+            view, fields = _get_projection_args()
+            sort, highlight = _get_search_args(query, cursor)
+        except ValueError as e:
+            return jsonify({"status": "error", "message": str(e)}), 400
+        
+        params = dict(page=page, limit=limit, search=query,
+                      cursor=cursor, count=count, view=view, fields=fields,
+                      sort=sort, highlight=highlight)
+        return _list_response(token, params, {"query": query})
         
-        result = db_service.get_captures(token, page=page, limit=limit, search=query)
+    except ValueError as e:
+        return jsonify({"status": "error", "message": str(e)}), 401
+    except Exception as e:
+        logger.exception("搜索捕获内容失败")
+        return jsonify({"status": "error", "message": f"搜索失败: {str(e)}"}), 500
+
+@api.route('/admin/indexes', methods=['GET'])
+def get_index_status():
+    """获取当前集合的索引状态"""
+    try:
+        token = _get_token_from_header()
+        status = db_service.get_index_status(token)
         
         return jsonify({
             "status": "success",
-            "data": result,
-            "query": query
+            "data": status
         }), 200
         
     except ValueError as e:
         return jsonify({"status": "error", "message": str(e)}), 401
     except Exception as e:
-        logger.exception("搜索捕获内容失败")
-        return jsonify({"status": "error", "message": f"搜索失败: {str(e)}"}), 500
+        logger.exception("获取索引状态失败")
+        return jsonify({"status": "error", "message": f"获取失败: {str(e)}"}), 500
+
+@api.route('/admin/indexes/rebuild', methods=['POST'])
+def rebuild_text_index():
+    """按配置的权重在后台重建当前集合的全文索引"""
+    try:
+        token = _get_token_from_header()
+        status = db_service.rebuild_text_index(token)
+        
+        return jsonify({
+            "status": "success",
+            "message": "全文索引正在重建",
+            "data": status
+        }), 202
+        
+    except ValueError as e:
+        return jsonify({"status": "error", "message": str(e)}), 401
+    except RuntimeError as e:
+        return jsonify({"status": "error", "message": str(e)}), 409
+    except Exception as e:
+        logger.exception("重建全文索引失败")
+        return jsonify({"status": "error", "message": f"重建失败: {str(e)}"}), 500
+
+@api.route('/admin/dedup', methods=['GET'])
+def get_dedup_status():
+    """获取当前集合的去重统计"""
+    try:
+        token = _get_token_from_header()
+        stats = db_service.get_collection_dedup_stats(token)
+        
+        return jsonify({
+            "status": "success",
+            "data": stats
+        }), 200
+        
+    except ValueError as e:
+        return jsonify({"status": "error", "message": str(e)}), 401
+    except Exception as e:
+        logger.exception("获取去重统计失败")
+        return jsonify({"status": "error", "message": f"获取失败: {str(e)}"}), 500
 
 @api.route('/status', methods=['GET'])
 def get_status():
     """获取API状态"""
     return jsonify({
         "status": "success",
-        "message": "API is running"
+        "message": "API is running",
+        "data": {
+            "liveness": db_service.get_liveness_stats(),
+            "pools": db_service.get_pool_stats(),
+            "query_cache": db_service.get_query_cache_stats(),
+            "write_buffer": db_service.get_write_buffer_stats(),
+            "dedup": db_service.get_dedup_stats(),
+            "html_processing": db_service.get_html_processing_stats()
+        }
     }), 200
+
+@api.route('/metrics', methods=['GET'])
+def get_metrics():
+    """以 Prometheus 文本格式导出本进程的指标"""
+    return Response(metrics.registry.render(), content_type=metrics.CONTENT_TYPE)
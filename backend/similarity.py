@@ -0,0 +1,540 @@
+"""
+相关内容推荐和近似重复检测
+
+每个集合在进程内维护一个相似度索引：
+- 相关内容：标题和正文的 TF-IDF 向量，通过倒排表只为共享关键词的文档计算余弦相似度；
+- 近似重复：正文词组（连续 3 个词）集合的 MinHash 签名（单次哈希分桶），
+  用 LSH 分段找出候选，再以签名估计 Jaccard 相似度。
+
+纯 Python 实现，不依赖 NumPy。索引在首次使用时从集合建立，之后随本服务的写入增量更新，
+并定期保存到磁盘；重启后载入保存的索引，只需补齐保存之后修改过的文档。
+"""
+import gzip
+import hashlib
+import heapq
+import json
+import logging
+import math
+import os
+import re
+import threading
+import time
+from collections import Counter, OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+from datetime import datetime, timezone
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+from json_provider import dumps_bytes
+
+logger = logging.getLogger(__name__)
+
+FORMAT_VERSION = 1
+
+# 每个文档保留的关键词数和标题词的权重
+MAX_TERMS = 64
+TITLE_WEIGHT = 3
+# 计算相关内容时使用查询文档中 TF-IDF 最高的若干个词
+QUERY_TERMS = 24
+# 出现在超过一半文档中的词对相关度几乎没有贡献，跳过其倒排表（小集合不跳过）
+COMMON_TERM_MIN_POSTINGS = 1000
+# 每次查询最多遍历的倒排表条目数，从最少见的词开始，保证大集合上的查询也在毫秒级
+MAX_POSTINGS_SCANNED = 20000
+
+# MinHash：SIGNATURE_BINS 个桶，LSH 分为 BANDS 段，每段 ROWS 个值
+SHINGLE_SIZE = 3
+SIGNATURE_BINS = 64
+BANDS = 16
+ROWS = SIGNATURE_BINS // BANDS
+EMPTY = (1 << 63) - 1
+
+# 补齐修改时向前多取的时间（秒），容忍各进程间的时钟误差
+SYNC_MARGIN = 60
+
+_CJK_RANGES = '\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uac00-\ud7af'
+_TOKEN = re.compile(f'[{_CJK_RANGES}]+|[^\\W_{_CJK_RANGES}]+')
+_CJK = re.compile(f'[{_CJK_RANGES}]')
+STOPWORDS = frozenset(
+    'a an and are as at be but by can for from had has have he her his i if in into is it its '
+    'me my not of on or our she so than that the their them then there these they this to '
+    'was we were what when which who will with you your'.split()
+)
+
+
+class SimilarityUnavailable(Exception):
+    """相似度索引未启用、正在建立或建立失败，status 为索引状态"""
+
+    def __init__(self, message: str, status: Optional[Dict] = None):
+        super().__init__(message)
+        self.status = status
+
+
+def tokenize(text) -> List[str]:
+    """小写的单词序列；中日韩文字没有空格分词，按相邻两字切分"""
+    if not isinstance(text, str):
+        return []
+    tokens = []
+    for match in _TOKEN.finditer(text.lower()):
+        word = match.group()
+        if _CJK.match(word):
+            if len(word) == 1:
+                tokens.append(word)
+            else:
+                tokens.extend(word[i:i + 2] for i in range(len(word) - 1))
+        elif len(word) > 1 and word not in STOPWORDS and not word.isdigit():
+            tokens.append(word)
+    return tokens
+
+
+def _hash64(value: str) -> int:
+    # 不能用内置 hash()：字符串哈希每个进程不同，签名需要能保存到磁盘
+    return int.from_bytes(hashlib.blake2b(value.encode('utf-8'), digest_size=8).digest(), 'big')
+
+
+def minhash(tokens: List[str]) -> Tuple[int, ...]:
+    """词组集合的单次哈希 MinHash 签名：每个词组只哈希一次，按哈希值分桶取最小值"""
+    if len(tokens) >= SHINGLE_SIZE:
+        shingles = {' '.join(tokens[i:i + SHINGLE_SIZE]) for i in range(len(tokens) - SHINGLE_SIZE + 1)}
+    else:
+        shingles = set(tokens)
+    signature = [EMPTY] * SIGNATURE_BINS
+    for shingle in shingles:
+        value = _hash64(shingle)
+        bucket, value = value % SIGNATURE_BINS, value // SIGNATURE_BINS
+        if value < signature[bucket]:
+            signature[bucket] = value
+    return tuple(signature)
+
+
+def jaccard(a: Tuple[int, ...], b: Tuple[int, ...]) -> float:
+    """由两个签名估计词组集合的 Jaccard 相似度（两边都为空的桶不计）"""
+    matches = filled = 0
+    for x, y in zip(a, b):
+        if x == EMPTY and y == EMPTY:
+            continue
+        filled += 1
+        if x == y:
+            matches += 1
+    return matches / filled if filled else 0.0
+
+
+def _band_keys(signature: Tuple[int, ...]) -> List[int]:
+    keys = []
+    for band in range(BANDS):
+        values = signature[band * ROWS:(band + 1) * ROWS]
+        if all(value == EMPTY for value in values):
+            continue
+        # 整数元组的 hash 在各进程间一致；冲突的候选会被 Jaccard 估计过滤掉
+        keys.append(hash((band,) + values))
+    return keys
+
+
+def analyze(title, text) -> Tuple[Dict[str, float], Tuple[int, ...]]:
+    """返回 (关键词的对数词频, 正文的 MinHash 签名)，没有正文时用标题计算签名"""
+    title_tokens = tokenize(title)
+    text_tokens = tokenize(text)
+    counts = Counter(text_tokens)
+    for token in title_tokens:
+        counts[token] += TITLE_WEIGHT
+    terms = {term: round(1 + math.log(count), 3) for term, count in counts.most_common(MAX_TERMS)}
+    return terms, minhash(text_tokens or title_tokens)
+
+
+class SimilarityIndex:
+    """一个集合的相似度索引，键为文档 _id 字符串，线程安全"""
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        # _id -> (关键词词频, 签名)
+        self._documents: Dict[str, Tuple[Dict[str, float], Tuple[int, ...]]] = {}
+        self._df: Counter = Counter()
+        self._postings: Dict[str, set] = {}
+        self._buckets: Dict[int, set] = {}
+        # 文档向量长度的缓存；IDF 随集合缓慢变化，近似值足以用于排序
+        self._norms: Dict[str, float] = {}
+
+    def __len__(self) -> int:
+        return len(self._documents)
+
+    def get(self, doc_id: str) -> Optional[Tuple[Dict[str, float], Tuple[int, ...]]]:
+        with self._lock:
+            return self._documents.get(doc_id)
+
+    def add(self, doc_id: str, title, text):
+        self._insert(doc_id, *analyze(title, text))
+
+    def _insert(self, doc_id: str, terms: Dict[str, float], signature: Tuple[int, ...]):
+        with self._lock:
+            self._remove(doc_id)
+            self._documents[doc_id] = (terms, signature)
+            for term in terms:
+                self._df[term] += 1
+                self._postings.setdefault(term, set()).add(doc_id)
+            for key in _band_keys(signature):
+                self._buckets.setdefault(key, set()).add(doc_id)
+
+    def remove(self, doc_id: str):
+        with self._lock:
+            self._remove(doc_id)
+
+    def _remove(self, doc_id: str):
+        entry = self._documents.pop(doc_id, None)
+        if entry is None:
+            return
+        self._norms.pop(doc_id, None)
+        terms, signature = entry
+        for term in terms:
+            self._df[term] -= 1
+            if self._df[term] <= 0:
+                del self._df[term]
+            _discard(self._postings, term, doc_id)
+        for key in _band_keys(signature):
+            _discard(self._buckets, key, doc_id)
+
+    def _idf(self, term: str) -> float:
+        return math.log((len(self._documents) + 1) / (self._df.get(term, 0) + 1)) + 1
+
+    def _norm(self, doc_id: str) -> float:
+        norm = self._norms.get(doc_id)
+        if norm is None:
+            terms = self._documents[doc_id][0]
+            norm = self._norms[doc_id] = math.sqrt(sum((tf * self._idf(term)) ** 2 for term, tf in terms.items()))
+        return norm
+
+    def related(self, terms: Dict[str, float], limit: int, exclude: Optional[str] = None) -> List[Tuple[str, float]]:
+        """与给定关键词最相似的文档，返回 [(_id, 余弦相似度), ...]"""
+        with self._lock:
+            query = {term: tf * self._idf(term) for term, tf in terms.items()}
+            query_norm = math.sqrt(sum(weight * weight for weight in query.values()))
+            if not query_norm:
+                return []
+            max_postings = max(COMMON_TERM_MIN_POSTINGS, len(self._documents) // 2)
+
+            # 只在查询中权重最高的词的倒排表上累加点积
+            postings = [(term, self._postings.get(term, ()))
+                        for term in heapq.nlargest(QUERY_TERMS, query, key=query.get)]
+            postings.sort(key=lambda item: len(item[1]))
+            scores: Dict[str, float] = {}
+            scanned = 0
+            for term, posting in postings:
+                if not posting or len(posting) > max_postings:
+                    continue
+                if scanned and scanned + len(posting) > MAX_POSTINGS_SCANNED:
+                    break
+                scanned += len(posting)
+                weight = query[term] * self._idf(term)
+                for doc_id in posting:
+                    scores[doc_id] = scores.get(doc_id, 0.0) + weight * self._documents[doc_id][0][term]
+            scores.pop(exclude, None)
+
+            # 点积最高的候选再按文档向量长度归一化
+            results = []
+            for doc_id, dot in heapq.nlargest(limit * 4, scores.items(), key=lambda item: item[1]):
+                norm = self._norm(doc_id)
+                if norm:
+                    results.append((doc_id, round(dot / (query_norm * norm), 4)))
+        results.sort(key=lambda item: item[1], reverse=True)
+        return results[:limit]
+
+    def duplicates(self, signature: Tuple[int, ...], threshold: float, limit: int,
+                   exclude: Optional[str] = None) -> List[Tuple[str, float]]:
+        """估计的 Jaccard 相似度不低于 threshold 的文档，返回 [(_id, 相似度), ...]"""
+        with self._lock:
+            candidates = set()
+            for key in _band_keys(signature):
+                candidates.update(self._buckets.get(key, ()))
+            candidates.discard(exclude)
+            results = []
+            for doc_id in candidates:
+                similarity = jaccard(signature, self._documents[doc_id][1])
+                if similarity >= threshold:
+                    results.append((doc_id, round(similarity, 4)))
+        results.sort(key=lambda item: item[1], reverse=True)
+        return results[:limit]
+
+    def to_dict(self) -> Dict:
+        with self._lock:
+            documents = dict(self._documents)
+        return {'documents': {doc_id: [terms, list(signature)] for doc_id, (terms, signature) in documents.items()}}
+
+    @classmethod
+    def from_dict(cls, data: Dict) -> 'SimilarityIndex':
+        index = cls()
+        for doc_id, (terms, signature) in data['documents'].items():
+            index._insert(doc_id, terms, tuple(signature))
+        return index
+
+
+def _discard(mapping: Dict, key, doc_id: str):
+    members = mapping.get(key)
+    if members is not None:
+        members.discard(doc_id)
+        if not members:
+            del mapping[key]
+
+
+class SimilarityManager:
+    """按集合维护相似度索引
+
+    索引在首次使用时于后台建立（有保存的文件时先载入，再补齐之后修改过的文档），
+    建立期间的写入暂存，完成后再应用。本服务的写入由单个后台线程按顺序应用到索引，
+    不增加请求延迟；其他进程或客户端的写入每 refresh_interval 秒按 updated_at 补齐一次，
+    删除则在查询时发现文档已不存在后移除。
+
+    每个用户一个集合时索引数量没有上限：超过 idle_timeout 秒未查询的索引，以及所有索引的
+    文档总数超过 max_total_documents 时最久未查询的索引会被移出内存，移出前保存到磁盘，
+    再次查询时载入。
+    """
+
+    def __init__(self, directory: str, enabled: bool = True, max_documents: int = 200000,
+                 duplicate_threshold: float = 0.8, refresh_interval: int = 300,
+                 save_interval: int = 60, build_wait: float = 2.0,
+                 decode: Callable = lambda value: value,
+                 max_total_documents: int = 500000, idle_timeout: int = 3600):
+        self.directory = directory
+        self.enabled = enabled
+        self.max_documents = max_documents
+        self.max_total_documents = max_total_documents
+        self.idle_timeout = idle_timeout
+        self.duplicate_threshold = duplicate_threshold
+        self.refresh_interval = refresh_interval
+        self.save_interval = save_interval
+        self.build_wait = build_wait
+        self._decode = decode
+        self._lock = threading.Lock()
+        # 按最近查询时间排列，最久未查询的在前
+        self._entries: 'OrderedDict[str, Dict]' = OrderedDict()
+        self.evicted = 0
+        # 建立、补齐和保存可能较慢，与按顺序应用写入的线程分开
+        self._builder = ThreadPoolExecutor(max_workers=1, thread_name_prefix='similarity-builder')
+        self._updater = ThreadPoolExecutor(max_workers=1, thread_name_prefix='similarity-updater')
+
+    def _path(self, key: str) -> str:
+        # 键中含有连接串（可能带密码），文件名只用其摘要
+        return os.path.join(self.directory, hashlib.sha1(key.encode()).hexdigest() + '.json.gz')
+
+    def ensure(self, key: str, collection) -> SimilarityIndex:
+        """返回集合的索引；尚未建立时安排建立并最多等待 build_wait 秒
+
+        未启用、仍在建立或建立失败时抛出 SimilarityUnavailable。
+        """
+        if not self.enabled:
+            raise SimilarityUnavailable("相似度索引未启用")
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or (entry['state'] == 'failed'
+                                 and time.time() - entry['updated_at'] > self.refresh_interval):
+                entry = self._entries[key] = {
+                    'state': 'building', 'index': None, 'pending': [], 'future': Future(),
+                    'synced_at': None, 'dirty': False, 'saving': False, 'saved_at': time.time(),
+                    'refreshing': False, 'error': None, 'updated_at': time.time(),
+                    'used_at': time.time(),
+                }
+                self._builder.submit(self._build, key, collection)
+            elif (entry['state'] == 'ready' and not entry['refreshing']
+                  and time.time() - entry['synced_at'] > self.refresh_interval):
+                entry['refreshing'] = True
+                self._builder.submit(self._refresh, key, collection)
+            entry['used_at'] = time.time()
+            self._entries.move_to_end(key)
+            future = entry['future']
+        self._evict(keep=key)
+
+        if not future.done():
+            try:
+                future.result(self.build_wait)
+            except Exception:
+                pass
+        with self._lock:
+            if entry['state'] == 'ready':
+                return entry['index']
+        raise SimilarityUnavailable(
+            "相似度索引正在建立，请稍后重试" if entry['state'] == 'building' else "相似度索引建立失败",
+            self.status(key)
+        )
+
+    def _build(self, key: str, collection):
+        try:
+            index, since = self._load(key)
+            if index is None:
+                total = collection.estimated_document_count()
+                if total > self.max_documents:
+                    raise ValueError(f"集合中有 {total} 条内容，超过 SIMILARITY_MAX_DOCUMENTS（{self.max_documents}）")
+                index = SimilarityIndex()
+            synced_at = self._scan(index, collection, since)
+        except Exception as e:
+            logger.error(f"建立相似度索引失败 {collection.full_name}: {e}")
+            with self._lock:
+                entry = self._entries[key]
+                entry.update(state='failed', error=str(e), pending=[], updated_at=time.time())
+            entry['future'].set_result(None)
+            return
+
+        with self._lock:
+            entry = self._entries[key]
+            for op, args in entry['pending']:
+                getattr(index, op)(*args)
+            entry.update(state='ready', index=index, pending=[], synced_at=synced_at,
+                         dirty=True, error=None, updated_at=time.time())
+        entry['future'].set_result(None)
+        logger.info(f"{collection.full_name} 的相似度索引已就绪（{len(index)} 条）")
+        self._save(key)
+        self._evict(keep=key)
+
+    def _evict(self, keep: Optional[str] = None):
+        """移出空闲超时的索引，并按最久未查询的顺序移出索引直到文档总数不超过上限
+
+        keep 为本次查询的集合，不会被移出；正在建立的索引不计入也不移出。
+        有未保存修改的索引在建立线程中保存，排在之后对同一集合的建立之前。
+        """
+        now = time.time()
+        evicted = []
+        with self._lock:
+            total = sum(len(entry['index']) for entry in self._entries.values() if entry['index'] is not None)
+            for key in list(self._entries):
+                entry = self._entries[key]
+                if key == keep or entry['state'] == 'building':
+                    continue
+                if now - entry['used_at'] <= self.idle_timeout and total <= self.max_total_documents:
+                    # 之后的索引都更近被查询过
+                    break
+                del self._entries[key]
+                total -= len(entry['index']) if entry['index'] is not None else 0
+                evicted.append((key, entry))
+            self.evicted += len(evicted)
+        for key, entry in evicted:
+            logger.info(f"相似度索引 {self._path(key)} 已移出内存")
+            if entry['dirty']:
+                self._builder.submit(self._save, key, entry)
+
+    def _refresh(self, key: str, collection):
+        """补齐上次同步之后在其他地方修改过的文档"""
+        with self._lock:
+            entry = self._entries[key]
+            index, since = entry['index'], entry['synced_at']
+        try:
+            synced_at = self._scan(index, collection, since)
+            with self._lock:
+                entry.update(synced_at=synced_at, dirty=True)
+        except Exception as e:
+            logger.warning(f"补齐相似度索引失败 {collection.full_name}: {e}")
+        finally:
+            with self._lock:
+                entry['refreshing'] = False
+
+    def _scan(self, index: SimilarityIndex, collection, since: Optional[float]) -> float:
+        """把集合中（since 之后修改过的）文档加入索引，返回本次同步的起始时间"""
+        started = time.time()
+        query = {}
+        if since is not None:
+            query = {'updated_at': {'$gte': datetime.fromtimestamp(since - SYNC_MARGIN, timezone.utc)}}
+        for doc in collection.find(query, {'title': 1, 'text': 1}):
+            index.add(str(doc['_id']), self._decode(doc.get('title')), self._decode(doc.get('text')))
+        return started
+
+    def _load(self, key: str) -> Tuple[Optional[SimilarityIndex], Optional[float]]:
+        path = self._path(key)
+        if not os.path.exists(path):
+            return None, None
+        try:
+            with gzip.open(path, 'rb') as f:
+                data = json.loads(f.read())
+            if data.get('version') != FORMAT_VERSION:
+                return None, None
+            return SimilarityIndex.from_dict(data), data['synced_at']
+        except Exception as e:
+            logger.warning(f"读取保存的相似度索引失败，将重新建立: {e}")
+            return None, None
+
+    def _save(self, key: str, entry: Optional[Dict] = None):
+        """保存集合的索引，entry 为已移出内存的索引"""
+        with self._lock:
+            if entry is None:
+                entry = self._entries.get(key)
+            if entry is None or entry['state'] != 'ready' or not entry['dirty']:
+                if entry is not None:
+                    entry['saving'] = False
+                return
+            entry.update(dirty=False, saving=True)
+            index, synced_at = entry['index'], entry['synced_at']
+        path = self._path(key)
+        try:
+            data = index.to_dict()
+            data.update(version=FORMAT_VERSION, synced_at=synced_at)
+            os.makedirs(self.directory, mode=0o700, exist_ok=True)
+            temp = f"{path}.{os.getpid()}.tmp"
+            with gzip.open(temp, 'wb', compresslevel=5) as f:
+                f.write(dumps_bytes(data))
+            # 多个 worker 共用目录时后写入的覆盖先写入的，都是完整的索引
+            os.replace(temp, path)
+        except Exception as e:
+            logger.error(f"保存相似度索引失败: {e}")
+            with self._lock:
+                entry['dirty'] = True
+        finally:
+            with self._lock:
+                entry.update(saving=False, saved_at=time.time())
+
+    def _submit(self, key: str, op: str, *args):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry['state'] == 'failed':
+                return
+        self._updater.submit(self._apply, key, op, args)
+
+    def _apply(self, key: str, op: str, args: Tuple):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry['state'] == 'failed':
+                return
+            if entry['state'] == 'building':
+                entry['pending'].append((op, args))
+                return
+            index = entry['index']
+        try:
+            getattr(index, op)(*args)
+        except Exception as e:
+            logger.error(f"更新相似度索引失败: {e}")
+            return
+        with self._lock:
+            entry['dirty'] = True
+            save = not entry['saving'] and time.time() - entry['saved_at'] > self.save_interval
+            if save:
+                entry['saving'] = True
+        if save:
+            self._builder.submit(self._save, key)
+
+    def add(self, key: str, documents: Iterable[Dict]):
+        """写入或更新后把文档加入索引，documents 需包含 _id、title 和 text"""
+        for doc in documents:
+            self._submit(key, 'add', str(doc['_id']), self._decode(doc.get('title')), self._decode(doc.get('text')))
+
+    def remove(self, key: str, doc_id: str):
+        self._submit(key, 'remove', doc_id)
+
+    def tracks(self, key: str) -> bool:
+        """本进程是否在为集合维护索引（未维护时写入无需更新索引）"""
+        with self._lock:
+            entry = self._entries.get(key)
+            return entry is not None and entry['state'] != 'failed'
+
+    def status(self, key: str) -> Optional[Dict]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            return {
+                'state': entry['state'],
+                'documents': len(entry['index']) if entry['index'] is not None else 0,
+                'synced_at': entry['synced_at'],
+                'error': entry['error'],
+                'updated_at': entry['updated_at'],
+            }
+
+    def shutdown(self):
+        """应用已排队的写入，保存有变化的索引"""
+        self._updater.shutdown(wait=True)
+        with self._lock:
+            keys = [key for key, entry in self._entries.items() if entry['dirty']]
+        for key in keys:
+            self._save(key)
+        self._builder.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,351 @@
+#!/usr/bin/env python3
+"""
+捕获内容 API 测试
+用 mongomock 代替 MongoDB（pip install -r requirements-dev.txt），可直接运行或通过 pytest 执行
+"""
+
+import io
+import itertools
+from collections import Counter
+from contextlib import contextmanager
+
+import mongomock
+from bson import ObjectId
+from gridfs.errors import NoFile
+
+import mongo_steps
+from app import app
+from client_pool import ClientEntry, PoolStats
+from routes import db_service
+from write_buffer import WriteBuffer
+
+MONGO_URI = 'mongodb://localhost/capture_test'
+
+
+class _FakeHealth:
+    healthy = True
+
+    def needs_probe(self):
+        return False
+
+
+class _FakeBucket:
+    """内存中的 GridFS 存储桶，mongomock 的 GridFS 与当前 pymongo 不兼容"""
+    files = {}
+
+    def __init__(self, database, bucket_name):
+        self.prefix = (database.name, bucket_name)
+
+    def upload_from_stream(self, filename, source, metadata=None):
+        file_id = ObjectId()
+        self.files[(*self.prefix, file_id)] = bytes(source)
+        return file_id
+
+    def delete(self, file_id):
+        if self.files.pop((*self.prefix, file_id), None) is None:
+            raise NoFile(file_id)
+
+    def open_download_stream(self, file_id):
+        if (*self.prefix, file_id) not in self.files:
+            raise NoFile(file_id)
+        return io.BytesIO(self.files[(*self.prefix, file_id)])
+
+
+_mongo = mongomock.MongoClient()
+db_service._create_client = lambda uri: ClientEntry(_mongo, _FakeHealth(), PoolStats())
+db_service.clients.factory = db_service._create_client
+mongo_steps.GridFSBucket = _FakeBucket
+client = app.test_client()
+_collections = itertools.count()
+
+
+def _connect():
+    """连接到一个新的空集合，返回请求头"""
+    response = client.post('/api/database/connect', json={
+        'mongo_uri': MONGO_URI, 'collection_name': 'captures_%d' % next(_collections)
+    })
+    assert response.status_code == 200, response.json
+    return {'Authorization': f"Bearer {response.json['data']['token']}"}
+
+
+def _create(headers, **fields):
+    response = client.post('/api/capture', headers=headers, json={'title': 't', **fields})
+    assert response.status_code == 201, response.json
+    return response.json['data']['id']
+
+
+@contextmanager
+def _calls():
+    """统计期间对 mongomock 集合的查询和计数调用"""
+    calls = Counter()
+    originals = {name: getattr(mongomock.collection.Collection, name)
+                 for name in ('aggregate', 'count_documents', 'estimated_document_count')}
+
+    nested = []
+
+    def spy(name):
+        def wrapper(collection, *args, **kwargs):
+            # estimated_document_count 在 mongomock 中调用 count_documents，只统计最外层的调用
+            if not nested:
+                calls[name] += 1
+            nested.append(name)
+            try:
+                return originals[name](collection, *args, **kwargs)
+            finally:
+                nested.pop()
+        return wrapper
+
+    for name in originals:
+        setattr(mongomock.collection.Collection, name, spy(name))
+    try:
+        yield calls
+    finally:
+        for name, original in originals.items():
+            setattr(mongomock.collection.Collection, name, original)
+
+
+def _list(headers, query):
+    # mongomock 不支持摘要视图的 $substrCP，测试中用 fields 或 view=full
+    response = client.get(f'/api/captures?{query}', headers=headers)
+    assert response.status_code == 200, (query, response.json)
+    return response.json['data']
+
+
+def test_large_body_readable():
+    """超过 LARGE_BODY_THRESHOLD 的 html 外置到 GridFS 后仍能完整读回"""
+    print("🔨 外置正文读回...")
+    headers = _connect()
+    html = '<p>' + '大' * db_service.bodies.threshold + '</p>'
+    capture_id = _create(headers, html=html, text='正文')
+
+    data = client.get(f'/api/captures/{capture_id}', headers=headers).json['data']
+    assert 'html' not in data
+    assert data['body_files']['html']['length'] == len(html.encode('utf-8'))
+    assert data['text'] == '正文'
+
+    # 侧边栏查看内容时使用 include=html
+    data = client.get(f'/api/captures/{capture_id}?include=html', headers=headers).json['data']
+    assert data['html'] == html
+
+    response = client.get(f'/api/captures/{capture_id}/html', headers=headers)
+    assert response.status_code == 200 and response.get_data(as_text=True) == html
+    print("✅ 通过")
+
+
+def test_etag_include():
+    """include 不同的响应 ETag 不同，不带正文的 ETag 不能让带正文的请求返回 304"""
+    print("🔨 单条内容 ETag 与 include...")
+    headers = _connect()
+    capture_id = _create(headers, html='<p>' + 'x' * db_service.bodies.threshold + '</p>')
+    plain = client.get(f'/api/captures/{capture_id}', headers=headers)
+    full = client.get(f'/api/captures/{capture_id}?include=text,html', headers=headers)
+    assert plain.headers['ETag'] == f'"{capture_id}-1"', plain.headers['ETag']
+    assert full.headers['ETag'] == f'"{capture_id}-1-html+text"', full.headers['ETag']
+
+    response = client.get(f'/api/captures/{capture_id}?include=html',
+                          headers={**headers, 'If-None-Match': plain.headers['ETag']})
+    assert response.status_code == 200 and 'html' in response.json['data']
+    response = client.get(f'/api/captures/{capture_id}?include=html,text',
+                          headers={**headers, 'If-None-Match': full.headers['ETag']})
+    assert response.status_code == 304 and response.headers['ETag'] == full.headers['ETag']
+    response = client.get(f'/api/captures/{capture_id}',
+                          headers={**headers, 'If-None-Match': plain.headers['ETag']})
+    assert response.status_code == 304
+    print("✅ 通过")
+
+
+def test_page_bounds():
+    """page 小于 1、limit 小于 1 或不是整数时返回 400，limit 超过 100 时按 100 处理"""
+    print("🔨 分页参数校验...")
+    headers = _connect()
+    _create(headers)
+    for query in ('page=0', 'page=-1', 'limit=0', 'limit=-5', 'page=x', 'limit=1.5'):
+        for path in (f'/api/captures?{query}', f'/api/search?q=t&{query}'):
+            response = client.get(path, headers=headers)
+            assert response.status_code == 400, (path, response.status_code, response.json)
+    data = client.get('/api/captures?fields=title&limit=1000', headers=headers).json['data']
+    assert data['limit'] == 100 and data['total'] == 1
+    print("✅ 通过")
+
+
+def test_count_races_write():
+    """计数期间有写入时不缓存旧的总数"""
+    print("🔨 计数与写入并发...")
+    headers = _connect()
+    _create(headers)
+    original = mongomock.collection.Collection.count_documents
+
+    def count_then_write(collection, *args, **kwargs):
+        count = original(collection, *args, **kwargs)
+        # 计数完成后、写入缓存前，另一个请求写入了集合
+        mongomock.collection.Collection.count_documents = original
+        _create(headers)
+        return count
+
+    mongomock.collection.Collection.count_documents = count_then_write
+    try:
+        data = client.get('/api/captures?view=full', headers=headers).json['data']
+    finally:
+        mongomock.collection.Collection.count_documents = original
+    assert data['total'] == 1
+    for params in ('view=full', 'fields=title'):
+        data = client.get(f'/api/captures?{params}', headers=headers).json['data']
+        assert data['total'] == 2 and len(data['captures']) == 2, (params, data)
+    print("✅ 通过")
+
+
+def test_list_facet_and_count_modes():
+    """只取摘要字段时当前页和总数在一次 $facet 聚合中取回；estimated 和 none 不做精确计数"""
+    print("🔨 列表总数与计数方式...")
+    headers = _connect()
+    for i in range(5):
+        _create(headers, title='t%d' % i, text='正文%d' % i, categories=['a'] if i % 2 else ['b'])
+
+    with _calls() as calls:
+        data = _list(headers, 'count=estimated&fields=title&limit=2')
+    assert data['total'] == 5 and len(data['captures']) == 2, data
+    assert calls == {'estimated_document_count': 1, 'aggregate': 1}, calls
+
+    with _calls() as calls:
+        data = _list(headers, 'category=a&fields=title&limit=1&page=2')
+    assert data['total'] == 2 and data['page'] == 2, data
+    assert [c['title'] for c in data['captures']] == ['t3'], data
+    assert calls == {'aggregate': 1}, calls
+
+    # 返回正文时不使用 $facet，总数另行计算
+    with _calls() as calls:
+        data = _list(headers, 'category=b&view=full&limit=1')
+    assert data['total'] == 3 and data['captures'][0]['text'] == '正文0', data
+    assert calls == {'aggregate': 1, 'count_documents': 1}, calls
+
+    # 有筛选条件时 estimated 按精确计数处理，这里命中上面缓存的计数
+    with _calls() as calls:
+        data = _list(headers, 'category=b&count=estimated&fields=title')
+    assert data['total'] == 3 and calls == {'aggregate': 1}, (data, calls)
+
+    with _calls() as calls:
+        data = _list(headers, 'category=a&count=none&fields=title')
+    assert data['total'] is None and len(data['captures']) == 2, data
+    assert calls == {'aggregate': 1}, calls
+    print("✅ 通过")
+
+
+def test_list_cursor():
+    """游标分页按 _id 倒序，next_cursor 取到最后一页为 null，总数不受游标位置影响"""
+    print("🔨 游标分页...")
+    headers = _connect()
+    for i in range(5):
+        _create(headers, title='t%d' % i)
+
+    titles, cursor, totals = [], '', []
+    while cursor is not None:
+        data = _list(headers, f'fields=title&limit=2&cursor={cursor}')
+        assert 'page' not in data, data
+        titles.append([c['title'] for c in data['captures']])
+        totals.append(data['total'])
+        cursor = data['next_cursor']
+    assert titles == [['t4', 't3'], ['t2', 't1'], ['t0']], titles
+    assert totals == [5, 5, 5], totals
+
+    response = client.get('/api/captures?cursor=!!', headers=headers)
+    assert response.status_code == 400
+    print("✅ 通过")
+
+
+def test_list_and_category_caches():
+    """相同的列表查询和分类统计直接使用缓存，写入后失效或按变化更新"""
+    print("🔨 查询缓存与分类缓存...")
+    headers = _connect()
+    first = _create(headers, title='t0', categories=['a'])
+
+    data = _list(headers, 'fields=title')
+    with _calls() as calls:
+        assert _list(headers, 'fields=title') == data
+        counts = client.get('/api/categories', headers=headers).json['data']['counts']
+        assert client.get('/api/categories', headers=headers).json['data']['counts'] == counts
+    assert counts == {'a': 1}, counts
+    # 列表命中缓存；分类只聚合一次
+    assert calls == {'aggregate': 1}, calls
+
+    second = _create(headers, title='t1', categories=['a', 'b'])
+    with _calls() as calls:
+        data = _list(headers, 'fields=title')
+        counts = client.get('/api/categories', headers=headers).json['data']['counts']
+    assert data['total'] == 2, data
+    assert counts == {'a': 2, 'b': 1}, counts
+    # 写入使列表缓存失效，分类计数由写入的变化直接更新
+    assert calls == {'aggregate': 1}, calls
+
+    response = client.put(f'/api/captures/{first}', headers=headers, json={'categories': ['b']})
+    assert response.status_code == 200, response.json
+    assert client.delete(f'/api/captures/{second}', headers=headers).status_code == 200
+    with _calls() as calls:
+        counts = client.get('/api/categories', headers=headers).json['data']['counts']
+    assert counts == {'b': 1}, counts
+    assert calls == {}, calls
+    assert [c['title'] for c in _list(headers, 'fields=title,categories')['captures']] == ['t0']
+    print("✅ 通过")
+
+
+def test_list_etag():
+    """列表返回弱 ETag，未写入时 If-None-Match 不查询直接返回 304，写入或参数变化后 ETag 改变"""
+    print("🔨 列表 ETag...")
+    headers = _connect()
+    _create(headers)
+    response = client.get('/api/captures?fields=title', headers=headers)
+    etag = response.headers['ETag']
+    assert etag.startswith('W/'), etag
+
+    with _calls() as calls:
+        response = client.get('/api/captures?fields=title', headers={**headers, 'If-None-Match': etag})
+    assert response.status_code == 304 and response.headers['ETag'] == etag
+    assert not response.data and calls == {}, calls
+
+    other = client.get('/api/captures?fields=title&limit=5', headers=headers).headers['ETag']
+    assert other != etag
+    response = client.get('/api/captures?fields=title&category=a', headers={**headers, 'If-None-Match': etag})
+    assert response.status_code == 200 and response.headers['ETag'] != etag
+
+    _create(headers)
+    response = client.get('/api/captures?fields=title', headers={**headers, 'If-None-Match': etag})
+    assert response.status_code == 200 and response.headers['ETag'] != etag
+    assert response.json['data']['total'] == 2
+    print("✅ 通过")
+
+
+def test_queued_status():
+    """ack=queued 只有真正入队时返回 202，队列已满改为直接写入时返回 201"""
+    print("🔨 入队与直接写入的状态码...")
+    headers = _connect()
+    original = db_service.write_buffer
+    db_service.write_buffer = WriteBuffer(db_service._flush_buffered, max_size=1, batch_size=10, flush_interval=3600)
+    try:
+        statuses = [client.post('/api/capture?ack=queued', headers=headers, json={'title': 't%d' % i}).status_code
+                    for i in range(2)]
+    finally:
+        db_service.write_buffer.close()
+        db_service.write_buffer = original
+    assert statuses == [202, 201], statuses
+    data = client.get('/api/captures?fields=title', headers=headers).json['data']
+    assert sorted(c['title'] for c in data['captures']) == ['t0', 't1'], data
+    print("✅ 通过")
+
+
+def main():
+    """主测试函数"""
+    print("🚀 开始捕获内容API测试...")
+    print("=" * 50)
+    test_large_body_readable()
+    test_etag_include()
+    test_page_bounds()
+    test_count_races_write()
+    test_list_facet_and_count_modes()
+    test_list_cursor()
+    test_list_and_category_caches()
+    test_list_etag()
+    test_queued_status()
+    print("✅ 所有测试完成！")
+
+
+if __name__ == "__main__":
+    main()
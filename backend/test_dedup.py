@@ -0,0 +1,101 @@
+#!/usr/bin/env python3
+"""
+内容指纹和合并更新测试
+不需要 MongoDB，可直接运行或通过 pytest 执行
+"""
+
+import hashlib
+from datetime import datetime, timezone
+
+from dedup import DedupStats, content_hash, merge_update
+
+NOW = datetime(2026, 10, 18, tzinfo=timezone.utc)
+
+
+def test_content_hash_normalizes():
+    """text 的空白差异和 url 首尾空白不影响指纹，html 原样参与"""
+    print("🔨 指纹规范化...")
+    base = content_hash({'url': 'https://a.example/', 'text': 'hello world', 'html': '<p>x</p>'})
+    assert base == hashlib.sha256('https://a.example/\0hello world\0<p>x</p>'.encode('utf-8')).hexdigest()
+    assert content_hash({'url': ' https://a.example/ ', 'text': ' hello\n\tworld ', 'html': '<p>x</p>'}) == base
+    # 其他字段不参与
+    assert content_hash({'url': 'https://a.example/', 'text': 'hello world', 'html': '<p>x</p>',
+                         'title': 't', 'categories': ['c']}) == base
+    assert content_hash({'url': 'https://a.example/', 'text': 'hello world', 'html': '<p>x</p> '}) != base
+    assert content_hash({'url': 'https://b.example/', 'text': 'hello world', 'html': '<p>x</p>'}) != base
+    assert content_hash({'url': 'https://a.example/', 'text': 'hello  world!', 'html': '<p>x</p>'}) != base
+    print("✅ 通过")
+
+
+def test_content_hash_fields_are_separated():
+    """字段之间有分隔，内容在字段间移动会得到不同的指纹"""
+    print("🔨 指纹字段分隔...")
+    assert content_hash({'text': 'ab', 'html': 'c'}) != content_hash({'text': 'a', 'html': 'bc'})
+    assert content_hash({'url': 'a', 'text': 'b'}) != content_hash({'text': 'a b'})
+    print("✅ 通过")
+
+
+def test_content_hash_empty():
+    """text 和 html 都为空（或不是字符串）时不参与去重"""
+    print("🔨 空内容...")
+    assert content_hash({}) is None
+    assert content_hash({'url': 'https://a.example/'}) is None
+    assert content_hash({'url': 'https://a.example/', 'text': ' \n ', 'html': ''}) is None
+    assert content_hash({'text': 123, 'html': ['x']}) is None
+    assert content_hash({'html': '<p></p>'}) is not None
+    print("✅ 通过")
+
+
+def test_merge_update():
+    """分类取并集，timestamp 取较新的，版本和重复次数加一"""
+    print("🔨 合并更新...")
+    timestamp = datetime(2026, 1, 1, tzinfo=timezone.utc)
+    assert merge_update({'categories': ['a', 'b'], 'timestamp': timestamp}, NOW) == {
+        '$set': {'updated_at': NOW},
+        '$inc': {'_version': 1, 'duplicate_count': 1},
+        '$addToSet': {'categories': {'$each': ['a', 'b']}},
+        '$max': {'timestamp': timestamp},
+    }
+    print("✅ 通过")
+
+
+def test_merge_update_without_optional_fields():
+    """没有分类或 timestamp 时不生成对应的更新操作"""
+    print("🔨 合并更新（无可选字段）...")
+    expected = {'$set': {'updated_at': NOW}, '$inc': {'_version': 1, 'duplicate_count': 1}}
+    assert merge_update({}, NOW) == expected
+    assert merge_update({'categories': [], 'timestamp': None}, NOW) == expected
+    assert merge_update({'categories': 'a'}, NOW) == expected
+    print("✅ 通过")
+
+
+def test_dedup_stats():
+    """按模式统计重复数和比例"""
+    print("🔨 去重统计...")
+    stats = DedupStats('merge')
+    assert stats.stats()['ratio'] == 0
+    stats.record(3, 1)
+    stats.record(1, 0)
+    assert stats.stats() == {'mode': 'merge', 'checked': 4, 'duplicates': 1, 'merged': 1,
+                             'rejected': 0, 'referenced': 0, 'ratio': 0.25}
+    stats = DedupStats('off')
+    stats.record(2, 2)
+    assert stats.stats()['duplicates'] == 0 and stats.stats()['checked'] == 2
+    print("✅ 通过")
+
+
+def main():
+    """主测试函数"""
+    print("🚀 开始内容去重测试...")
+    print("=" * 50)
+    test_content_hash_normalizes()
+    test_content_hash_fields_are_separated()
+    test_content_hash_empty()
+    test_merge_update()
+    test_merge_update_without_optional_fields()
+    test_dedup_stats()
+    print("✅ 所有测试完成！")
+
+
+if __name__ == "__main__":
+    main()
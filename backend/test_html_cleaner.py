@@ -0,0 +1,108 @@
+#!/usr/bin/env python3
+"""
+HTML 清理和正文提取测试
+不需要 MongoDB，可直接运行或通过 pytest 执行
+"""
+
+from html_cleaner import clean_html, count_words, normalize_text, process_capture
+
+
+def test_drop_elements():
+    """script/style 等元素连同内容去掉，嵌套同名元素也能正确结束"""
+    print("🔨 去掉不可见元素...")
+    cleaned, text, _ = clean_html(
+        '<div>a<script>var x = "<p>";</script>b<style>p{}</style>'
+        '<template><template>t</template>inner</template>c<noscript>n</noscript></div>'
+        '<meta charset="utf-8"><link rel="x" href="y"><!-- 注释 --><p>d</p>'
+    )
+    assert cleaned == '<div>abc</div><p>d</p>', cleaned
+    assert text == 'abc\n\nd', repr(text)
+    print("✅ 通过")
+
+
+def test_drop_attributes():
+    """事件处理、style、data-* 和 javascript:/data: 链接去掉，其余属性转义保留"""
+    print("🔨 去掉跟踪和脚本属性...")
+    cleaned, _, data_uris = clean_html(
+        '<a href="javascript:alert(1)" onclick="x()" data-id="1" class="c" title=\'a"b\'>l</a>'
+        '<img src="data:image/png;base64,AAAA" alt="i">'
+        '<img srcset="a.png 1x, data:image/png;base64,AA 2x">'
+        '<img src="https://example.com/a.png" style="color:red" hidden>'
+    )
+    assert cleaned == (
+        '<a class="c" title="a&quot;b">l</a><img alt="i"><img>'
+        '<img src="https://example.com/a.png" hidden>'
+    ), cleaned
+    assert data_uris == 2
+    print("✅ 通过")
+
+
+def test_whitespace_and_escaping():
+    """空白合并但 pre 内保留，文本重新转义"""
+    print("🔨 空白和转义...")
+    cleaned, text, _ = clean_html('<p>  a \t\t b &amp; &lt;c&gt; </p><pre>x\n  y</pre><br/><p>z</p>')
+    assert cleaned == '<p> a b &amp; &lt;c&gt; </p><pre>x\n  y</pre><br><p>z</p>', cleaned
+    assert text == 'a b & <c>\n\nx\ny\n\nz', repr(text)
+    print("✅ 通过")
+
+
+def test_normalize_text():
+    """每行合并空白，去掉零宽字符，连续空行最多保留一行"""
+    print("🔨 正文规范化...")
+    assert normalize_text('  a\u200b b \r\n\r\n\r\n\r\n c  d\r e ') == 'a b\n\nc d\ne'
+    assert normalize_text('\n\n\ufeff\n') == ''
+    print("✅ 通过")
+
+
+def test_count_words():
+    """中日文按字计数，其他文字按连续字母数字计"""
+    print("🔨 词数统计...")
+    assert count_words('') == 0
+    assert count_words('hello, world 2026') == 3
+    assert count_words('你好世界') == 4
+    assert count_words('MongoDB 数据库 and カタカナ') == 1 + 3 + 1 + 4
+    assert count_words('naïve café') == 2
+    print("✅ 通过")
+
+
+def test_process_capture():
+    """有 text 时只规范化 text，为空时从 html 提取"""
+    print("🔨 捕获处理...")
+    source = '<p>hello <b>world</b></p><script>x</script>'
+    result = process_capture(source, '')
+    assert result['html'] == '<p>hello <b>world</b></p>'
+    assert result['text'] == 'hello world'
+    assert result['text_extracted'] is True
+    assert result['word_count'] == 2
+    assert result['bytes_in'] == len(source) and result['bytes_out'] == len(result['html'])
+    assert result['data_uris'] == 0
+
+    result = process_capture(source, '  原有  正文 ')
+    assert result['text'] == '原有 正文'
+    assert result['text_extracted'] is False
+    assert result['word_count'] == 4
+
+    result = process_capture(None, 'only text')
+    assert 'html' not in result and 'bytes_in' not in result
+    assert result['text'] == 'only text' and result['word_count'] == 2
+
+    result = process_capture(None, None)
+    assert result['text'] == '' and result['text_extracted'] is True and result['word_count'] == 0
+    print("✅ 通过")
+
+
+def main():
+    """主测试函数"""
+    print("🚀 开始HTML清理测试...")
+    print("=" * 50)
+    test_drop_elements()
+    test_drop_attributes()
+    test_whitespace_and_escaping()
+    test_normalize_text()
+    test_count_words()
+    test_process_capture()
+    print("✅ 所有测试完成！")
+
+
+if __name__ == "__main__":
+    main()
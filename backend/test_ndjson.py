@@ -0,0 +1,123 @@
+#!/usr/bin/env python3
+"""
+NDJSON / JSON 数组流式解析测试
+不需要 MongoDB，可直接运行或通过 pytest 执行
+"""
+
+import io
+
+from ndjson import encode_lines, iter_array, iter_lines
+
+
+def _lines(data, **kwargs):
+    return list(iter_lines(io.BytesIO(data), **kwargs))
+
+
+def _array(data, **kwargs):
+    return list(iter_array(io.BytesIO(data), **kwargs))
+
+
+def test_iter_lines_basic():
+    """逐行解析，空行不算记录，无效行记为错误"""
+    print("🔨 NDJSON 基本解析...")
+    data = b'{"a": 1}\n\n  \n{"a": 2}\nnot json\n{"a": 3}'
+    assert _lines(data) == [({'a': 1}, None), ({'a': 2}, None), (None, "JSON格式无效"), ({'a': 3}, None)]
+    print("✅ 通过")
+
+
+def test_iter_lines_chunk_boundaries():
+    """记录跨块边界时结果与整块读取一致"""
+    print("🔨 NDJSON 跨块边界...")
+    documents = [{'title': '标题%d' % i, 'text': 'x' * i} for i in range(50)]
+    data = b''.join(encode_lines(documents, chunk_size=1))
+    for chunk_size in (1, 3, 7, 64, 1024 * 1024):
+        assert _lines(data, chunk_size=chunk_size) == [(d, None) for d in documents], chunk_size
+    print("✅ 通过")
+
+
+def test_iter_lines_skip():
+    """前 skip 条记录跳过，空行不计数"""
+    print("🔨 NDJSON 跳过已处理记录...")
+    data = b'{"a": 1}\n\n{"a": 2}\nbad\n{"a": 3}\n'
+    assert _lines(data, skip=2) == [(None, "JSON格式无效"), ({'a': 3}, None)]
+    assert _lines(data, skip=10) == []
+    print("✅ 通过")
+
+
+def test_iter_lines_oversized():
+    """超长行记为一条错误，后续记录正常解析"""
+    print("🔨 NDJSON 超长行...")
+    data = b'{"a": 1}\n{"big": "' + b'x' * 100 + b'"}\n{"a": 2}\n'
+    assert _lines(data, chunk_size=8, max_record_bytes=32) == [
+        ({'a': 1}, None), (None, "单条记录过大"), ({'a': 2}, None)
+    ]
+    assert _lines(data, chunk_size=8, max_record_bytes=32, skip=2) == [({'a': 2}, None)]
+    print("✅ 通过")
+
+
+def test_iter_array_basic():
+    """解析顶层数组，支持空数组、空白和多字节字符跨块"""
+    print("🔨 JSON 数组基本解析...")
+    assert _array(b'[]') == []
+    assert _array(b' \n[ ]\n') == []
+    data = '[{"title": "中文标题"}, 2, "s", [1, 2], {"n": null}]'.encode('utf-8')
+    expected = [({'title': '中文标题'}, None), (2, None), ('s', None), ([1, 2], None), ({'n': None}, None)]
+    for chunk_size in (1, 2, 5, 1024 * 1024):
+        assert _array(data, chunk_size=chunk_size) == expected, chunk_size
+    assert _array(data, skip=3) == expected[3:]
+    print("✅ 通过")
+
+
+def test_iter_array_invalid():
+    """格式错误时抛出 ValueError，之前的记录已产出"""
+    print("🔨 JSON 数组格式错误...")
+    cases = [
+        (b'{"a": 1}', "请求体必须是JSON数组"),
+        (b'[{"a": 1}', "JSON数组不完整"),
+        (b'[{"a": 1},]', "第 1 条记录后JSON格式无效"),
+        (b'[{"a": 1} {"a": 2}]', "第 1 条记录后JSON格式无效"),
+        (b'[{"a": 1}, {"a": ]', "第 2 条记录JSON格式无效"),
+    ]
+    for data, message in cases:
+        produced = []
+        try:
+            for item in iter_array(io.BytesIO(data), chunk_size=4):
+                produced.append(item)
+        except ValueError as e:
+            assert str(e) == message, (data, str(e))
+        else:
+            raise AssertionError(f"未抛出异常: {data!r}")
+        if data.startswith(b'[{"a": 1}'):
+            assert produced == [({'a': 1}, None)], (data, produced)
+    print("✅ 通过")
+
+
+def test_iter_array_oversized():
+    """单条记录超过 max_record_bytes 时不再继续读入"""
+    print("🔨 JSON 数组超长记录...")
+    data = b'[{"big": "' + b'x' * 100 + b'"}]'
+    try:
+        _array(data, chunk_size=8, max_record_bytes=32)
+    except ValueError as e:
+        assert str(e) == "第 1 条记录JSON格式无效"
+    else:
+        raise AssertionError("未抛出异常")
+    print("✅ 通过")
+
+
+def main():
+    """主测试函数"""
+    print("🚀 开始流式解析测试...")
+    print("=" * 50)
+    test_iter_lines_basic()
+    test_iter_lines_chunk_boundaries()
+    test_iter_lines_skip()
+    test_iter_lines_oversized()
+    test_iter_array_basic()
+    test_iter_array_invalid()
+    test_iter_array_oversized()
+    print("✅ 所有测试完成！")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,326 @@
+#!/usr/bin/env python3
+"""
+令牌注册表并发压力测试
+不需要 MongoDB，可直接运行或通过 pytest 执行；DatabaseService 的测试用假的 MongoClient
+"""
+
+import random
+import threading
+import time
+from collections import Counter
+
+from client_pool import ClientEntry, ClientRegistry, PoolStats
+from database import DatabaseService
+from token_registry import TokenRegistry
+from token_store import MemoryTokenStore, TokenStore
+
+THREADS = 32
+OPERATIONS = 2000
+CLUSTERS = ["mongodb://cluster-%d/" % i for i in range(4)]
+
+
+class _FakeClient:
+    def close(self):
+        pass
+
+
+class _FakeHealth:
+    healthy = True
+
+    def needs_probe(self):
+        return False
+
+
+class _FakeCollection:
+    def __init__(self, database, name):
+        self.name = name
+        self.full_name = f"{database}.{name}"
+
+    def list_indexes(self):
+        return []
+
+    def create_index(self, keys, **options):
+        return options.get('name')
+
+
+class _FakeDatabase:
+    def __init__(self, name):
+        self.name = name
+
+    def get_collection(self, name):
+        return _FakeCollection(self.name, name)
+
+
+class _FakeMongoClient(_FakeClient):
+    def get_database(self, name):
+        return _FakeDatabase(name)
+
+
+def _make_service(store=None, local_ttl=None):
+    """真实的 DatabaseService，只替换创建 MongoClient 的部分；store 用于模拟多个 worker 共享令牌存储"""
+    service = DatabaseService()
+    service._create_client = lambda uri: ClientEntry(_FakeMongoClient(), _FakeHealth(), PoolStats())
+    service.clients.factory = service._create_client
+    if store is not None:
+        service.connection_tokens = store
+    if local_ttl is not None:
+        service._local_tokens = TokenRegistry(local_ttl)
+    return service
+
+
+def _refs(service, uri):
+    entry = service.clients.peek(uri)
+    return entry.refs if entry else 0
+
+
+def _make_registries(ttl=3600):
+    tokens = TokenRegistry(ttl)
+    clients = ClientRegistry(
+        lambda uri: ClientEntry(_FakeClient(), _FakeHealth(), PoolStats()),
+        max_clients=len(CLUSTERS),
+        idle_timeout=3600
+    )
+    return tokens, clients
+
+
+def test_concurrent_connect_use_revoke():
+    """多线程同时建立、使用、撤销令牌后，引用计数与存活令牌一致"""
+    print("🔨 并发建立/使用/撤销令牌...")
+    tokens, clients = _make_registries()
+    errors = []
+    counter = iter(range(10 ** 9))
+    counter_lock = threading.Lock()
+
+    def worker():
+        owned = []
+        try:
+            for _ in range(OPERATIONS):
+                action = random.random()
+                if action < 0.4 or not owned:
+                    uri = random.choice(CLUSTERS)
+                    with counter_lock:
+                        token = "t%d" % next(counter)
+                    clients.acquire(uri)
+                    tokens.add(token, {'cluster_uri': uri})
+                    owned.append(token)
+                elif action < 0.8:
+                    token = random.choice(owned)
+                    assert tokens.get(token) is not None
+                else:
+                    token = owned.pop(random.randrange(len(owned)))
+                    info = tokens.remove(token)
+                    assert info is not None
+                    clients.release(info['cluster_uri'])
+                tokens.pop_expired()
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=worker) for _ in range(THREADS)]
+    start = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - start
+
+    assert not errors, errors
+    live = Counter(info['cluster_uri'] for info in tokens._tokens.values())
+    for uri in CLUSTERS:
+        entry = clients.peek(uri)
+        refs = entry.refs if entry else 0
+        assert refs == live[uri], (uri, refs, live[uri])
+    print(f"✅ {THREADS * OPERATIONS} 次操作耗时 {elapsed:.2f}s，存活令牌 {len(tokens)}")
+
+
+def test_double_revoke_releases_once():
+    """同一令牌被多个线程同时撤销时只释放一次"""
+    print("🔨 并发重复撤销...")
+    tokens, clients = _make_registries()
+    uri = CLUSTERS[0]
+    for i in range(200):
+        clients.acquire(uri)
+        tokens.add("t%d" % i, {'cluster_uri': uri})
+
+    def revoke_all():
+        for i in range(200):
+            info = tokens.remove("t%d" % i)
+            if info is not None:
+                clients.release(info['cluster_uri'])
+
+    threads = [threading.Thread(target=revoke_all) for _ in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    assert len(tokens) == 0
+    assert clients.peek(uri).refs == 0
+    print("✅ 引用计数归零")
+
+
+def test_sliding_expiry():
+    """使用中的令牌会顺延，闲置的令牌按堆顺序过期"""
+    print("⏱️ 测试滑动过期...")
+    tokens = TokenRegistry(ttl=0.2)
+    tokens.add("active", {})
+    tokens.add("idle", {})
+    for _ in range(4):
+        time.sleep(0.1)
+        assert tokens.get("active") is not None
+    expired = [token for token, _ in tokens.pop_expired()]
+    assert expired == ["idle"]
+    assert "active" in tokens
+    assert len(tokens._heap) == 1
+    print("✅ 滑动过期正常")
+
+
+def test_token_store_interface():
+    """TokenStore 是抽象基类，缺少方法的实现不能实例化"""
+    print("🧩 测试令牌存储接口...")
+
+    class _Partial(TokenStore):
+        def add(self, token, info):
+            pass
+
+        def get(self, token, touch=True):
+            return None
+
+    try:
+        _Partial()
+    except TypeError as e:
+        assert 'pop_expired' in str(e) and 'remove' in str(e), e
+    else:
+        raise AssertionError("缺少 remove/pop_expired 的 TokenStore 不应能实例化")
+    store = MemoryTokenStore(ttl=60)
+    store.add("t", {"n": 1})
+    assert isinstance(store, TokenStore) and store.get("t")["n"] == 1
+    print("✅ 令牌存储接口正常")
+
+
+def test_service_create_use_revoke():
+    """DatabaseService 建立、使用、撤销令牌时客户端引用计数正确"""
+    print("🔨 DatabaseService 建立/撤销令牌...")
+    service = _make_service()
+    try:
+        token, info = service.create_connection_token("mongodb://cluster-0/capture", "c")
+        assert info['cluster_uri'] == CLUSTERS[0]
+        db, collection = service.get_connection_by_token(token)
+        assert collection.full_name == "capture.c"
+        assert _refs(service, CLUSTERS[0]) == 1
+
+        assert service.revoke_connection_token(token)
+        assert not service.revoke_connection_token(token)
+        assert service.get_connection_by_token(token) is None
+        assert _refs(service, CLUSTERS[0]) == 0
+    finally:
+        service.close()
+    print("✅ 引用计数归零")
+
+
+def test_service_materializes_shared_token():
+    """其他 worker 建立的令牌按需在本进程重建连接，撤销后释放本进程的引用"""
+    print("🔨 跨 worker 使用令牌...")
+    creator = _make_service()
+    other = _make_service(store=creator.connection_tokens)
+    try:
+        token, _ = creator.create_connection_token("mongodb://cluster-1/capture", "c")
+        assert _refs(other, CLUSTERS[1]) == 0
+
+        # 多个线程同时第一次使用同一令牌，只重建一次
+        threads = [threading.Thread(target=other.get_connection_by_token, args=(token,)) for _ in range(8)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        assert other._local_tokens.get(token) is not None
+        assert _refs(other, CLUSTERS[1]) == 1
+
+        assert creator.revoke_connection_token(token)
+        assert other.get_connection_by_token(token) is None
+        assert _refs(other, CLUSTERS[1]) == 0
+        assert _refs(creator, CLUSTERS[1]) == 0
+    finally:
+        other.close()
+        creator.close()
+    print("✅ 重建和释放正常")
+
+
+def test_service_local_expiry_keeps_token():
+    """本进程闲置的令牌只释放客户端引用，令牌仍然有效，再次使用时重建"""
+    print("⏱️ 测试本进程引用过期...")
+    creator = _make_service()
+    other = _make_service(store=creator.connection_tokens, local_ttl=0.1)
+    try:
+        token, _ = creator.create_connection_token("mongodb://cluster-2/capture", "c")
+        assert other.get_connection_by_token(token) is not None
+        time.sleep(0.2)
+        other._cleanup_expired_tokens()
+        assert _refs(other, CLUSTERS[2]) == 0
+
+        assert other.get_connection_by_token(token) is not None
+        assert _refs(other, CLUSTERS[2]) == 1
+    finally:
+        other.close()
+        creator.close()
+    print("✅ 令牌保留，引用按需重建")
+
+
+def test_service_concurrent_connect_revoke():
+    """多线程通过 DatabaseService 建立、使用、撤销令牌后，引用计数与存活令牌一致"""
+    print("🔨 DatabaseService 并发建立/使用/撤销...")
+    service = _make_service()
+    errors = []
+    live = Counter()
+    live_lock = threading.Lock()
+
+    def worker():
+        owned = []
+        try:
+            for _ in range(OPERATIONS // 10):
+                action = random.random()
+                if action < 0.4 or not owned:
+                    uri = random.choice(CLUSTERS)
+                    token, _ = service.create_connection_token(uri + "capture", "c")
+                    owned.append((token, uri))
+                elif action < 0.8:
+                    token, _ = random.choice(owned)
+                    assert service.get_connection_by_token(token) is not None
+                else:
+                    token, _ = owned.pop(random.randrange(len(owned)))
+                    assert service.revoke_connection_token(token)
+            with live_lock:
+                live.update(uri for _, uri in owned)
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=worker) for _ in range(THREADS // 4)]
+    try:
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        assert not errors, errors
+        for uri in CLUSTERS:
+            assert _refs(service, uri) == live[uri], (uri, _refs(service, uri), live[uri])
+    finally:
+        service.close()
+    print(f"✅ 存活令牌 {sum(live.values())}")
+
+
+def main():
+    """主测试函数"""
+    print("🚀 开始令牌注册表压力测试...")
+    print("=" * 50)
+    test_sliding_expiry()
+    test_token_store_interface()
+    test_double_revoke_releases_once()
+    test_concurrent_connect_use_revoke()
+    test_service_create_use_revoke()
+    test_service_materializes_shared_token()
+    test_service_local_expiry_keeps_token()
+    test_service_concurrent_connect_revoke()
+    print("✅ 所有测试完成！")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,192 @@
+#!/usr/bin/env python3
+"""
+写后缓冲测试
+不需要 MongoDB，可直接运行或通过 pytest 执行
+"""
+
+import threading
+
+from bson import ObjectId
+
+from write_buffer import WriteBuffer
+
+# 足够长，测试中只有批次满或 close() 才会触发写入
+NEVER = 3600
+
+
+class _Recorder:
+    """记录每次 flush 的参数，errors 返回指定序号的异常，raises 让整批失败"""
+
+    def __init__(self, errors=None, raises=None):
+        self.errors = errors or {}
+        self.raises = raises
+        self.batches = []
+        self.lock = threading.Lock()
+
+    def __call__(self, targets, documents):
+        with self.lock:
+            self.batches.append((list(targets), list(documents)))
+        if self.raises is not None:
+            raise self.raises
+        return {index: e for index, e in self.errors.items() if index < len(documents)}
+
+
+def _doc(n):
+    return {'_id': ObjectId(), 'n': n}
+
+
+def test_batches_by_size_and_close():
+    """每个集合按 batch_size 合并写入，close() 写完剩余内容"""
+    print("🔨 按批次大小写入...")
+    recorder = _Recorder()
+    buffer = WriteBuffer(recorder, max_size=100, batch_size=2, flush_interval=NEVER)
+    docs = [_doc(i) for i in range(5)]
+    futures = [buffer.submit('a', {'collection': 'a'}, doc) for doc in docs]
+    other = buffer.submit('b', {'collection': 'b'}, _doc(99))
+    buffer.close()
+
+    assert [f.result(timeout=5) for f in futures] == [str(doc['_id']) for doc in docs]
+    assert other.result(timeout=5)
+    a_batches = [documents for targets, documents in recorder.batches if targets[0]['collection'] == 'a']
+    assert [len(documents) for documents in a_batches] == [2, 2, 1], a_batches
+    assert [doc['n'] for documents in a_batches for doc in documents] == [0, 1, 2, 3, 4]
+    # 不同集合不会合并到同一批次
+    for targets, _ in recorder.batches:
+        assert len({t['collection'] for t in targets}) == 1
+    stats = buffer.stats()
+    assert stats['submitted'] == 6 and stats['written'] == 6 and stats['depth'] == 0
+    assert stats['batches'] == 4 and stats['failed'] == 0 and stats['lost'] == 0
+    print("✅ 通过")
+
+
+def test_flush_interval():
+    """未满一批的内容在 flush_interval 后写入"""
+    print("🔨 按等待时间写入...")
+    recorder = _Recorder()
+    buffer = WriteBuffer(recorder, max_size=100, batch_size=100, flush_interval=0.05)
+    try:
+        doc = _doc(1)
+        assert buffer.submit('a', {}, doc).result(timeout=5) == str(doc['_id'])
+        assert len(recorder.batches) == 1
+    finally:
+        buffer.close()
+    print("✅ 通过")
+
+
+def test_string_id_preserved():
+    """flush 把 _id 换成字符串时原样返回"""
+    print("🔨 保留 flush 设置的 _id...")
+
+    def flush(targets, documents):
+        for document in documents:
+            document['_id'] = 'existing-id'
+        return {}
+
+    buffer = WriteBuffer(flush, max_size=100, batch_size=1, flush_interval=NEVER)
+    try:
+        assert buffer.submit('a', {}, _doc(1)).result(timeout=5) == 'existing-id'
+    finally:
+        buffer.close()
+    print("✅ 通过")
+
+
+def test_failures_and_lost():
+    """单条失败只影响该条的 Future，不等待结果的失败计入 lost"""
+    print("🔨 写入失败和丢失统计...")
+    error = RuntimeError("写入失败")
+    recorder = _Recorder(errors={1: error, 2: error})
+    buffer = WriteBuffer(recorder, max_size=100, batch_size=3, flush_interval=NEVER)
+    waited = buffer.submit('a', {}, _doc(0))
+    failed_waited = buffer.submit('a', {}, _doc(1))
+    failed_unwaited = buffer.submit('a', {}, _doc(2), wait=False)
+    buffer.close()
+
+    assert waited.result(timeout=5)
+    assert failed_waited.exception(timeout=5) is error
+    assert failed_unwaited.exception(timeout=5) is error
+    stats = buffer.stats()
+    assert stats['written'] == 1 and stats['failed'] == 2 and stats['lost'] == 1, stats
+    print("✅ 通过")
+
+
+def test_whole_batch_failure():
+    """flush 抛出异常时整批失败"""
+    print("🔨 整批失败...")
+    error = ConnectionError("连接断开")
+    buffer = WriteBuffer(_Recorder(raises=error), max_size=100, batch_size=10, flush_interval=NEVER)
+    futures = [buffer.submit('a', {}, _doc(i), wait=i % 2 == 0) for i in range(4)]
+    buffer.close()
+
+    assert all(f.exception(timeout=5) is error for f in futures)
+    stats = buffer.stats()
+    assert stats['written'] == 0 and stats['failed'] == 4 and stats['lost'] == 2, stats
+    print("✅ 通过")
+
+
+def test_full_and_closed():
+    """队列已满、已关闭或未启用时 submit 返回 None，由调用方直接写入"""
+    print("🔨 队列已满和已关闭...")
+    recorder = _Recorder()
+    buffer = WriteBuffer(recorder, max_size=2, batch_size=10, flush_interval=NEVER)
+    assert buffer.submit('a', {}, _doc(0)) is not None
+    assert buffer.submit('b', {}, _doc(1)) is not None
+    assert buffer.submit('a', {}, _doc(2)) is None
+    assert buffer.stats()['rejected'] == 1 and buffer.stats()['depth'] == 2
+    buffer.close()
+    assert not buffer.enabled
+    assert buffer.submit('a', {}, _doc(3)) is None
+    assert buffer.stats()['written'] == 2
+    assert sum(len(documents) for _, documents in recorder.batches) == 2
+
+    disabled = WriteBuffer(recorder, max_size=0, batch_size=10, flush_interval=NEVER)
+    assert not disabled.enabled
+    assert disabled.submit('a', {}, _doc(4)) is None
+    disabled.close()
+    print("✅ 通过")
+
+
+def test_concurrent_submit():
+    """多线程提交时每条内容恰好写入一次"""
+    print("🔨 并发提交...")
+    recorder = _Recorder()
+    buffer = WriteBuffer(recorder, max_size=100000, batch_size=16, flush_interval=0.01)
+    futures = []
+    lock = threading.Lock()
+
+    def worker(worker_id):
+        for i in range(500):
+            future = buffer.submit('k%d' % (i % 3), {}, {'_id': f'{worker_id}-{i}'})
+            with lock:
+                futures.append(future)
+
+    threads = [threading.Thread(target=worker, args=(w,)) for w in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    buffer.close()
+
+    assert all(f is not None for f in futures)
+    written = [doc['_id'] for _, documents in recorder.batches for doc in documents]
+    assert len(written) == len(set(written)) == 8 * 500
+    assert all(len(documents) <= 16 for _, documents in recorder.batches)
+    assert buffer.stats()['written'] == 8 * 500 and buffer.stats()['depth'] == 0
+    print("✅ 通过")
+
+
+def main():
+    """主测试函数"""
+    print("🚀 开始写后缓冲测试...")
+    print("=" * 50)
+    test_batches_by_size_and_close()
+    test_flush_interval()
+    test_string_id_preserved()
+    test_failures_and_lost()
+    test_whole_batch_failure()
+    test_full_and_closed()
+    test_concurrent_submit()
+    print("✅ 所有测试完成！")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,74 @@
+import heapq
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+
+
+class TokenRegistry:
+    """线程安全的连接令牌表
+
+    令牌按滑动过期管理：每次使用都会顺延过期时间。过期时间保存在最小堆中，
+    清理时只弹出已到期的堆顶，代价与过期令牌数成正比，而不是扫描全部令牌。
+    顺延不会向堆中追加新条目，堆顶到期时再按实际过期时间重新入堆，
+    因此堆的大小始终与令牌数相同。
+    """
+
+    def __init__(self, ttl: int):
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._tokens: Dict[str, Dict] = {}
+        self._heap: List[Tuple[float, str]] = []
+
+    def __len__(self):
+        return len(self._tokens)
+
+    def __contains__(self, token: str):
+        return token in self._tokens
+
+    def add(self, token: str, info: Dict):
+        with self._lock:
+            info['expires_at'] = time.time() + self.ttl
+            self._tokens[token] = info
+            heapq.heappush(self._heap, (info['expires_at'], token))
+
+    def get(self, token: str, touch: bool = True) -> Optional[Dict]:
+        """获取未过期的令牌信息，touch 为 True 时顺延过期时间"""
+        with self._lock:
+            info = self._tokens.get(token)
+            if info is None:
+                return None
+            now = time.time()
+            if info['expires_at'] <= now:
+                return None
+            if touch:
+                info['expires_at'] = now + self.ttl
+            return info
+
+    def remove(self, token: str) -> Optional[Dict]:
+        """移除令牌，只有真正移除的调用方会拿到令牌信息"""
+        with self._lock:
+            return self._tokens.pop(token, None)
+
+    def pop_expired(self) -> List[Tuple[str, Dict]]:
+        """弹出所有已过期的令牌"""
+        expired = []
+        with self._lock:
+            now = time.time()
+            while self._heap and self._heap[0][0] <= now:
+                _, token = heapq.heappop(self._heap)
+                info = self._tokens.get(token)
+                if info is None:
+                    # 已被撤销，惰性删除
+                    continue
+                if info['expires_at'] > now:
+                    # 使用中被顺延过，按新的过期时间重新入堆
+                    heapq.heappush(self._heap, (info['expires_at'], token))
+                    continue
+                del self._tokens[token]
+                expired.append((token, info))
+
+            # 大量撤销后堆中会留下失效条目，超过令牌数两倍时重建
+            if len(self._heap) > 2 * len(self._tokens) + 64:
+                self._heap = [(info['expires_at'], token) for token, info in self._tokens.items()]
+                heapq.heapify(self._heap)
+        return expired
@@ -0,0 +1,205 @@
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from abc import ABC, abstractmethod
+from typing import Dict, List, Optional, Tuple
+
+from token_registry import TokenRegistry
+
+try:
+    import redis
+except ImportError:  # 可选依赖
+    redis = None
+
+logger = logging.getLogger(__name__)
+
+
+class TokenStore(ABC):
+    """连接令牌存储接口
+
+    令牌信息必须可以 JSON 序列化。共享后端让多个 worker/实例看到同一组令牌，
+    各进程再根据令牌信息按需重建自己的数据库连接。
+    """
+
+    @abstractmethod
+    def add(self, token: str, info: Dict):
+        """保存令牌信息"""
+
+    @abstractmethod
+    def get(self, token: str, touch: bool = True) -> Optional[Dict]:
+        """获取未过期的令牌信息，touch 为 True 时顺延过期时间"""
+
+    @abstractmethod
+    def remove(self, token: str) -> Optional[Dict]:
+        """移除令牌，只有真正移除的调用方会拿到令牌信息"""
+
+    @abstractmethod
+    def pop_expired(self) -> List[Tuple[str, Dict]]:
+        """弹出已过期的令牌（由后端自动过期的实现返回空列表）"""
+
+
+class MemoryTokenStore(TokenRegistry, TokenStore):
+    """进程内令牌存储，只适用于单进程部署"""
+
+
+def _prepare_private_file(path: str):
+    """令牌信息中含有完整的连接字符串（包括密码），文件只允许当前用户读写
+
+    目录不存在时以 0700 创建；文件以 0600 创建，已有文件收紧为 0600。
+    SQLite 的 -wal/-shm 文件沿用数据库文件的权限。目录或文件属于其他用户时拒绝使用，
+    避免在共享的临时目录中使用他人预先创建的文件。
+    """
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, mode=0o700, exist_ok=True)
+    fd = os.open(path, os.O_RDWR | os.O_CREAT | getattr(os, 'O_NOFOLLOW', 0), 0o600)
+    try:
+        if not hasattr(os, 'getuid'):
+            return
+        uid = os.getuid()
+        if os.fstat(fd).st_uid != uid or os.stat(directory).st_uid not in (uid, 0):
+            raise RuntimeError(f"令牌存储 {path} 属于其他用户，请通过 TOKEN_STORE_PATH 指定其他位置")
+        os.fchmod(fd, 0o600)
+    finally:
+        os.close(fd)
+
+
+class SQLiteTokenStore(TokenStore):
+    """基于 SQLite 文件的令牌存储，同一主机上的多个 worker 可共享
+
+    为减少写锁竞争，顺延过期时间最多每 touch_interval 秒写一次。
+    """
+
+    def __init__(self, path: str, ttl: int, touch_interval: int = 60):
+        _prepare_private_file(path)
+        self.path = path
+        self.ttl = ttl
+        self.touch_interval = min(touch_interval, ttl / 2)
+        self._local = threading.local()
+        with self._conn() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS tokens ("
+                "token TEXT PRIMARY KEY, info TEXT NOT NULL, expires_at REAL NOT NULL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS tokens_expires_at ON tokens (expires_at)")
+
+    def _conn(self) -> sqlite3.Connection:
+        # sqlite3 连接不能跨线程共享，每个线程一个
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=10, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def __len__(self):
+        row = self._conn().execute(
+            "SELECT COUNT(*) FROM tokens WHERE expires_at > ?", (time.time(),)
+        ).fetchone()
+        return row[0]
+
+    def __contains__(self, token: str):
+        return self.get(token, touch=False) is not None
+
+    def add(self, token: str, info: Dict):
+        self._conn().execute(
+            "INSERT OR REPLACE INTO tokens (token, info, expires_at) VALUES (?, ?, ?)",
+            (token, json.dumps(info), time.time() + self.ttl)
+        )
+
+    def get(self, token: str, touch: bool = True) -> Optional[Dict]:
+        conn = self._conn()
+        now = time.time()
+        row = conn.execute(
+            "SELECT info, expires_at FROM tokens WHERE token = ?", (token,)
+        ).fetchone()
+        if row is None or row[1] <= now:
+            return None
+        if touch and row[1] - now < self.ttl - self.touch_interval:
+            conn.execute(
+                "UPDATE tokens SET expires_at = ? WHERE token = ?", (now + self.ttl, token)
+            )
+        return json.loads(row[0])
+
+    def remove(self, token: str) -> Optional[Dict]:
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute("SELECT info FROM tokens WHERE token = ?", (token,)).fetchone()
+            if row is not None:
+                conn.execute("DELETE FROM tokens WHERE token = ?", (token,))
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return json.loads(row[0]) if row else None
+
+    def pop_expired(self) -> List[Tuple[str, Dict]]:
+        conn = self._conn()
+        now = time.time()
+        # 先用索引做只读检查，没有过期令牌时不获取写锁
+        if conn.execute("SELECT 1 FROM tokens WHERE expires_at <= ? LIMIT 1", (now,)).fetchone() is None:
+            return []
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            rows = conn.execute(
+                "SELECT token, info FROM tokens WHERE expires_at <= ?", (now,)
+            ).fetchall()
+            conn.execute("DELETE FROM tokens WHERE expires_at <= ?", (now,))
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return [(token, json.loads(info)) for token, info in rows]
+
+
+class RedisTokenStore(TokenStore):
+    """基于 Redis（或兼容服务）的令牌存储，可跨主机共享，过期由 Redis 负责"""
+
+    def __init__(self, url: str, ttl: int, prefix: str = 'capture:token:'):
+        if redis is None:
+            raise RuntimeError("使用 Redis 令牌存储需要安装 redis")
+        self.client = redis.Redis.from_url(url)
+        self.ttl = ttl
+        self.prefix = prefix
+
+    def _key(self, token: str) -> str:
+        return self.prefix + token
+
+    def __contains__(self, token: str):
+        return bool(self.client.exists(self._key(token)))
+
+    def add(self, token: str, info: Dict):
+        self.client.set(self._key(token), json.dumps(info), ex=self.ttl)
+
+    def get(self, token: str, touch: bool = True) -> Optional[Dict]:
+        key = self._key(token)
+        if touch:
+            # 读取和顺延在一次往返中完成
+            value, _ = self.client.pipeline().get(key).expire(key, self.ttl).execute()
+        else:
+            value = self.client.get(key)
+        return json.loads(value) if value is not None else None
+
+    def remove(self, token: str) -> Optional[Dict]:
+        key = self._key(token)
+        value, _ = self.client.pipeline(transaction=True).get(key).delete(key).execute()
+        return json.loads(value) if value is not None else None
+
+    def pop_expired(self) -> List[Tuple[str, Dict]]:
+        return []
+
+
+def create_token_store(config, ttl: int) -> TokenStore:
+    """根据配置创建令牌存储"""
+    backend = config.TOKEN_STORE
+    if backend == 'sqlite':
+        logger.info(f"使用 SQLite 令牌存储: {config.TOKEN_STORE_PATH}")
+        return SQLiteTokenStore(config.TOKEN_STORE_PATH, ttl)
+    if backend == 'redis':
+        logger.info("使用 Redis 令牌存储")
+        return RedisTokenStore(config.TOKEN_STORE_URL, ttl)
+    return MemoryTokenStore(ttl)
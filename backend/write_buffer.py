@@ -0,0 +1,192 @@
+import atexit
+import logging
+import threading
+import time
+from concurrent.futures import Future
+from typing import Callable, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class QueuedId(str):
+    """已进入写后缓冲、尚未写入的内容的 _id"""
+
+
+class _Pending:
+    __slots__ = ('target', 'document', 'wait', 'future', 'queued_at')
+
+    def __init__(self, target: Dict, document: Dict, wait: bool):
+        self.target = target
+        self.document = document
+        self.wait = wait
+        self.future: Future = Future()
+        self.queued_at = time.monotonic()
+
+
+class WriteBuffer:
+    """写后缓冲：单条写入先进入有界的进程内队列，由后台线程按集合合并为 insert_many
+
+    某个集合积累到 batch_size 条，或其中最早的一条等待超过 flush_interval 秒时写入。
+    flush(targets, documents) 在后台线程中调用，targets 为入队时解析好的写入目标，
+    返回写入失败的文档序号及异常；抛出异常表示整批失败。
+    队列已满或已关闭时 submit 返回 None，由调用方直接写入。
+    不等待结果（wait=False）的文档写入失败时记录日志并计入 lost。
+    close() 停止接收新写入并等待队列中已有的内容全部写入。
+    """
+
+    def __init__(self, flush: Callable[[List[Dict], List[Dict]], Dict[int, Exception]],
+                 max_size: int, batch_size: int, flush_interval: float):
+        self._flush = flush
+        self.max_size = max_size
+        self.batch_size = max(batch_size, 1)
+        self.flush_interval = flush_interval
+        self._cond = threading.Condition()
+        # collection_key -> 按入队顺序排列的待写入文档
+        self._queues: Dict[str, List[_Pending]] = {}
+        self._depth = 0
+        self._closed = False
+        self._thread: Optional[threading.Thread] = None
+        self._submitted = 0
+        self._written = 0
+        self._failed = 0
+        self._lost = 0
+        self._rejected = 0
+        self._batches = 0
+        self._flush_seconds = 0.0
+        self._max_flush_seconds = 0.0
+        self._wait_seconds = 0.0
+        self._max_wait_seconds = 0.0
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_size > 0 and not self._closed
+
+    def submit(self, key: str, target: Dict, document: Dict, wait: bool = True) -> Optional[Future]:
+        """将文档加入集合 key 的队列，返回写入完成时得到 _id 字符串的 Future
+
+        同一 key 的 target 应指向同一集合；wait 为 False 表示调用方不会读取 Future。
+        """
+        with self._cond:
+            if not self.enabled:
+                return None
+            if self._depth >= self.max_size:
+                self._rejected += 1
+                return None
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='write-buffer', daemon=True)
+                self._thread.start()
+                # gunicorn 等 worker 正常退出时也写完队列
+                atexit.register(self.close)
+            pending = _Pending(target, document, wait)
+            queue = self._queues.setdefault(key, [])
+            queue.append(pending)
+            self._depth += 1
+            self._submitted += 1
+            if len(queue) == 1 or len(queue) >= self.batch_size:
+                self._cond.notify()
+            return pending.future
+
+    def _take_ready(self, now: float) -> List[List[_Pending]]:
+        """取出已满或已到期的批次，关闭后取出全部"""
+        batches = []
+        for key in list(self._queues):
+            queue = self._queues[key]
+            while queue and (self._closed or len(queue) >= self.batch_size
+                             or now - queue[0].queued_at >= self.flush_interval):
+                batches.append(queue[:self.batch_size])
+                del queue[:self.batch_size]
+            if not queue:
+                del self._queues[key]
+        self._depth -= sum(len(batch) for batch in batches)
+        return batches
+
+    def _next_timeout(self, now: float) -> Optional[float]:
+        if not self._queues:
+            return None
+        oldest = min(queue[0].queued_at for queue in self._queues.values())
+        return max(oldest + self.flush_interval - now, 0)
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while True:
+                    now = time.monotonic()
+                    batches = self._take_ready(now)
+                    if batches or (self._closed and not self._depth):
+                        break
+                    self._cond.wait(self._next_timeout(now))
+            for batch in batches:
+                self._write(batch)
+            if not batches:
+                return
+
+    def _write(self, batch: List[_Pending]):
+        start = time.monotonic()
+        try:
+            errors = self._flush([p.target for p in batch], [p.document for p in batch])
+        except Exception as e:
+            logger.error(f"写入队列中的 {len(batch)} 条内容失败: {e}")
+            errors = {index: e for index in range(len(batch))}
+        end = time.monotonic()
+
+        lost = 0
+        for index, pending in enumerate(batch):
+            if index in errors:
+                pending.future.set_exception(errors[index])
+                if not pending.wait:
+                    # 请求已返回 202，没有人会读取 Future
+                    lost += 1
+                    logger.warning(f"已确认入队的内容 {pending.document.get('_id')} 写入失败: {errors[index]}")
+            else:
+                # flush 可能把 _id 换成字符串（例如合并到已有文档时），保留其类型
+                doc_id = pending.document['_id']
+                pending.future.set_result(doc_id if isinstance(doc_id, str) else str(doc_id))
+
+        with self._cond:
+            self._batches += 1
+            self._failed += len(errors)
+            self._lost += lost
+            self._written += len(batch) - len(errors)
+            self._flush_seconds += end - start
+            self._max_flush_seconds = max(self._max_flush_seconds, end - start)
+            for pending in batch:
+                self._wait_seconds += end - pending.queued_at
+            self._max_wait_seconds = max(self._max_wait_seconds, end - batch[0].queued_at)
+
+    def close(self, timeout: Optional[float] = None):
+        """停止接收新写入，等待队列清空"""
+        with self._cond:
+            if self._closed:
+                return
+            self._closed = True
+            depth = self._depth
+            thread = self._thread
+            self._cond.notify_all()
+        if thread is not None:
+            thread.join(timeout)
+            logger.info(f"写入队列已清空（关闭时剩余 {depth} 条）")
+
+    def stats(self) -> Dict:
+        with self._cond:
+            now = time.monotonic()
+            oldest = min((queue[0].queued_at for queue in self._queues.values()), default=now)
+            processed = self._written + self._failed
+            return {
+                'enabled': self.max_size > 0,
+                'closed': self._closed,
+                'depth': self._depth,
+                'capacity': self.max_size,
+                'collections': len(self._queues),
+                'oldest_wait_ms': round((now - oldest) * 1000, 1),
+                'submitted': self._submitted,
+                'written': self._written,
+                'failed': self._failed,
+                'lost': self._lost,
+                'rejected': self._rejected,
+                'batches': self._batches,
+                'avg_batch_size': round(processed / self._batches, 1) if self._batches else 0,
+                'avg_flush_ms': round(self._flush_seconds / self._batches * 1000, 2) if self._batches else 0,
+                'max_flush_ms': round(self._max_flush_seconds * 1000, 2),
+                'avg_wait_ms': round(self._wait_seconds / processed * 1000, 2) if processed else 0,
+                'max_wait_ms': round(self._max_wait_seconds * 1000, 2),
+            }
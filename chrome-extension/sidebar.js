@@ -127,7 +127,18 @@ document.addEventListener('DOMContentLoaded', () => {
     styleEl.textContent = `body { font-size: ${size}em !important; }`;
   }
 
-  function showDetail(item) {
+  async function showDetail(item) {
+    // Server lists only carry summary fields, so load the full capture on demand.
+    // Large bodies are kept in GridFS and only returned when asked for with include=html
+    if (storageMode === 'server' && item._id && !item.detailLoaded) {
+      try {
+        const response = await makeApiCall(`/captures/${item._id}?include=html`);
+        Object.assign(item, response.data, { detailLoaded: true });
+      } catch (error) {
+        statusDiv.textContent = `Error: ${error.message}`;
+        return;
+      }
+    }
     const url = item.info ? item.info.url : item.url;
     const html = item.info ? item.info.html : item.html;
 
@@ -305,7 +316,7 @@ document.addEventListener('DOMContentLoaded', () => {
     }
   }
 
-  function exportAll() {
+  async function exportAll() {
     if (storageMode === 'local') {
         chrome.storage.local.get({ contentList: [] }, res => {
             if (res.contentList.length === 0) {
@@ -315,7 +326,17 @@ document.addEventListener('DOMContentLoaded', () => {
             downloadJson(res.contentList, 'local-captures');
         });
     } else {
-        const captures = titleDropdown.filteredList || [];
+        let captures = [];
+        try {
+            // The list only shows the first page, so stream every capture in the selected category
+            const category = categoryDropdown.value;
+            const response = await apiFetch(`/captures/export?view=full&category=${category === '__all__' ? '' : encodeURIComponent(category)}`);
+            const body = await response.text();
+            captures = body.split('\n').filter(line => line.trim()).map(line => JSON.parse(line));
+        } catch (error) {
+            statusDiv.textContent = `Error: ${error.message}`;
+            return;
+        }
         if (captures.length === 0) {
             alert('No server content to export.');
             return;
@@ -337,6 +358,11 @@ document.addEventListener('DOMContentLoaded', () => {
   }
 
   async function makeApiCall(endpoint, method = 'GET', body = null) {
+    const response = await apiFetch(endpoint, method, body);
+    return response.json();
+  }
+
+  async function apiFetch(endpoint, method = 'GET', body = null) {
     if (!apiToken) throw new Error('Not connected to server.');
 
     const options = {
@@ -361,7 +387,7 @@ document.addEventListener('DOMContentLoaded', () => {
         const errorResult = await response.json();
         throw new Error(errorResult.message || 'API request failed');
     }
-    return response.json();
+    return response;
   }
   
   function activateSelector() {